@@ -0,0 +1,218 @@
+# aggregate_store.py
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Collection, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from cache import estimate_size
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# ---- Config -------------------------------------------------------------------
+
+AGGREGATE_STORE_ENABLED = os.getenv("AGGREGATE_STORE_ENABLED", "true").lower() in ("true", "1", "yes")
+# Number of (org, node, day) partials kept in memory; the least recently used day goes first
+AGGREGATE_STORE_MAX_DAYS = int(os.getenv("AGGREGATE_STORE_MAX_DAYS", "2000"))
+# Estimated memory budget (cache.estimate_size) of those partials. Distinct-load states hold
+# every load id (or its hash) of their day, so their size grows with load volume, not days
+AGGREGATE_STORE_MAX_BYTES = int(os.getenv("AGGREGATE_STORE_MAX_BYTES", str(128 * 1024 * 1024)))
+# A UTC day is treated as closed (and cached) once it ended this many seconds ago, which leaves
+# room for runs that are written late
+AGGREGATE_STORE_SETTLE_SECONDS = float(os.getenv("AGGREGATE_STORE_SETTLE_SECONDS", "3600"))
+
+# (dimension, value, runs, rows, unique_loads) rows, as returned by all_stats_fused_query;
+# by-day rows may also carry the session_day they count (see merge_partials)
+PartialRows = List[Dict[str, Any]]
+COUNT_COLUMNS = ("runs", "rows", "unique_loads")
+
+
+# ---- Day planning -------------------------------------------------------------
+
+@dataclass(frozen=True)
+class DaySegment:
+    """The part of one UTC day that a requested range covers."""
+    day: date
+    start: datetime
+    end: datetime
+    cacheable: bool  # covers the whole day and the day is closed
+
+
+def plan_days(start: datetime, end: datetime, now: datetime, settle_seconds: float = AGGREGATE_STORE_SETTLE_SECONDS) -> List[DaySegment]:
+    """Split [start, end) at UTC midnights into per-day segments."""
+    segments = []
+    day_start = datetime.combine(start.date(), datetime.min.time())
+    closed_before = now - timedelta(seconds=settle_seconds)
+    while day_start < end:
+        day_end = day_start + timedelta(days=1)
+        seg_start, seg_end = max(start, day_start), min(end, day_end)
+        if seg_start < seg_end:
+            whole_day = seg_start == day_start and seg_end == day_end
+            segments.append(DaySegment(
+                day=day_start.date(),
+                start=seg_start,
+                end=seg_end,
+                cacheable=whole_day and day_end <= closed_before,
+            ))
+        day_start = day_end
+    return segments
+
+
+def contiguous_ranges(segments: Iterable[DaySegment]) -> List[Tuple[datetime, datetime]]:
+    """Collapse adjacent segments into as few [start, end) ranges as possible."""
+    ranges: List[Tuple[datetime, datetime]] = []
+    for seg in sorted(segments, key=lambda s: s.start):
+        if ranges and ranges[-1][1] == seg.start:
+            ranges[-1] = (ranges[-1][0], seg.end)
+        else:
+            ranges.append((seg.start, seg.end))
+    return ranges
+
+
+def merge_partials(partials: Iterable[PartialRows], days: Optional[Collection[date]] = None) -> PartialRows:
+    """
+    Sum per-day partial rows by (dimension, value). With `days`, rows whose session_day is
+    not one of them are left out: a run's sessions may fall on days outside the range.
+    """
+    merged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for rows in partials:
+        for r in rows:
+            if days is not None and r.get("session_day") is not None and r["session_day"] not in days:
+                continue
+            key = (str(r.get("dimension")), str(r.get("value")))
+            acc = merged.get(key)
+            if acc is None:
+                acc = merged[key] = {"dimension": key[0], "value": key[1], **{c: 0 for c in COUNT_COLUMNS}}
+            for column in COUNT_COLUMNS:
+                acc[column] += int(r.get(column) or 0)
+    return list(merged.values())
+
+
+# ---- Store --------------------------------------------------------------------
+
+class DayAggregateStore:
+    """
+    In-process store of per-day partial counts (or other mergeable per-day state, such as
+    distinct-load sets), keyed by (org, node, day).
+
+    A requested range is split into UTC days. Closed days that are fully covered come from
+    the store; everything else (missing days, today, partial first/last days) is fetched
+    from ClickHouse in one call and the closed days among them are stored for next time.
+    In steady state a 90-day request only queries the still-open day.
+
+    The store is bounded both by days and by estimated bytes; the least recently used days
+    are evicted first, and a single day larger than the byte budget is not stored at all.
+    """
+
+    def __init__(self, max_days: int = AGGREGATE_STORE_MAX_DAYS, settle_seconds: float = AGGREGATE_STORE_SETTLE_SECONDS,
+                 max_bytes: int = AGGREGATE_STORE_MAX_BYTES):
+        self.max_days = max_days
+        self.max_bytes = max_bytes
+        self.settle_seconds = settle_seconds
+        self._days: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.day_hits = 0
+        self.day_misses = 0
+        self.evictions = 0
+
+    def get(self, org_id: str, node_key: str, day: date) -> Optional[Any]:
+        key = (org_id, node_key, day)
+        with self._lock:
+            rows = self._days.get(key)
+            if rows is not None:
+                self._days.move_to_end(key)
+            return rows
+
+    def put(self, org_id: str, node_key: str, day: date, rows: Any) -> None:
+        key = (org_id, node_key, day)
+        size = estimate_size(rows)
+        if size > self.max_bytes:
+            logger.info("Aggregate store: not keeping %s, %d bytes exceeds the budget", key, size)
+            return
+        with self._lock:
+            if key in self._days:
+                self._remove(key)
+            self._days[key] = rows
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._days) > self.max_days or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._days)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        del self._days[key]
+        self._bytes -= self._sizes.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._days.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def load(
+        self,
+        org_id: str,
+        node_key: str,
+        start: datetime,
+        end: datetime,
+        fetch_days: Callable[[List[DaySegment]], Dict[date, Any]],
+        now: Optional[datetime] = None,
+        merge: Callable[[List[Any]], Any] = merge_partials,
+        empty: Callable[[], Any] = list,
+    ) -> Any:
+        """
+        Merged per-day values for [start, end). `fetch_days(segments)` must return the value of
+        each requested segment keyed by day (days without data may be left out, they become
+        `empty()`) and raise on failure, so that a failed query is never stored as an empty day.
+        Values default to partial rows merged with merge_partials; any mergeable per-day state
+        works with a matching `merge`.
+        """
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        partials: List[Any] = []
+        missing: List[DaySegment] = []
+        for seg in plan_days(start, end, now, self.settle_seconds):
+            rows = self.get(org_id, node_key, seg.day) if seg.cacheable else None
+            if rows is None:
+                missing.append(seg)
+            else:
+                partials.append(rows)
+
+        with self._lock:
+            self.day_hits += len(partials)
+            self.day_misses += len(missing)
+
+        if missing:
+            logger.info("Aggregate store: %d days cached, fetching %d", len(partials), len(missing))
+            fetched = fetch_days(missing)
+            for seg in missing:
+                rows = fetched.get(seg.day)
+                if rows is None:
+                    rows = empty()
+                if seg.cacheable:
+                    self.put(org_id, node_key, seg.day, rows)
+                partials.append(rows)
+        return merge(partials)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "days": len(self._days),
+                "max_days": self.max_days,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "day_hits": self.day_hits,
+                "day_misses": self.day_misses,
+                "evictions": self.evictions,
+            }
+
+
+DAY_AGGREGATE_STORE = DayAggregateStore()
@@ -0,0 +1,50 @@
+"""
+Backfill closed-week /all-stats snapshots (see snapshot_store.py) for historical weeks.
+
+Writes the last --weeks sealed weeks of every --tz that are not in WEEK_SNAPSHOT_DIR yet,
+with one ClickHouse scan per timezone. Existing snapshots are immutable and skipped unless
+--force is given (e.g. after a fix to the underlying data).
+
+Usage:
+    python backfill_snapshots.py --weeks 52
+    python backfill_snapshots.py --weeks 8 --tz America/New_York --tz Europe/Berlin
+    python backfill_snapshots.py --weeks 4 --force
+"""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path=Path(__file__).parent / ".env")
+
+import db  # noqa: E402
+from snapshot_store import WEEK_SNAPSHOT_TIMEZONES, WEEK_SNAPSHOTS  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weeks", type=int, default=52, help="number of most recent sealed weeks to snapshot")
+    parser.add_argument("--tz", action="append", help="timezone to snapshot (repeatable, default: WEEK_SNAPSHOT_TIMEZONES)")
+    parser.add_argument("--force", action="store_true", help="rewrite snapshots that already exist")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    failed = False
+    for tz_name in args.tz or WEEK_SNAPSHOT_TIMEZONES:
+        try:
+            written = db.backfill_week_snapshots(tz_name, args.weeks, force=args.force)
+        except Exception as e:
+            logging.exception("Backfill for %s failed: %s", tz_name, e)
+            failed = True
+            continue
+        print(f"{tz_name}: wrote {len(written)} snapshot(s) to {WEEK_SNAPSHOTS.root}"
+              + (f" ({written[0]} .. {written[-1]})" if written else ""))
+    db.close_client_pool()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
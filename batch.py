@@ -0,0 +1,185 @@
+# batch.py
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache import normalize_date
+from dates import resolve_range
+from db import (
+    AllStats,
+    fetch_all_stats_fused,
+    fetch_all_stats_multi_range,
+    fetch_calls_without_carrier_asked_for_transfer,
+    fetch_duration_carrier_asked_for_transfer,
+    fetch_list_of_unique_loads,
+    fetch_total_calls_and_total_duration,
+)
+from executor import MetricCalls
+from serializers import to_payload
+
+# POST /batch planning. Items are (metric, start_date, end_date); the plan turns them into
+# as few ClickHouse scans as it can:
+#   - /all-stats sections (AllStats fields) of one range come from one fused query
+#   - sections over several ranges close to each other come from one multi-range fused
+#     query grouped by range (db.fetch_all_stats_multi_range)
+#   - other metrics run their own fetch_*, once per distinct (metric, range)
+# The resulting calls are independent and are run in parallel by executor.gather_metrics.
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+# Ranges separated by more than this many days are scanned separately: one scan over the
+# gap would read data no item asked for
+BATCH_MAX_GAP_DAYS = float(os.getenv("BATCH_MAX_GAP_DAYS", "7"))
+# Upper bound on the ranges labelled in one multi-range scan (each row is repeated per range holding it)
+BATCH_MAX_RANGES_PER_SCAN = int(os.getenv("BATCH_MAX_RANGES_PER_SCAN", "16"))
+
+FUSED_METRICS = tuple(f.name for f in fields(AllStats))
+# Metrics outside the fused query -> the fetch_* that computes them
+SEPARATE_FETCHERS: Dict[str, Callable[[Optional[str], Optional[str]], Any]] = {
+    "calls_without_carrier_asked_for_transfer": fetch_calls_without_carrier_asked_for_transfer,
+    "total_calls_and_total_duration": fetch_total_calls_and_total_duration,
+    "duration_carrier_asked_for_transfer": fetch_duration_carrier_asked_for_transfer,
+    "list_of_unique_loads": fetch_list_of_unique_loads,
+}
+BATCH_METRICS = FUSED_METRICS + tuple(SEPARATE_FETCHERS)
+
+Range = Tuple[Optional[str], Optional[str]]
+
+
+@dataclass
+class BatchItem:
+    id: str
+    metric: str
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+
+@dataclass
+class BatchPlan:
+    # call name -> (fetch function, args), for executor.gather_metrics
+    calls: MetricCalls = field(default_factory=dict)
+    # item id -> (call name, function picking the item's value out of the call's result)
+    sources: Dict[str, Tuple[str, Callable[[Any], Any]]] = field(default_factory=dict)
+    # item id -> error found while planning (unknown metric, bad date)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+def range_key(start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, str]:
+    """Ranges with the same key share a result (same normalization as the result cache)."""
+    if not start_date or not end_date:
+        return ("last_30_days", "")
+    return (normalize_date(start_date) or "", normalize_date(end_date) or "")
+
+
+def group_ranges(ranges: List[Tuple[datetime, datetime]]) -> List[List[int]]:
+    """
+    Split ranges (indices into `ranges`) into groups scanned together: sorted by start, a
+    range joins the current group when it starts at most BATCH_MAX_GAP_DAYS after the
+    group's end and the group has room.
+    """
+    order = sorted(range(len(ranges)), key=lambda i: ranges[i])
+    max_gap = timedelta(days=BATCH_MAX_GAP_DAYS)
+    groups: List[List[int]] = []
+    group_end: Optional[datetime] = None
+    for i in order:
+        start, end = ranges[i]
+        if groups and group_end is not None and start - group_end <= max_gap and len(groups[-1]) < BATCH_MAX_RANGES_PER_SCAN:
+            groups[-1].append(i)
+            group_end = max(group_end, end)
+        else:
+            groups.append([i])
+            group_end = end
+    return groups
+
+
+def _section(metric: str, index: Optional[int] = None) -> Callable[[Any], Any]:
+    def pick(result: Any) -> Any:
+        if result is None:
+            raise RuntimeError(f"Error fetching {metric}")
+        stats = result[index] if index is not None else result
+        return getattr(stats, metric)
+    return pick
+
+
+def _whole(metric: str) -> Callable[[Any], Any]:
+    def pick(result: Any) -> Any:
+        if result is None:
+            raise RuntimeError(f"Error fetching {metric}")
+        return result
+    return pick
+
+
+def plan_batch(items: List[BatchItem], now: Optional[datetime] = None) -> BatchPlan:
+    plan = BatchPlan()
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None, second=0, microsecond=0)
+
+    # range key -> (dates as sent, resolved UTC bounds) for the items answered by the fused query
+    fused_ranges: Dict[Tuple[str, str], Tuple[Range, Tuple[datetime, datetime]]] = {}
+    fused_items: List[Tuple[BatchItem, Tuple[str, str]]] = []
+    for item in items:
+        if item.metric not in BATCH_METRICS:
+            plan.errors[item.id] = f"Unknown metric {item.metric!r}"
+            continue
+        try:
+            bounds = resolve_range(item.start_date, item.end_date, now)
+        except ValueError as e:
+            plan.errors[item.id] = f"Invalid date: {e}"
+            continue
+        if bounds[0] >= bounds[1]:
+            plan.errors[item.id] = "start_date must be before end_date"
+            continue
+        key = range_key(item.start_date, item.end_date)
+        if item.metric in SEPARATE_FETCHERS:
+            name = f"{item.metric}@{key[0]}/{key[1]}"
+            plan.calls[name] = (SEPARATE_FETCHERS[item.metric], (item.start_date, item.end_date))
+            plan.sources[item.id] = (name, _whole(item.metric))
+        else:
+            fused_ranges.setdefault(key, ((item.start_date, item.end_date), bounds))
+            fused_items.append((item, key))
+
+    keys = list(fused_ranges)
+    source_of: Dict[Tuple[str, str], Tuple[str, Optional[int]]] = {}
+    for group in group_ranges([fused_ranges[k][1] for k in keys]):
+        if len(group) == 1:
+            key = keys[group[0]]
+            dates = fused_ranges[key][0]
+            name = f"all_stats@{key[0]}/{key[1]}"
+            # Single ranges keep the regular cached (and per-day incremental) fused path
+            plan.calls[name] = (fetch_all_stats_fused, dates)
+            source_of[key] = (name, None)
+            continue
+        # Explicit bounds for every range, including defaulted ones, since they are bound as values
+        ranges = tuple(
+            (fused_ranges[keys[i]][1][0].isoformat(), fused_ranges[keys[i]][1][1].isoformat()) for i in group
+        )
+        name = "all_stats@" + ",".join(f"{keys[i][0]}/{keys[i][1]}" for i in group)
+        plan.calls[name] = (fetch_all_stats_multi_range, (ranges,))
+        for position, i in enumerate(group):
+            source_of[keys[i]] = (name, position)
+
+    for item, key in fused_items:
+        name, index = source_of[key]
+        plan.sources[item.id] = (name, _section(item.metric, index))
+    return plan
+
+
+def collect_batch(items: List[BatchItem], plan: BatchPlan, results: Dict[str, Any], errors: Dict[str, BaseException]) -> Dict[str, Dict[str, Any]]:
+    """Item id -> {"metric", "start_date", "end_date"} plus "value" (as its route serializes it) or "error"."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        entry: Dict[str, Any] = {"metric": item.metric, "start_date": item.start_date, "end_date": item.end_date}
+        if item.id in plan.errors:
+            entry["error"] = plan.errors[item.id]
+        else:
+            name, pick = plan.sources[item.id]
+            try:
+                if name in errors:
+                    raise errors[name]
+                entry["value"] = to_payload(pick(results.get(name)))
+            except Exception as e:
+                entry["error"] = str(e)
+        out[item.id] = entry
+    return out
@@ -0,0 +1,113 @@
+"""
+Per-request memory allocation benchmark, in process, against a fake ClickHouse.
+
+Drives every GET route through the ASGI app (like bench_endpoints.py) with the result
+already cached, and measures with tracemalloc how much memory each request allocates at
+its peak, above what was allocated before it started: the cost of turning cached results
+into response payloads and encoding them. "net" subtracts the same measure for /health,
+i.e. what routing, validation and the middlewares allocate for any request. Bodies
+encoded by earlier requests are not reused (unless --reuse-encoded), since that would
+skip the conversion being measured.
+
+"cached KiB" is the estimated size of the results the route's first request left in the
+result cache (cache.estimate_size), i.e. what the result models cost to keep around.
+
+Usage:
+    python benchmarks/bench_allocations.py
+    python benchmarks/bench_allocations.py --requests 200 --routes /all-stats /call-stage-stats
+    python benchmarks/bench_allocations.py --reuse-encoded       # cache hits as served
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("ORG_ID", "00000000-0000-4000-8000-000000000001")
+
+import db  # noqa: E402
+import fake_clickhouse  # noqa: E402
+import main  # noqa: E402
+from bench_endpoints import asgi_get, discover_routes  # noqa: E402
+from cache import RESULT_CACHE  # noqa: E402
+
+# Routes whose cost is not a cached result's conversion
+SKIPPED_ROUTES = {"/", "/health", "/cache-stats", "/diagnostics/transfer-attempt-values", "/diagnostics/call-stage"}
+
+
+async def measure(path: str, params: Dict[str, str], requests: int) -> Tuple[float, float, float, float]:
+    """
+    (cached KiB, mean peak KiB, max peak KiB, mean µs) per request; the first,
+    cache-filling request is not counted.
+    """
+    RESULT_CACHE.clear()
+    status, _ = await asgi_get(main.app, path, params)
+    if status != 200:
+        raise RuntimeError(f"{path} answered {status}")
+    cached_kib = RESULT_CACHE.stats()["bytes"] / 1024
+    peaks: List[int] = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        await asgi_get(main.app, path, params)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+    elapsed = time.perf_counter() - started
+    return cached_kib, sum(peaks) / len(peaks) / 1024, max(peaks) / 1024, elapsed / requests * 1e6
+
+
+async def run(args) -> None:
+    end = datetime.utcnow().replace(second=0, microsecond=0)
+    dates = {
+        "start_date": (end - timedelta(days=args.days)).strftime("%Y-%m-%dT%H:%M:%S"),
+        "end_date": end.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    tracemalloc.start()
+    _, floor_kib, _, _ = await measure("/health", {}, args.requests)
+    print(f"/health allocates {floor_kib:.1f} KiB per request (subtracted in 'net')")
+    print(f"{'route':<58}{'cached KiB':>11}{'mean KiB':>10}{'net KiB':>10}{'max KiB':>10}{'µs/req':>10}")
+    for path, extra in discover_routes(args.routes):
+        if path in SKIPPED_ROUTES or "format" in extra:
+            continue
+        label = path + (f"?{urlencode(extra)}" if extra else "")
+        cached_kib, mean_kib, max_kib, micros = await measure(path, {**dates, **extra}, args.requests)
+        print(f"{label:<58}{cached_kib:>11.1f}{mean_kib:>10.1f}{mean_kib - floor_kib:>10.2f}{max_kib:>10.1f}{micros:>10.0f}")
+    tracemalloc.stop()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per route")
+    parser.add_argument("--days", type=int, default=30, help="length of the requested range")
+    parser.add_argument("--routes", nargs="+", help="only these route paths")
+    parser.add_argument("--reuse-encoded", action="store_true", help="serve cached encoded bodies as the app does")
+    parser.add_argument("--calls-per-day", type=int, default=2000, help="size of the synthetic result sets")
+    parser.add_argument("--loads", type=int, default=20_000, help="distinct loads in the synthetic result sets")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    recording = fake_clickhouse.synthetic_recording(args.calls_per_day, args.days, args.loads, args.seed)
+    db.get_clickhouse_client = lambda: fake_clickhouse.FakeClickHouseClient(recording)
+    if not args.reuse_encoded:
+        RESULT_CACHE.get_encoded = lambda key, variant: None
+        RESULT_CACHE.set_encoded = lambda key, value, variant, encoded: None
+    db.init_client_pool()
+    try:
+        asyncio.run(run(args))
+    finally:
+        main.shutdown_executor()
+        db.close_client_pool()
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,131 @@
+"""
+Row-dict vs columnar result decoding.
+
+Feeds clickhouse-connect QueryResult objects with Native-style column blocks (no server
+needed) and compares the old path (result_rows -> dict per row -> dataclass via r.get)
+with _query_columns (result_columns -> whole-column conversion -> dataclass). Reports
+throughput and peak allocations (tracemalloc) for a load id list and a 3-column
+breakdown at each row count.
+
+Usage:
+    python benchmarks/bench_columnar.py --rows 10000 1000000
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from clickhouse_connect.driver.query import QueryResult
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+BLOCK_ROWS = 65536
+
+
+class FakeClient:
+    """Returns a fresh QueryResult over pre-built column blocks, like the Native reader."""
+
+    def __init__(self, column_names, columns):
+        self.column_names = tuple(column_names)
+        self.blocks = [
+            [column[i:i + BLOCK_ROWS] for column in columns]
+            for i in range(0, len(columns[0]), BLOCK_ROWS)
+        ]
+
+    def query(self, query, settings=None, column_oriented=False):
+        blocks = self.blocks
+
+        def block_gen():
+            yield from blocks
+        return QueryResult(block_gen=block_gen(), column_names=self.column_names, column_oriented=column_oriented)
+
+
+def row_dicts(client, query):
+    """The pre-columnar _json_each_row: transpose to rows, then one dict per row."""
+    rs = client.query(query)
+    cols = rs.column_names
+    return [{col: row[i] for i, col in enumerate(cols)} for row in rs.result_rows]
+
+
+def load_list_rows(client):
+    rows = row_dicts(client, "")
+    return [str(r.get("custom_load_id")) for r in rows if r.get("custom_load_id")]
+
+
+def load_list_columns(client):
+    result = db._query_columns(client, "")
+    return [str(load_id) for load_id in result.column("custom_load_id") if load_id]
+
+
+def breakdown_rows(client):
+    rows = row_dicts(client, "")
+    return [
+        db.TransferStats(
+            call_stage=str(r.get("call_stage") or "Unknown"),
+            count=int(r.get("count", 0)),
+            percentage=float(r.get("percentage", 0.0)),
+        )
+        for r in rows
+    ]
+
+
+def breakdown_columns(client):
+    result = db._query_columns(client, "")
+    return [
+        db.TransferStats(call_stage=call_stage, count=count, percentage=percentage)
+        for call_stage, count, percentage in zip(
+            db._text_column(result.column("call_stage")),
+            db._int_column(result.column("count")),
+            db._float_column(result.column("percentage")),
+        )
+    ]
+
+
+def measure(fn, client, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn(client)
+        best = min(best, time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    fn(client)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for n in args.rows:
+        load_client = FakeClient(["custom_load_id"], [[f"LD{i:09d}" for i in range(n)]])
+        breakdown_client = FakeClient(
+            ["call_stage", "count", "percentage"],
+            [[f"STAGE_{i % 50}" for i in range(n)], list(range(n)), [i / n for i in range(n)]],
+        )
+        print(f"--- {n:,} rows ---")
+        for name, client, old, new in (
+            ("load list", load_client, load_list_rows, load_list_columns),
+            ("breakdown", breakdown_client, breakdown_rows, breakdown_columns),
+        ):
+            old_time, old_peak = measure(old, client, args.repeat)
+            new_time, new_peak = measure(new, client, args.repeat)
+            print(
+                f"{name:<10} rows+dicts {n / old_time:>12,.0f} rows/s peak {old_peak / 2**20:8.1f} MiB | "
+                f"columnar {n / new_time:>12,.0f} rows/s peak {new_peak / 2**20:8.1f} MiB | "
+                f"{old_time / new_time:4.1f}x faster, {old_peak / max(new_peak, 1):4.1f}x less memory"
+            )
+
+
+if __name__ == "__main__":
+    main_cli()
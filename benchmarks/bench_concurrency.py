@@ -0,0 +1,105 @@
+"""
+Concurrency benchmark for the API routes.
+
+Replaces a fetch_* function with a fake that blocks for a fixed latency (like a slow
+ClickHouse query) and fires N concurrent requests at the route through the ASGI app,
+each for its own range so the result cache and single-flight do not fold them into one
+query. With the executor, N requests should finish in about max(latency) * ceil(N / workers)
+instead of N * latency, and /health should keep answering while they run.
+
+Usage:
+    python benchmarks/bench_concurrency.py --requests 8 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import math
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import executor  # noqa: E402
+import main  # noqa: E402
+from bench_endpoints import asgi_get  # noqa: E402
+from cache import cached_metric  # noqa: E402
+from db import PEPSI_BROKER_NODE_ID, TransferStats  # noqa: E402
+
+
+def make_slow_fetch(latency: float):
+    # Wrapped like the real fetch_* so cached_response finds .cache_key and .uncached
+    @cached_metric("bench_call_stage_stats", PEPSI_BROKER_NODE_ID)
+    def slow_fetch(start_date=None, end_date=None):
+        time.sleep(latency)
+        return [TransferStats(call_stage="BENCH", count=1, percentage=100.0)]
+    return slow_fetch
+
+
+def request_range(i: int):
+    """A distinct one-day range per request."""
+    return f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}Z", "2025-01-02T00:00:00Z"
+
+
+async def timed(coro):
+    started = time.perf_counter()
+    await coro
+    return time.perf_counter() - started
+
+
+async def blocking_route(fetch, start_date=None, end_date=None):
+    """The pre-executor route shape: the blocking fetch runs directly on the event loop."""
+    results = fetch(start_date, end_date)
+    return [{"call_stage": r.call_stage, "count": r.count, "percentage": r.percentage} for r in results]
+
+
+async def executor_route(i: int):
+    """The route as served: through the ASGI app, cached_response and the executor."""
+    start_date, end_date = request_range(i)
+    status, _ = await asgi_get(main.app, "/call-stage-stats", {"start_date": start_date, "end_date": end_date})
+    if status != 200:
+        raise RuntimeError(f"/call-stage-stats answered {status}")
+
+
+async def run_scenario(name: str, route, n: int):
+    started = time.perf_counter()
+
+    async def probe_health():
+        # /health is due 10ms after the requests start; report how late it answers
+        await asyncio.sleep(0.01)
+        await main.health_check()
+        return time.perf_counter() - started - 0.01
+
+    health_task = asyncio.ensure_future(probe_health())
+    latencies = await asyncio.gather(*[timed(route(i)) for i in range(n)])
+    wall = time.perf_counter() - started
+    health_latency = await health_task
+    print(f"{name:<10} wall={wall:7.3f}s  max={max(latencies):7.3f}s  sum={sum(latencies):7.3f}s  /health={health_latency * 1000:8.1f}ms")
+    return wall
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=8, help="number of concurrent requests")
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated query latency in seconds")
+    args = parser.parse_args()
+
+    slow_fetch = make_slow_fetch(args.latency)
+    main.fetch_calls_ending_in_each_call_stage_stats = slow_fetch
+
+    workers = executor.CLICKHOUSE_MAX_CONCURRENCY
+    print(f"{args.requests} concurrent requests, {args.latency}s per query, {workers} executor workers")
+    blocking_wall = asyncio.run(run_scenario("blocking", lambda i: blocking_route(slow_fetch.uncached, *request_range(i)), args.requests))
+    executor_wall = asyncio.run(run_scenario("executor", executor_route, args.requests))
+    executor.shutdown_executor()
+
+    expected = args.latency * math.ceil(args.requests / workers)
+    print(f"speedup={blocking_wall / executor_wall:.1f}x  expected executor wall ~{expected:.3f}s")
+    if executor_wall > expected * 1.5:
+        print("FAIL: concurrent requests are not overlapping")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,221 @@
+"""
+Endpoint latency benchmark, in process, against a fake ClickHouse.
+
+Swaps db.get_clickhouse_client for fake_clickhouse.FakeClickHouseClient and drives the
+FastAPI app through its ASGI interface (routing, validation, fetchers, caches, executor,
+JSON encoding), so the numbers are the app's own overhead plus the simulated query
+latency. For every GET route and each concurrency level it sends --requests requests,
+at most `concurrency` in flight, and reports p50/p95/p99 latency and throughput.
+
+Range modes:
+  fixed   every request asks for the same range: measures the cached path
+  unique  every request shifts the range by a minute: the result cache misses, while the
+          per-day aggregate store still serves closed days
+
+Usage:
+    python benchmarks/bench_endpoints.py --concurrency 1 8 32 --requests 200
+    python benchmarks/bench_endpoints.py --latency lognormal:0.05:0.6 --ranges unique --routes /all-stats
+    python benchmarks/bench_endpoints.py --recording recorded.json     # replay real result sets
+    python benchmarks/bench_endpoints.py --record recorded.json        # record them (needs ClickHouse)
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("ORG_ID", "00000000-0000-4000-8000-000000000001")
+
+import db  # noqa: E402
+import fake_clickhouse  # noqa: E402
+import main  # noqa: E402
+from aggregate_store import DAY_AGGREGATE_STORE  # noqa: E402
+from cache import RESULT_CACHE  # noqa: E402
+from fastapi.routing import APIRoute  # noqa: E402
+
+# Extra variants of routes whose query parameters change the code path
+ROUTE_VARIANTS = {
+    "/all-stats": [{}, {"fused": "false"}],
+    "/list-of-unique-loads-stats": [{}, {"format": "ndjson"}],
+    "/timeseries/{metric}": [{"bucket": "week"}, {"bucket": "day"}],
+}
+# /ready answers 503 here since the benchmark does not run the startup warm-up
+SKIPPED_ROUTES = {"/docs", "/redoc", "/openapi.json", "/docs/oauth2-redirect", "/metrics", "/ready"}
+# Values filled into path parameters
+PATH_PARAMETERS = {"metric": "all"}
+
+
+async def asgi_get(app, path: str, params: Dict[str, str]) -> Tuple[int, int]:
+    """One GET through the ASGI app; returns (status, body bytes)."""
+    done = asyncio.Event()
+    status = 0
+    size = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body"):
+                done.set()
+
+    query_string = urlencode(params).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string,
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    await app(scope, receive, send)
+    done.set()
+    return status, size
+
+
+def discover_routes(only: Optional[List[str]]) -> List[Tuple[str, Dict[str, str]]]:
+    routes = []
+    for route in main.app.routes:
+        if not isinstance(route, APIRoute) or "GET" not in route.methods or route.path in SKIPPED_ROUTES:
+            continue
+        if only and route.path not in only:
+            continue
+        for extra in ROUTE_VARIANTS.get(route.path, [{}]):
+            routes.append((route.path.format_map(PATH_PARAMETERS), extra))
+    return routes
+
+
+def range_params(mode: str, end: datetime, days: int, i: int) -> Dict[str, str]:
+    shifted = end + timedelta(minutes=i if mode == "unique" else 0)
+    return {
+        "start_date": (shifted - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S"),
+        "end_date": shifted.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run_level(path: str, extra: Dict[str, str], concurrency: int, requests: int, args, counter: List[int]):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            counter[0] += 1
+            params = {**range_params(args.ranges, args.end, args.days, counter[0]), **extra}
+            started = time.perf_counter()
+            status, _ = await asgi_get(main.app, path, params)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    wall = time.perf_counter() - started
+    return latencies, wall, errors
+
+
+async def run(args) -> None:
+    routes = discover_routes(args.routes)
+    counter = [0]
+    print(f"{'route':<58}{'conc':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+    for path, extra in routes:
+        label = path + (f"?{urlencode(extra)}" if extra else "")
+        for concurrency in args.concurrency:
+            if args.clear_caches:
+                RESULT_CACHE.clear()
+                DAY_AGGREGATE_STORE.clear()
+            # Warm-up request (connections, imports, first-day store fill) is not measured
+            await asgi_get(main.app, path, {**range_params(args.ranges, args.end, args.days, 0), **extra})
+            latencies, wall, errors = await run_level(path, extra, concurrency, args.requests, args, counter)
+            print(
+                f"{label:<58}{concurrency:>5}"
+                f"{percentile(latencies, 50) * 1000:>10.2f}{percentile(latencies, 95) * 1000:>10.2f}"
+                f"{percentile(latencies, 99) * 1000:>10.2f}{len(latencies) / wall:>10.1f}{errors:>8}"
+            )
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per route and concurrency level")
+    parser.add_argument("--latency", default="fixed:0.02", help="simulated query latency (see fake_clickhouse.py)")
+    parser.add_argument("--ranges", choices=("fixed", "unique"), default="fixed")
+    parser.add_argument("--days", type=int, default=30, help="length of the requested range")
+    parser.add_argument("--end", type=lambda v: datetime.fromisoformat(v), help="end of the requested range (default: now)")
+    parser.add_argument("--clear-caches", action="store_true", help="clear result cache and aggregate store before each level")
+    parser.add_argument("--routes", nargs="+", help="only these route paths")
+    parser.add_argument("--calls-per-day", type=int, default=2000, help="size of the synthetic result sets")
+    parser.add_argument("--loads", type=int, default=20_000, help="distinct loads in the synthetic result sets")
+    parser.add_argument("--seed", type=int, default=1)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--recording", type=Path, help="replay result sets saved with --record")
+    group.add_argument("--record", type=Path, help="run against the real ClickHouse and save its result sets")
+    args = parser.parse_args()
+    args.end = args.end or datetime.utcnow().replace(second=0, microsecond=0)
+
+    if args.record:
+        recording = fake_clickhouse.Recording()
+        real_factory = db.get_clickhouse_client
+        db.get_clickhouse_client = lambda: fake_clickhouse.RecordingClient(real_factory(), recording)
+    else:
+        recording = (
+            fake_clickhouse.Recording.load(args.recording) if args.recording
+            else fake_clickhouse.synthetic_recording(args.calls_per_day, args.days, args.loads, args.seed)
+        )
+        latency = fake_clickhouse.parse_latency(args.latency, args.seed)
+        clients: List[fake_clickhouse.FakeClickHouseClient] = []
+
+        def fake_factory():
+            client = fake_clickhouse.FakeClickHouseClient(recording, latency)
+            clients.append(client)
+            return client
+        db.get_clickhouse_client = fake_factory
+
+    db.init_client_pool()
+    try:
+        asyncio.run(run(args))
+    finally:
+        main.shutdown_executor()
+        db.close_client_pool()
+
+    if args.record:
+        recording.save(args.record)
+        print(f"recorded {len(recording.answers)} result sets to {args.record}")
+    else:
+        calls = sum(c.calls for c in clients)
+        misses = sum(c.misses for c in clients)
+        print(f"fake ClickHouse: {calls} queries, {misses} without a recorded result")
+
+
+if __name__ == "__main__":
+    main_cli()
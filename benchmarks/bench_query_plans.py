@@ -0,0 +1,271 @@
+"""
+Query plan regression check for every queries.py builder.
+
+Renders each public *_query builder the way db.py does (typed {start}/{end}/{org_id}
+parameters, see query_templates.py) for a set of reference ranges ending at a fixed
+date, and asks ClickHouse how much it would read:
+
+  EXPLAIN ESTIMATE     -> parts, rows, marks per table (summed per query)
+  EXPLAIN indexes = 1  -> parts / granules selected by the primary key and skip indexes
+  --execute            -> also runs the query and keeps read_rows / read_bytes
+
+Results are compared with a baseline file; a metric that reads more than --tolerance
+above its baseline is reported and the command exits with status 1.
+
+The ClickHouse connection comes from the usual CLICKHOUSE_* / ORG_ID environment.
+--record saves every server answer to a file and --replay answers from that file
+instead of a server (a query whose text changed since the recording shows up as
+"not recorded").
+
+Usage:
+    python benchmarks/bench_query_plans.py --update-baseline
+    python benchmarks/bench_query_plans.py                      # compare with the baseline
+    python benchmarks/bench_query_plans.py --record plans.rec.json
+    python benchmarks/bench_query_plans.py --replay plans.rec.json
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+import queries  # noqa: E402
+from dates import parse_utc  # noqa: E402
+from query_templates import ORG_ID, RANGE_FILTER, range_filter, render  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "query_plan_baseline.json"
+DEFAULT_RANGE_DAYS = [1, 7, 30, 90]
+# Compared fields; a metric regresses when any of them grows by more than the tolerance
+COMPARED_FIELDS = ("rows", "marks", "parts", "granules", "read_rows", "read_bytes")
+
+# Builder argument name -> value it is rendered with. A builder with a required argument
+# that is not listed here fails loudly so it gets added rather than silently skipped.
+BUILDER_ARGUMENTS: Dict[str, Any] = {
+    "date_filter": RANGE_FILTER,
+    "broker_filter": range_filter("broker_start", "broker_end"),
+    "fbr_filter": range_filter("fbr_start", "fbr_end"),
+    "org_id": ORG_ID,
+    "PEPSI_BROKER_NODE_ID": db.PEPSI_BROKER_NODE_ID,
+    "node_persistent_id": db.PEPSI_BROKER_NODE_ID,
+    "PEPSI_FBR_NODE_ID": db.PEPSI_FBR_NODE_ID,
+    "cutoff_date": db.UNIQUE_LOADS_CUTOFF_DATE,
+}
+
+
+# ---- Rendering ----------------------------------------------------------------
+
+def discover_builders() -> Dict[str, str]:
+    """name -> rendered SQL for every public *_query function in queries.py."""
+    rendered = {}
+    for name, fn in inspect.getmembers(queries, inspect.isfunction):
+        if name.startswith("_") or not name.endswith("_query") or fn.__module__ != queries.__name__:
+            continue
+        args = []
+        for param in inspect.signature(fn).parameters.values():
+            if param.name in BUILDER_ARGUMENTS:
+                args.append(BUILDER_ARGUMENTS[param.name])
+            elif param.default is not inspect.Parameter.empty:
+                break
+            else:
+                raise ValueError(f"{name}: no benchmark value for argument {param.name!r}; add it to BUILDER_ARGUMENTS")
+        rendered[name] = render(fn, *args)
+    return rendered
+
+
+def range_parameters(start: datetime, end: datetime, org_id: str) -> Dict[str, Any]:
+    """Values for every parameter a builder may use; the broker/fbr pair is split at the cutoff."""
+    cutoff = min(max(parse_utc(db.UNIQUE_LOADS_CUTOFF_DATE), start), end)
+    return {
+        "start": start,
+        "end": end,
+        "broker_start": start,
+        "broker_end": cutoff,
+        "fbr_start": cutoff,
+        "fbr_end": end,
+        "org_id": org_id,
+    }
+
+
+def used_parameters(sql: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    names = set(re.findall(r"{(\w+):", sql))
+    return {k: v for k, v in parameters.items() if k in names}
+
+
+# ---- Server / recording -------------------------------------------------------
+
+def _recording_key(statement: str, parameters: Dict[str, Any]) -> str:
+    payload = json.dumps([statement, parameters], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class LiveRunner:
+    def __init__(self, client, record_path: Optional[Path] = None):
+        self.client = client
+        self.record_path = record_path
+        self.recording: Dict[str, Any] = {}
+
+    def run(self, statement: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        result = self.client.query(statement, parameters=parameters, settings=db.CLICKHOUSE_QUERY_SETTINGS)
+        answer = {
+            "columns": list(result.column_names),
+            "rows": [list(row) for row in result.result_rows],
+            "summary": dict(result.summary or {}),
+        }
+        if self.record_path:
+            self.recording[_recording_key(statement, parameters)] = json.loads(json.dumps(answer, default=str))
+        return answer
+
+    def close(self) -> None:
+        if self.record_path:
+            self.record_path.write_text(json.dumps(self.recording, indent=1, sort_keys=True))
+            print(f"recorded {len(self.recording)} answers to {self.record_path}")
+
+
+class ReplayRunner:
+    def __init__(self, path: Path):
+        self.recording = json.loads(path.read_text())
+
+    def run(self, statement: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        answer = self.recording.get(_recording_key(statement, parameters))
+        if answer is None:
+            raise LookupError("not recorded")
+        return answer
+
+    def close(self) -> None:
+        pass
+
+
+# ---- Measuring ----------------------------------------------------------------
+
+def parse_estimate(answer: Dict[str, Any]) -> Dict[str, int]:
+    index = {name: i for i, name in enumerate(answer["columns"])}
+    totals = {"parts": 0, "rows": 0, "marks": 0}
+    for row in answer["rows"]:
+        for field in totals:
+            totals[field] += int(row[index[field]])
+    return totals
+
+
+_READ_RE = re.compile(r"ReadFromMergeTree")
+_SELECTED_RE = re.compile(r"(Parts|Granules):\s*(\d+)/(\d+)")
+
+
+def parse_indexes(answer: Dict[str, Any]) -> Dict[str, int]:
+    """Parts and granules left after the last index of every ReadFromMergeTree step."""
+    selected: Dict[str, int] = {"index_parts": 0, "granules": 0}
+    last: Dict[str, int] = {}
+    for (line,) in answer["rows"]:
+        if _READ_RE.search(line):
+            selected["index_parts"] += last.get("Parts", 0)
+            selected["granules"] += last.get("Granules", 0)
+            last = {}
+            continue
+        match = _SELECTED_RE.search(line)
+        if match:
+            last[match.group(1)] = int(match.group(2))
+    selected["index_parts"] += last.get("Parts", 0)
+    selected["granules"] += last.get("Granules", 0)
+    return selected
+
+
+def measure(runner, sql: str, parameters: Dict[str, Any], execute: bool) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    result.update(parse_estimate(runner.run(f"EXPLAIN ESTIMATE {sql}", parameters)))
+    result.update(parse_indexes(runner.run(f"EXPLAIN indexes = 1 {sql}", parameters)))
+    if execute:
+        summary = runner.run(sql, parameters)["summary"]
+        result["read_rows"] = int(summary.get("read_rows", 0))
+        result["read_bytes"] = int(summary.get("read_bytes", 0))
+    return result
+
+
+# ---- Baseline -----------------------------------------------------------------
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for key, now in sorted(current.items()):
+        before = baseline.get(key)
+        if before is None or "error" in now or "error" in before:
+            continue
+        for field in COMPARED_FIELDS:
+            if field in now and field in before and now[field] > before[field] * (1 + tolerance):
+                regressions.append(f"{key}: {field} {before[field]:,} -> {now[field]:,}")
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--days", type=int, nargs="+", default=DEFAULT_RANGE_DAYS, help="reference range lengths")
+    parser.add_argument("--end", help="end of the reference ranges (default: the baseline's, else today 00:00 UTC)")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed growth before a metric is flagged")
+    parser.add_argument("--execute", action="store_true", help="also run each query for read_rows/read_bytes")
+    parser.add_argument("--only", nargs="+", help="builder names to check")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--record", type=Path, help="save the server answers to this file")
+    group.add_argument("--replay", type=Path, help="answer from a --record file instead of a server")
+    args = parser.parse_args()
+
+    baseline_doc = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    end_value = args.end or baseline_doc.get("end")
+    if end_value:
+        end = parse_utc(end_value)
+    else:
+        end = datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+    # Recordings are keyed by the bound parameters, org included: replay with the same ORG_ID
+    org_id = db.get_org_id()
+    if not org_id:
+        parser.error("ORG_ID is not set")
+
+    runner = ReplayRunner(args.replay) if args.replay else LiveRunner(db.get_clickhouse_client(), args.record)
+    builders = discover_builders()
+    if args.only:
+        builders = {name: sql for name, sql in builders.items() if name in args.only}
+
+    current: Dict[str, Any] = {}
+    for name, sql in builders.items():
+        for days in args.days:
+            key = f"{name}@{days}d"
+            params = used_parameters(sql, range_parameters(end - timedelta(days=days), end, org_id))
+            try:
+                current[key] = measure(runner, sql, params, args.execute)
+            except Exception as e:
+                current[key] = {"error": str(e).splitlines()[0][:200]}
+            values = current[key]
+            if "error" in values:
+                print(f"{key:<70} ERROR {values['error']}")
+            else:
+                print(f"{key:<70} " + "  ".join(f"{f}={values[f]:,}" for f in COMPARED_FIELDS if f in values))
+    runner.close()
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps({"end": end.isoformat(), "results": current}, indent=1, sort_keys=True) + "\n")
+        print(f"wrote baseline for {len(current)} metric/range pairs to {args.baseline}")
+        return
+
+    if not baseline_doc:
+        print(f"no baseline at {args.baseline}; run with --update-baseline first")
+        return
+    baseline = baseline_doc.get("results", {})
+    new = sorted(set(current) - set(baseline))
+    if new:
+        print(f"not in baseline: {', '.join(new)}")
+    regressions = compare(baseline, current, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+    print(f"no regressions above {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main_cli()
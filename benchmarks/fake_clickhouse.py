@@ -0,0 +1,378 @@
+"""
+Fake clickhouse-connect client for in-process benchmarks.
+
+FakeClickHouseClient answers query() / query_rows_stream() with real QueryResult objects
+built from a Recording, after sleeping for a latency drawn from a configurable
+distribution. Queries are identified by their text alone: since the metric queries are
+fixed templates with bound parameters (query_templates.py), one recorded result set
+answers the query for any date range.
+
+A Recording comes from one of two sources:
+  - RecordingClient, which wraps a real client and saves what ClickHouse returned;
+  - synthetic_recording(), which builds plausible result sets for every db.py template
+    with no server. Its per-day queries produce one row set per requested day.
+
+Latency specs: "0", "fixed:0.05", "uniform:0.02:0.2", "lognormal:0.05:0.6" (median, sigma).
+"""
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from zoneinfo import ZoneInfo
+
+from clickhouse_connect.driver.query import QueryResult
+
+import db
+import diagnostics
+from distinct_state import HyperLogLog
+import gen_synthetic_data as synthetic
+from queries import call_stage_json_paths_query, node_output_coverage_query, transfer_attempt_values_query
+from query_templates import ORG_ID, QueryTemplate, render
+
+BLOCK_ROWS = 65536
+
+# (column_names, columns)
+ResultSet = Tuple[Sequence[str], List[List[Any]]]
+# Either a recorded result set or a function of the bound parameters
+Answer = Union[ResultSet, Callable[[Dict[str, Any]], ResultSet]]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def query_key(sql: str) -> str:
+    return hashlib.sha1(_WHITESPACE.sub(" ", sql).strip().encode()).hexdigest()[:16]
+
+
+def template_queries() -> Dict[str, str]:
+    """Template name -> SQL for every query db.py renders at import."""
+    queries: Dict[str, str] = {}
+    for name, value in vars(db).items():
+        if name.endswith("_TEMPLATE"):
+            queries[f"{name}:range"] = value.range_sql
+            queries[f"{name}:since"] = value.since_sql
+        elif name.endswith("_SQL") and isinstance(value, str):
+            queries[name] = value
+        elif name.endswith("_SQL") and isinstance(value, dict):
+            for variant, sql in value.items():
+                queries[f"{name}:{variant}"] = sql
+        elif name.endswith("_TEMPLATES") and isinstance(value, dict):
+            for variant, template in value.items():
+                queries[f"{name}:{variant}:range"] = template.range_sql
+                queries[f"{name}:{variant}:since"] = template.since_sql
+    return queries
+
+
+# ---- Latency ------------------------------------------------------------------
+
+def parse_latency(spec: str, seed: int = 0) -> Callable[[], float]:
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(":")] if args else []
+    if kind in ("0", "none"):
+        return lambda: 0.0
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        low, high = values
+
+        def draw():
+            with lock:
+                return rng.uniform(low, high)
+        return draw
+    if kind == "lognormal":
+        median, sigma = values
+
+        def draw():
+            with lock:
+                return median * rng.lognormvariate(0, sigma)
+        return draw
+    raise ValueError(f"Unknown latency spec {spec!r}")
+
+
+# ---- Recording ----------------------------------------------------------------
+
+class Recording:
+    def __init__(self, answers: Optional[Dict[str, Answer]] = None):
+        self.answers: Dict[str, Answer] = answers or {}
+
+    def get(self, sql: str) -> Optional[Answer]:
+        return self.answers.get(query_key(sql))
+
+    def put(self, sql: str, column_names: Sequence[str], columns: List[List[Any]]) -> None:
+        self.answers[query_key(sql)] = (tuple(column_names), columns)
+
+    def save(self, path: Path) -> None:
+        static = {k: {"column_names": list(v[0]), "columns": v[1]} for k, v in self.answers.items() if not callable(v)}
+        path.write_text(json.dumps(static, default=str))
+
+    @classmethod
+    def load(cls, path: Path) -> "Recording":
+        data = json.loads(path.read_text())
+        return cls({k: (tuple(v["column_names"]), v["columns"]) for k, v in data.items()})
+
+
+class FakeClickHouseClient:
+    """Replays a Recording; unknown queries return an empty result and count as misses."""
+
+    def __init__(self, recording: Recording, latency: Callable[[], float] = lambda: 0.0):
+        self.recording = recording
+        self.latency = latency
+        self.calls = 0
+        self.misses = 0
+
+    def _result(self, query: str, parameters: Optional[Dict[str, Any]], column_oriented: bool) -> QueryResult:
+        delay = self.latency()
+        if delay > 0:
+            time.sleep(delay)
+        self.calls += 1
+        answer = self.recording.get(query)
+        if answer is None:
+            self.misses += 1
+            column_names, columns = (), []
+        else:
+            column_names, columns = answer(parameters or {}) if callable(answer) else answer
+        n = len(columns[0]) if columns else 0
+        blocks = [[column[i:i + BLOCK_ROWS] for column in columns] for i in range(0, n, BLOCK_ROWS)]
+        return QueryResult(block_gen=iter(blocks), column_names=tuple(column_names), column_oriented=column_oriented)
+
+    def query(self, query: str, parameters: Optional[Dict[str, Any]] = None, settings=None, column_oriented: bool = False, **kwargs) -> QueryResult:
+        return self._result(query, parameters, column_oriented)
+
+    def query_rows_stream(self, query: str, parameters: Optional[Dict[str, Any]] = None, settings=None, **kwargs):
+        return self._result(query, parameters, False).rows_stream
+
+    def command(self, *args, **kwargs) -> None:
+        return None
+
+    def ping(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class RecordingClient:
+    """Wraps a real client and stores every column-oriented result in `recording`."""
+
+    def __init__(self, client, recording: Recording):
+        self.client = client
+        self.recording = recording
+
+    def query(self, query: str, *args, column_oriented: bool = False, **kwargs) -> QueryResult:
+        result = self.client.query(query, *args, column_oriented=True, **kwargs)
+        columns = [list(column) for column in result.result_columns]
+        self.recording.put(query, result.column_names, columns)
+        return QueryResult(block_gen=iter([columns] if columns and columns[0] else []), column_names=result.column_names,
+                           column_types=result.column_types, column_oriented=column_oriented)
+
+    def query_rows_stream(self, query: str, *args, **kwargs):
+        return self.query(query, *args, **kwargs).rows_stream
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+
+# ---- Synthetic result sets ----------------------------------------------------
+
+def _breakdown(rng: random.Random, values: List[Tuple[str, int]], calls: int) -> List[Tuple[str, int]]:
+    total = sum(w for _, w in values)
+    counts = [(v, max(0, int(calls * w / total * rng.uniform(0.8, 1.2)))) for v, w in values]
+    return sorted(counts, key=lambda vc: vc[1], reverse=True)
+
+
+def _ranked(column: str, counts: List[Tuple[str, int]]) -> ResultSet:
+    total = sum(c for _, c in counts) or 1
+    return (column, "count", "percentage"), [
+        [v for v, _ in counts], [c for _, c in counts], [round(c * 100.0 / total, 2) for _, c in counts],
+    ]
+
+
+def _scalar(**values: Any) -> ResultSet:
+    return tuple(values), [[v] for v in values.values()]
+
+
+def _fake_hash(load_id: str) -> int:
+    """Stand-in for cityHash64: deterministic and well spread over 64 bits."""
+    return (int(load_id[2:]) * 0x9E3779B97F4A7C15 + 0x632BE59BD9B4E019) & 0xFFFFFFFFFFFFFFFF
+
+
+def _days(parameters: Dict[str, Any]) -> List[date]:
+    days = []
+    for start, end in parameters.get("ranges") or [(parameters.get("start"), parameters.get("end"))]:
+        day = start.date()
+        while datetime.combine(day, datetime.min.time()) < end:
+            days.append(day)
+            day += timedelta(days=1)
+    return days
+
+
+def synthetic_recording(calls_per_day: int = 2000, days: int = 30, loads: int = 20_000, seed: int = 1) -> Recording:
+    """
+    Result sets for every db.py template, shaped like what ClickHouse returns for a
+    dataset with `calls_per_day` calls over `days` days and `loads` distinct loads.
+    """
+    rng = random.Random(seed)
+    calls = calls_per_day * days
+    breakdowns = {
+        "call_stage": synthetic.CALL_STAGES,
+        "call_classification": synthetic.CALL_CLASSIFICATIONS,
+        "carrier_qualification": synthetic.CARRIER_QUALIFICATIONS,
+        "pricing_notes": synthetic.PRICING_NOTES,
+        "carrier_end_state": synthetic.CARRIER_END_STATES,
+        "load_status": synthetic.LOAD_STATUSES,
+        "transfer_reason": synthetic.TRANSFER_REASONS,
+        "load_not_found_status": synthetic.LOAD_STATUSES,
+    }
+    load_ids = [f"LD{i:09d}" for i in range(loads)]
+    unique_loads = _scalar(number_of_unique_loads=loads, total_calls=calls, calls_per_unique_load=round(calls / loads, 2))
+
+    def all_stats_rows(day_calls: int, rng: random.Random) -> List[Tuple[str, str, int, int, int]]:
+        rows = []
+        for dimension, values in breakdowns.items():
+            rows += [(dimension, value, count, count, 0) for value, count in _breakdown(rng, values, day_calls)]
+        booked = int(day_calls * 0.12)
+        rows += [
+            ("booking", "AGREEMENT_REACHED_WITH_NEGOTIATION", booked, booked, 0),
+            ("booking_total", "all", day_calls, day_calls, 0),
+            ("non_convertible", "all", int(day_calls * 0.4), int(day_calls * 0.4), 0),
+            ("sessions", "all", day_calls, day_calls, 0),
+            ("unique_loads", "all", day_calls, day_calls, min(loads, day_calls // 3)),
+            ("unique_load_sessions", "all", day_calls, day_calls, 0),
+        ]
+        return rows
+
+    def all_stats(_parameters) -> ResultSet:
+        rows = all_stats_rows(calls, random.Random(seed))
+        return ("dimension", "value", "runs", "rows", "unique_loads"), [list(c) for c in zip(*rows)]
+
+    def all_stats_by_day(parameters) -> ResultSet:
+        rows = []
+        for day in _days(parameters):
+            rows += [(day, day) + r for r in all_stats_rows(calls_per_day, random.Random(f"{seed}:{day}"))]
+        return ("day", "session_day", "dimension", "value", "runs", "rows", "unique_loads"), [list(c) for c in zip(*rows)] or [[]] * 7
+
+    def all_stats_timeseries(bucket: str) -> Callable[[Dict[str, Any]], ResultSet]:
+        bucket_calls = calls_per_day * (7 if bucket == "week" else 1)
+
+        def answer(parameters) -> ResultSet:
+            end = parameters.get("end") or datetime.utcnow()
+            rows = []
+            for start in db._bucket_starts(bucket, ZoneInfo(parameters["tz"]), parameters["start"], end):
+                rows += [(start,) + r for r in all_stats_rows(bucket_calls, random.Random(f"{seed}:{bucket}:{start}"))]
+            return ("bucket", "dimension", "value", "runs", "rows", "unique_loads"), [list(c) for c in zip(*rows)] or [[]] * 6
+        return answer
+
+    def all_stats_multi_range(parameters) -> ResultSet:
+        rows = []
+        for i, (start, end) in enumerate(parameters["ranges"], 1):
+            range_calls = int(calls_per_day * (end - start).total_seconds() / 86400)
+            rows += [(i,) + r for r in all_stats_rows(range_calls, random.Random(f"{seed}:{start}:{end}"))]
+        return ("bucket", "dimension", "value", "runs", "rows", "unique_loads"), [list(c) for c in zip(*rows)] or [[]] * 6
+
+    def load_states_by_day(mode: str) -> Callable[[Dict[str, Any]], ResultSet]:
+        def answer(parameters) -> ResultSet:
+            day_list = _days(parameters)
+            per_day = min(loads, calls_per_day // 3)
+            states = []
+            for day in day_list:
+                day_rng = random.Random(f"{seed}:{day}")
+                ids = day_rng.sample(load_ids, per_day)
+                if mode == "ids":
+                    states.append(ids)
+                elif mode == "hll":
+                    # (register, rank) pairs of the non-empty registers, as ClickHouse returns them
+                    registers = HyperLogLog.from_hashes(_fake_hash(i) for i in ids).registers
+                    states.append([(index, rank) for index, rank in enumerate(registers) if rank])
+                else:
+                    states.append([_fake_hash(i) for i in ids])
+            return ("day", "total_calls", "loads"), [day_list, [calls_per_day] * len(day_list), states]
+        return answer
+
+    def load_list(_parameters) -> ResultSet:
+        return ("custom_load_id",), [load_ids]
+
+    def load_status(_parameters) -> ResultSet:
+        counts = _breakdown(random.Random(seed), synthetic.LOAD_STATUSES, calls)
+        total = sum(c for _, c in counts) or 1
+        return ("load_status", "count", "total_calls", "load_status_percentage"), [
+            [v for v, _ in counts], [c for _, c in counts], [total] * len(counts), [round(c * 100.0 / total, 2) for _, c in counts],
+        ]
+
+    def ranked(column: str, values: List[Tuple[str, int]]) -> Callable[[Dict[str, Any]], ResultSet]:
+        return lambda _parameters: _ranked(column, _breakdown(random.Random(seed), values, calls))
+
+    non_convertible = {f"{v}_count": int(calls * w / 100) for v, w in synthetic.CALL_CLASSIFICATIONS[4:]}
+    by_name: Dict[str, Answer] = {
+        "CALLS_ENDING_IN_EACH_CALL_STAGE_STATS_TEMPLATE": ranked("call_stage", synthetic.CALL_STAGES),
+        "CALL_CLASSIFCATION_STATS_TEMPLATE": ranked("call_classification", synthetic.CALL_CLASSIFICATIONS),
+        "CARRIER_QUALIFICATION_STATS_TEMPLATE": ranked("carrier_qualification", synthetic.CARRIER_QUALIFICATIONS),
+        "PRICING_STATS_TEMPLATE": ranked("pricing_notes", synthetic.PRICING_NOTES),
+        "CARRIER_END_STATE_TEMPLATE": ranked("carrier_end_state", synthetic.CARRIER_END_STATES),
+        "LOAD_STATUS_STATS_TEMPLATE": load_status,
+        "CARRIER_ASKED_TRANSFER_OVER_TOTAL_TRANSFER_ATTEMPT_STATS_TEMPLATE": _scalar(
+            carrier_asked_count=int(calls * 0.2), total_transfer_attempts=int(calls * 0.45), carrier_asked_percentage=44.44),
+        "CARRIER_ASKED_TRANSFER_OVER_TOTAL_CALL_ATTEMPTS_STATS_TEMPLATE": _scalar(
+            carrier_asked_count=int(calls * 0.2), total_call_attempts=calls, carrier_asked_percentage=20.0),
+        "LOAD_NOT_FOUND_STATS_TEMPLATE": _scalar(
+            load_not_found_count=int(calls * 0.12), total_calls=calls, load_not_found_percentage=12.0),
+        "SUCCESSFULLY_TRANSFERRED_FOR_BOOKING_STATS_TEMPLATE": _scalar(
+            successfully_transferred_for_booking_count=int(calls * 0.12), total_calls=calls,
+            successfully_transferred_for_booking_percentage=12.0),
+        "PERCENT_NON_CONVERTIBLE_CALLS_TEMPLATE": _scalar(
+            non_convertible_calls_count=int(calls * 0.4), total_calls=calls, non_convertible_calls_percentage=40.0),
+        "NUMBER_OF_UNIQUE_LOADS_TEMPLATE": unique_loads,
+        "NUMBER_OF_UNIQUE_LOADS_BROKER_NODE_TEMPLATE": unique_loads,
+        "NUMBER_OF_UNIQUE_LOADS_ACROSS_CUTOFF_SQL": unique_loads,
+        "LIST_OF_UNIQUE_LOADS_TEMPLATE": load_list,
+        "LIST_OF_UNIQUE_LOADS_BROKER_NODE_TEMPLATE": load_list,
+        "LIST_OF_UNIQUE_LOADS_ACROSS_CUTOFF_SQL": load_list,
+        "CALLS_WITHOUT_CARRIER_ASKED_FOR_TRANSFER_TEMPLATE": _scalar(
+            non_convertible_calls_count=int(calls * 0.4), non_convertible_calls_duration=int(calls * 0.4 * 90),
+            rate_too_high_calls_count=int(calls * 0.15), rate_too_high_calls_duration=int(calls * 0.15 * 120),
+            success_calls_count=int(calls * 0.3), success_calls_duration=int(calls * 0.3 * 150),
+            other_calls_count=int(calls * 0.08), other_calls_duration=int(calls * 0.08 * 60),
+            total_duration_no_carrier_asked_for_transfer=int(calls * 0.8 * 110),
+            total_calls_no_carrier_asked_for_transfer=int(calls * 0.8),
+            **non_convertible),
+        "TOTAL_CALLS_AND_TOTAL_DURATION_TEMPLATE": _scalar(
+            total_duration=calls * 110, total_calls=calls, avg_minutes_per_call=1.83),
+        "DURATION_CARRIER_ASKED_FOR_TRANSFER_TEMPLATE": _scalar(duration_carrier_asked_for_transfer=int(calls * 0.2 * 95)),
+        "ALL_STATS_FUSED_TEMPLATE": all_stats,
+        "ALL_STATS_BY_DAY_SQL": all_stats_by_day,
+        "ALL_STATS_MULTI_RANGE_SQL": all_stats_multi_range,
+        "REQUIRED_TABLES_SQL": (("name",), [list(db.REQUIRED_TABLES)]),
+        "ALL_STATS_TIMESERIES_TEMPLATES:day": all_stats_timeseries("day"),
+        "ALL_STATS_TIMESERIES_TEMPLATES:week": all_stats_timeseries("week"),
+        "UNIQUE_LOAD_STATES_BY_DAY_SQL:exact": load_states_by_day("exact"),
+        "UNIQUE_LOAD_STATES_BY_DAY_SQL:hll": load_states_by_day("hll"),
+        "UNIQUE_LOAD_STATES_BY_DAY_SQL:ids": load_states_by_day("ids"),
+    }
+
+    answers: Dict[str, Answer] = {}
+    for name, sql in template_queries().items():
+        answer = by_name.get(name) or by_name.get(name.rsplit(":", 1)[0]) or by_name.get(name.split(":")[0])
+        if answer is not None:
+            answers[query_key(sql)] = answer
+
+    # Connection check run by warmup.py on every pooled client
+    answers[query_key("SELECT 1")] = (("1",), [[1]])
+    # Diagnostics render per request; these match their default sample_percent and limit
+    transfer_values = QueryTemplate(transfer_attempt_values_query, db.PEPSI_BROKER_NODE_ID, diagnostics.DIAGNOSTICS_SAMPLE_PERCENT, 100)
+    transfer_values_answer = (("transfer_attempt", "count"), [["YES", "NO", "null"], [int(calls * 0.45), int(calls * 0.5), int(calls * 0.05)]])
+    answers[query_key(transfer_values.range_sql)] = transfer_values_answer
+    answers[query_key(transfer_values.since_sql)] = transfer_values_answer
+    coverage_sql = render(node_output_coverage_query, ORG_ID, db.PEPSI_BROKER_NODE_ID, diagnostics.DIAGNOSTICS_SAMPLE_PERCENT)
+    answers[query_key(coverage_sql)] = _scalar(
+        total_nodes=calls, unique_runs=calls, earliest_run="2025-08-09 00:00:00.000", latest_run="2026-02-05 00:00:00.000")
+    json_paths_sql = render(call_stage_json_paths_query, ORG_ID, db.PEPSI_BROKER_NODE_ID, 5)
+    answers[query_key(json_paths_sql)] = (("has_nested_path", "has_dot_path", "nested_value", "dot_value"), [
+        [0] * 5, [1] * 5, [""] * 5, [stage for stage, _ in synthetic.CALL_STAGES[:5]],
+    ])
+    return Recording(answers)
@@ -0,0 +1,345 @@
+"""
+Synthetic public_runs / public_sessions / public_nodes / public_node_outputs data.
+
+Generates runs spread over a date range that straddles UNIQUE_LOADS_CUTOFF_DATE, so
+both unique-load code paths have data:
+
+  before the cutoff  one broker node output per run (load id in result.load.reference_number)
+  from the cutoff on one broker output plus one FBR output per run (load.custom_load_id)
+
+flat_data uses the dotted top-level keys the queries read (result.call.call_stage,
+result.transfer.*, result.pricing.*, result.carrier.*, result.load.*). A few percent of
+keys are missing or 'null', a few sessions have no user number or the excluded test
+number, and some runs belong to other orgs, so the queries' filters have work to do.
+Load ids are drawn from a skewed pool so that some loads get many calls.
+
+The size is given in node outputs (--scale 10k ... 100M). Data is produced in chunks
+of --chunk-runs runs, each seeded from --seed and its chunk number, so output is the
+same whatever --workers is.
+
+Formats:
+  ndjson      one <table>.<chunk>.ndjson file per table and chunk in --out
+  parquet     the same as Parquet files (needs pyarrow)
+  clickhouse  inserted straight into the CLICKHOUSE_* database (--create-tables first)
+
+Usage:
+    python benchmarks/gen_synthetic_data.py --scale 100k --format ndjson --out /tmp/pepsi
+    python benchmarks/gen_synthetic_data.py --scale 10M --format clickhouse --create-tables --workers 8
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+from dates import parse_utc  # noqa: E402
+
+SCHEMA = {
+    "public_runs": """
+        CREATE TABLE IF NOT EXISTS public_runs (
+            id String,
+            timestamp DateTime64(3, 'UTC')
+        ) ENGINE = MergeTree ORDER BY (timestamp, id)
+    """,
+    "public_sessions": """
+        CREATE TABLE IF NOT EXISTS public_sessions (
+            run_id String,
+            org_id String,
+            user_number Nullable(String),
+            duration Float64,
+            timestamp DateTime64(3, 'UTC')
+        ) ENGINE = MergeTree ORDER BY (org_id, timestamp, run_id)
+    """,
+    "public_nodes": """
+        CREATE TABLE IF NOT EXISTS public_nodes (
+            id String,
+            org_id String
+        ) ENGINE = MergeTree ORDER BY id
+    """,
+    "public_node_outputs": """
+        CREATE TABLE IF NOT EXISTS public_node_outputs (
+            run_id String,
+            node_id String,
+            node_persistent_id String,
+            flat_data String
+        ) ENGINE = MergeTree ORDER BY (node_persistent_id, run_id)
+    """,
+}
+COLUMNS = {
+    "public_runs": ("id", "timestamp"),
+    "public_sessions": ("run_id", "org_id", "user_number", "duration", "timestamp"),
+    "public_nodes": ("id", "org_id"),
+    "public_node_outputs": ("run_id", "node_id", "node_persistent_id", "flat_data"),
+}
+
+# The test number every query excludes
+EXCLUDED_USER_NUMBER = "+19259898099"
+
+# (value, weight) per flat_data key
+CALL_STAGES = [("GREETING", 10), ("LOAD_LOOKUP", 25), ("CARRIER_VERIFICATION", 15), ("PRICING", 25), ("TRANSFER", 15), ("WRAP_UP", 10)]
+CALL_CLASSIFICATIONS = [
+    ("success", 30), ("rate_too_high", 15), ("other", 8), ("after_hours", 4),
+    ("alternate_equipment", 4), ("caller_hung_up_no_explanation", 6), ("load_not_ready", 3),
+    ("load_past_due", 3), ("covered", 6), ("carrier_not_qualified", 4), ("alternate_date_or_time", 3),
+    ("user_declined_load", 4), ("checking_with_driver", 4), ("carrier_cannot_see_reference_number", 3),
+    ("caller_put_on_hold_assistant_hung_up", 3),
+]
+TRANSFER_REASONS = [("NO_TRANSFER_INVOLVED", 55), ("CARRIER_ASKED_FOR_TRANSFER", 20), ("RATE_NEGOTIATION", 15), ("OTHER", 10)]
+TRANSFER_ATTEMPTS = [("YES", 45), ("NO", 55)]
+LOAD_STATUSES = [("AVAILABLE", 60), ("COVERED", 20), ("PAST_DUE", 8), ("NOT_FOUND", 12)]
+CARRIER_QUALIFICATIONS = [("QUALIFIED", 75), ("NOT_QUALIFIED", 15), ("UNKNOWN", 10)]
+CARRIER_END_STATES = [
+    ("BOOKED", 25), ("TRANSFERRED", 25), ("CARRIER_OFFER_TOO_HIGH", 20),
+    ("CARRIER_UNABLE_TO_MEET_PICKUP_DELIVERY_APPT", 10), ("CARRIER_UNABLE_TO_MEET_EQUIPMENT_REQ", 8),
+    ("CARRIER_DID_NOT_WANT_LOAD", 12),
+]
+PRICING_NOTES = [
+    ("AGREEMENT_REACHED_WITH_NEGOTIATION", 25), ("AGREEMENT_REACHED_WITHOUT_NEGOTIATION", 15),
+    ("NO_AGREEMENT", 35), ("RATE_NOT_DISCUSSED", 25),
+]
+
+MISSING_KEY_RATE = 0.03
+NULL_VALUE_RATE = 0.02
+OTHER_ORG_RATE = 0.10
+SECOND_SESSION_RATE = 0.05
+NO_USER_NUMBER_RATE = 0.03
+TEST_NUMBER_RATE = 0.01
+
+
+def parse_scale(value: str) -> int:
+    """'10k' / '2.5M' / '100000' -> number of node outputs."""
+    units = {"k": 1_000, "m": 1_000_000, "g": 1_000_000_000}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _choices(values: List[Tuple[str, int]]) -> Tuple[List[str], List[int]]:
+    return [v for v, _ in values], list(itertools.accumulate(w for _, w in values))
+
+
+class ChunkGenerator:
+    """Rows for one chunk of runs; everything random comes from the chunk's own seed."""
+
+    def __init__(self, config: Dict[str, Any], chunk: int):
+        self.config = config
+        self.chunk = chunk
+        self.rng = random.Random(config["seed"] * 1_000_003 + chunk)
+        self._tables = {
+            key: _choices(values) for key, values in (
+                ("result.call.call_stage", CALL_STAGES),
+                ("result.call.call_classification", CALL_CLASSIFICATIONS),
+                ("result.transfer.transfer_reason", TRANSFER_REASONS),
+                ("result.transfer.transfer_attempt", TRANSFER_ATTEMPTS),
+                ("result.load.load_status", LOAD_STATUSES),
+                ("result.carrier.carrier_qualification", CARRIER_QUALIFICATIONS),
+                ("result.carrier.carrier_end_state", CARRIER_END_STATES),
+                ("result.pricing.pricing_notes", PRICING_NOTES),
+            )
+        }
+
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _pick(self, key: str) -> str:
+        values, cum_weights = self._tables[key]
+        return self.rng.choices(values, cum_weights=cum_weights)[0]
+
+    def _load_id(self) -> str:
+        # Squaring a uniform draw skews towards low ids: a few loads get most of the calls
+        return f"LD{int(self.config['loads'] * self.rng.random() ** 2):09d}"
+
+    def _put(self, flat: Dict[str, str], key: str, value: str) -> None:
+        r = self.rng.random()
+        if r < MISSING_KEY_RATE:
+            return
+        flat[key] = "null" if r < MISSING_KEY_RATE + NULL_VALUE_RATE else value
+
+    def _broker_flat_data(self, before_cutoff: bool) -> str:
+        flat: Dict[str, str] = {}
+        for key in self._tables:
+            self._put(flat, key, self._pick(key))
+        notes = flat.get("result.pricing.pricing_notes", "")
+        agreed = notes.startswith("AGREEMENT_REACHED")
+        self._put(flat, "result.pricing.agreed_upon_rate", f"{self.rng.randint(800, 4500)}" if agreed else "")
+        if before_cutoff:
+            self._put(flat, "result.load.reference_number", self._load_id())
+        return json.dumps(flat, separators=(",", ":"))
+
+    def _fbr_flat_data(self) -> str:
+        flat: Dict[str, str] = {}
+        self._put(flat, "load.custom_load_id", self._load_id())
+        return json.dumps(flat, separators=(",", ":"))
+
+    def _user_number(self) -> Optional[str]:
+        r = self.rng.random()
+        if r < NO_USER_NUMBER_RATE:
+            return None if r < NO_USER_NUMBER_RATE / 2 else ""
+        if r < NO_USER_NUMBER_RATE + TEST_NUMBER_RATE:
+            return EXCLUDED_USER_NUMBER
+        return f"+1{self.rng.randint(2_000_000_000, 9_999_999_999)}"
+
+    def generate(self, runs: int) -> Dict[str, List[tuple]]:
+        config = self.config
+        start, span = config["start"], config["span_seconds"]
+        cutoff = config["cutoff"]
+        rows: Dict[str, List[tuple]] = {table: [] for table in COLUMNS}
+        for _ in range(runs):
+            run_id = self._uuid()
+            ts = start + timedelta(seconds=self.rng.random() * span)
+            org = config["org_id"] if self.rng.random() >= OTHER_ORG_RATE else self.rng.choice(config["other_orgs"])
+            broker_node, fbr_node = config["nodes"][org]
+            rows["public_runs"].append((run_id, ts))
+            for _ in range(2 if self.rng.random() < SECOND_SESSION_RATE else 1):
+                duration = round(self.rng.lognormvariate(4.5, 0.8), 1)
+                rows["public_sessions"].append((run_id, org, self._user_number(), duration, ts))
+            before_cutoff = ts < cutoff
+            rows["public_node_outputs"].append((run_id, broker_node, db.PEPSI_BROKER_NODE_ID, self._broker_flat_data(before_cutoff)))
+            if not before_cutoff:
+                rows["public_node_outputs"].append((run_id, fbr_node, db.PEPSI_FBR_NODE_ID, self._fbr_flat_data()))
+        return rows
+
+
+# ---- Writers ------------------------------------------------------------------
+
+def _json_value(value: Any) -> Any:
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if isinstance(value, datetime) else value
+
+
+def write_ndjson(out: Path, table: str, chunk: int, rows: List[tuple]) -> None:
+    columns = COLUMNS[table]
+    with open(out / f"{table}.{chunk:05d}.ndjson", "w") as f:
+        for row in rows:
+            f.write(json.dumps({c: _json_value(v) for c, v in zip(columns, row)}, separators=(",", ":")))
+            f.write("\n")
+
+
+def write_parquet(out: Path, table: str, chunk: int, rows: List[tuple]) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    columns = COLUMNS[table]
+    data = {c: [row[i] for row in rows] for i, c in enumerate(columns)}
+    pq.write_table(pa.table(data), out / f"{table}.{chunk:05d}.parquet")
+
+
+def insert_clickhouse(table: str, rows: List[tuple], client) -> None:
+    if rows:
+        client.insert(table, rows, column_names=list(COLUMNS[table]))
+
+
+def _run_chunk(args: Tuple[Dict[str, Any], int, int]) -> Dict[str, int]:
+    config, chunk, runs = args
+    rows = ChunkGenerator(config, chunk).generate(runs)
+    client = db.get_clickhouse_client() if config["format"] == "clickhouse" else None
+    out = Path(config["out"]) if config["out"] else None
+    for table, table_rows in rows.items():
+        if table == "public_nodes":
+            continue
+        if config["format"] == "ndjson":
+            write_ndjson(out, table, chunk, table_rows)
+        elif config["format"] == "parquet":
+            write_parquet(out, table, chunk, table_rows)
+        else:
+            insert_clickhouse(table, table_rows, client)
+    if client is not None:
+        client.close()
+    return {table: len(table_rows) for table, table_rows in rows.items()}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="100k", help="number of node outputs: 10k, 1M, 100M, ...")
+    parser.add_argument("--format", choices=("ndjson", "parquet", "clickhouse"), default="ndjson")
+    parser.add_argument("--out", help="output directory for ndjson/parquet")
+    parser.add_argument("--days-before", type=int, default=90, help="days of data before the unique-loads cutoff")
+    parser.add_argument("--days-after", type=int, default=90, help="days of data from the cutoff on")
+    parser.add_argument("--org-id", default=os.getenv("ORG_ID") or "00000000-0000-4000-8000-000000000001")
+    parser.add_argument("--other-orgs", type=int, default=3, help="noise orgs sharing the tables")
+    parser.add_argument("--loads", type=int, help="distinct load ids (default: one per 5 runs)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--chunk-runs", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--create-tables", action="store_true", help="create the tables first (clickhouse format)")
+    args = parser.parse_args()
+
+    if args.format != "clickhouse" and not args.out:
+        parser.error("--out is required for ndjson/parquet")
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("parquet output needs pyarrow (pip install pyarrow)")
+
+    cutoff = parse_utc(db.UNIQUE_LOADS_CUTOFF_DATE)
+    start = cutoff - timedelta(days=args.days_before)
+    end = cutoff + timedelta(days=args.days_after)
+    # Runs after the cutoff write two node outputs, runs before it one
+    outputs_per_run = (args.days_before + 2 * args.days_after) / (args.days_before + args.days_after)
+    total_runs = max(1, math.ceil(parse_scale(args.scale) / outputs_per_run))
+
+    rng = random.Random(args.seed)
+    other_orgs = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(args.other_orgs)]
+    orgs = [args.org_id] + other_orgs
+    nodes = {org: (str(uuid.UUID(int=rng.getrandbits(128), version=4)), str(uuid.UUID(int=rng.getrandbits(128), version=4))) for org in orgs}
+    config = {
+        "seed": args.seed,
+        "format": args.format,
+        "out": args.out,
+        "start": start,
+        "span_seconds": (end - start).total_seconds(),
+        "cutoff": cutoff,
+        "org_id": args.org_id,
+        "other_orgs": other_orgs or [args.org_id],
+        "nodes": nodes,
+        "loads": args.loads or max(1, total_runs // 5),
+    }
+
+    node_rows = [(node_id, org) for org, pair in nodes.items() for node_id in pair]
+    if args.format == "clickhouse":
+        client = db.get_clickhouse_client()
+        if args.create_tables:
+            for ddl in SCHEMA.values():
+                client.command(ddl)
+        insert_clickhouse("public_nodes", node_rows, client)
+        client.close()
+    else:
+        out = Path(args.out)
+        out.mkdir(parents=True, exist_ok=True)
+        (out / "schema.sql").write_text(";\n".join(ddl.strip() for ddl in SCHEMA.values()) + ";\n")
+        writer = write_ndjson if args.format == "ndjson" else write_parquet
+        writer(out, "public_nodes", 0, node_rows)
+
+    chunks = [
+        (config, chunk, min(args.chunk_runs, total_runs - chunk * args.chunk_runs))
+        for chunk in range(math.ceil(total_runs / args.chunk_runs))
+    ]
+    print(f"{total_runs:,} runs from {start:%Y-%m-%d} to {end:%Y-%m-%d} (cutoff {cutoff:%Y-%m-%d}) in {len(chunks)} chunks, org {args.org_id}")
+    totals = {table: 0 for table in COLUMNS}
+    totals["public_nodes"] = len(node_rows)
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            counts = pool.map(_run_chunk, chunks)
+            for chunk_counts in counts:
+                for table, n in chunk_counts.items():
+                    totals[table] += n
+    else:
+        for chunk in chunks:
+            for table, n in _run_chunk(chunk).items():
+                totals[table] += n
+    print("  ".join(f"{table}={n:,}" for table, n in totals.items()))
+
+
+if __name__ == "__main__":
+    main_cli()
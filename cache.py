@@ -0,0 +1,354 @@
+# cache.py
+
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, is_dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from dates import parse_utc
+from prometheus import track_fetch
+from tracing import start_span
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# ---- Config -------------------------------------------------------------------
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("true", "1", "yes")
+# Results are fresh for TTL seconds, then served stale (while a refresh runs) for STALE seconds more
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "300"))
+RESULT_CACHE_STALE_SECONDS = float(os.getenv("RESULT_CACHE_STALE_SECONDS", "600"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# start/end dates are floored to this many seconds in cache keys, so dashboards that send
+# "now" as the end date still share entries
+RESULT_CACHE_RANGE_GRANULARITY_SECONDS = int(os.getenv("RESULT_CACHE_RANGE_GRANULARITY_SECONDS", "60"))
+
+
+# ---- Keys ---------------------------------------------------------------------
+
+def normalize_date(value: Optional[str], granularity: int = RESULT_CACHE_RANGE_GRANULARITY_SECONDS) -> Optional[str]:
+    """
+    Canonical form of a start/end date for cache keys: UTC, floored to `granularity` seconds.
+    Unparseable values are kept as-is so they never collide with a real date.
+    """
+    if not value:
+        return None
+    try:
+        dt = parse_utc(value)
+    except ValueError:
+        return value
+    seconds = int(dt.replace(tzinfo=timezone.utc).timestamp())
+    if granularity > 1:
+        seconds -= seconds % granularity
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def metric_cache_key(metric: str, org_id: Optional[str], node_id: str, start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, ...]:
+    if not start_date or not end_date:
+        # The fetchers fall back to a rolling "last 30 days" window when either date is missing
+        return (metric, org_id or "", node_id, "last_30_days", "")
+    return (metric, org_id or "", node_id, normalize_date(start_date), normalize_date(end_date))
+
+
+# ---- Cache --------------------------------------------------------------------
+
+def estimate_size(value: Any, _seen: Optional[Set[int]] = None) -> int:
+    """Rough deep size in bytes of a cached result (dataclasses, objects, lists, dicts, strings)."""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    if is_dataclass(value) and not isinstance(value, type):
+        fields = value.__dict__ if hasattr(value, "__dict__") else {
+            name: getattr(value, name) for name in value.__dataclass_fields__
+        }
+        size += sum(estimate_size(v, _seen) for v in fields.values())
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(v, _seen) for v in value)
+    elif hasattr(value, "__dict__") and not isinstance(value, type):
+        # Plain objects such as distinct_state.HyperLogLog (whose registers are a bytearray)
+        size += estimate_size(value.__dict__, _seen)
+    return size
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key: the first caller runs the function and
+    every caller that arrives while it is in flight blocks and receives the same result
+    (or exception) instead of starting its own ClickHouse query.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fn()
+            return flight.value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._flights),
+            }
+
+
+@dataclass
+class _Entry:
+    value: Any
+    size: int
+    fresh_until: float
+    stale_until: float
+    # Response bodies encoded from `value`, by response variant (see responses.cached_response)
+    encoded: Dict[Hashable, Tuple[bytes, Optional[str]]] = field(default_factory=dict)
+
+
+class TTLCache:
+    """
+    In-process LRU cache bounded by an estimated memory budget.
+
+    Entries are fresh for `ttl` seconds. For `stale_ttl` seconds after that they are still
+    returned, and the first stale read schedules a background recompute (stale-while-revalidate),
+    so hot keys never make a request wait on ClickHouse after the first load.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_bytes: int, single_flight: Optional[SingleFlight] = None, refresh_workers: int = 2):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._refreshing: Set[Hashable] = set()
+        # Misses and background refreshes for the same key share one computation
+        self.single_flight = single_flight or SingleFlight()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="cache-refresh")
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.encoded_hits = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any, bool]:
+        """Return (found, value, fresh)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.stale_until <= now:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None, False
+            self._entries.move_to_end(key)
+            if entry.fresh_until > now:
+                self.hits += 1
+                return True, entry.value, True
+            self.stale_hits += 1
+            return True, entry.value, False
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logger.info("Not caching %s: %d bytes exceeds the cache budget", key, size)
+            return
+        now = time.monotonic()
+        entry = _Entry(value=value, size=size, fresh_until=now + self.ttl, stale_until=now + self.ttl + self.stale_ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_encoded(self, key: Hashable, variant: Hashable) -> Optional[Tuple[bytes, Optional[str]]]:
+        """The encoded body stored for `variant` on the fresh entry of `key`, if any."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.fresh_until <= now:
+                return None
+            encoded = entry.encoded.get(variant)
+            if encoded is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.encoded_hits += 1
+            return encoded
+
+    def set_encoded(self, key: Hashable, value: Any, variant: Hashable, encoded: Tuple[bytes, Optional[str]]) -> None:
+        """
+        Store a body encoded from `value` on the entry of `key`, as long as the entry still
+        holds that very value; it goes away with the entry when it is refreshed or evicted.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.value is not value or variant in entry.encoded:
+                return
+            size = len(encoded[0])
+            if self._bytes + size > self.max_bytes:
+                return
+            entry.encoded[variant] = encoded
+            entry.size += size
+            self._bytes += size
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Serve `key` from the cache, computing (and caching) it on a miss. None results are
+        not cached: the fetch_* functions return None when a query fails (and [] only for
+        a list that is genuinely empty), so a failure is retried on the next call and a
+        background refresh that fails keeps the previous value.
+        """
+        found, value, fresh = self.get(key)
+        if found:
+            if not fresh:
+                self._revalidate(key, compute)
+            return value
+        return self.single_flight.do(key, lambda: self._compute_and_store(key, compute))
+
+    def _compute_and_store(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = compute()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def _revalidate(self, key: Hashable, compute: Callable[[], Any]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.single_flight.do(key, lambda: self._compute_and_store(key, compute))
+                self.refreshes += 1
+            except Exception as e:
+                logger.warning("Background refresh of %s failed: %s", key, e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_executor.submit(refresh)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "background_refreshes": self.refreshes,
+                "encoded_hits": self.encoded_hits,
+            }
+
+
+METRIC_SINGLE_FLIGHT = SingleFlight()
+
+RESULT_CACHE = TTLCache(
+    ttl=RESULT_CACHE_TTL_SECONDS,
+    stale_ttl=RESULT_CACHE_STALE_SECONDS,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    single_flight=METRIC_SINGLE_FLIGHT,
+)
+
+
+def cached_call(metric: str, node_id: str, start_date: Optional[str], end_date: Optional[str],
+                compute: Callable[[], Any], key_extra: Tuple[str, ...] = ()) -> Any:
+    """
+    Return compute() through RESULT_CACHE under the metric_cache_key of the arguments (plus
+    `key_extra` for any other parameter the result depends on), coalescing concurrent
+    identical calls even when the cache is disabled.
+    """
+    key = metric_cache_key(metric, os.getenv("ORG_ID"), node_id, start_date, end_date) + key_extra
+    with start_span(f"fetch {metric}", metric=metric, start_date=start_date, end_date=end_date) as span:
+        def run():
+            # Only set when this call runs the fetch (not a cache hit or a coalesced wait)
+            span.set_attribute("cache.computed", True)
+            with track_fetch(metric):
+                return compute()
+
+        if not RESULT_CACHE_ENABLED:
+            return METRIC_SINGLE_FLIGHT.do(key, run)
+        return RESULT_CACHE.get_or_compute(key, run)
+
+
+def cached_metric(metric: str, node_id: str):
+    """
+    Cache a fetch_*(start_date, end_date) function in RESULT_CACHE, keyed by
+    (metric, ORG_ID, node id, normalized start/end). Concurrent identical calls are
+    coalesced into one query even when the cache is disabled. The undecorated function
+    stays available as `.uncached`, and the cache key of a call as `.cache_key(start, end)`.
+    """
+    def decorator(fn: Callable[[Optional[str], Optional[str]], Any]):
+        @functools.wraps(fn)
+        def wrapper(start_date: Optional[str] = None, end_date: Optional[str] = None):
+            return cached_call(metric, node_id, start_date, end_date, lambda: fn(start_date, end_date))
+
+        wrapper.uncached = fn
+        wrapper.cache_key = lambda start_date=None, end_date=None: metric_cache_key(metric, os.getenv("ORG_ID"), node_id, start_date, end_date)
+        return wrapper
+    return decorator
@@ -0,0 +1,212 @@
+# clickhouse_pool.py
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+
+from clickhouse_connect.driver.exceptions import OperationalError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class _PooledConnection:
+    """A clickhouse-connect client plus the bookkeeping the pool needs for health checks."""
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        try:
+            self.client.close()
+        except Exception as e:
+            logger.warning("Error closing ClickHouse client: %s", e)
+
+
+class ClickHousePool:
+    """
+    Process-wide pool of ClickHouse clients.
+
+    Each client owns its own HTTP session (keep-alive connections), so reusing them avoids
+    re-reading the env config and paying a new TCP/TLS handshake for every metric.
+    A client is used by one query at a time; callers block when all `size` clients are busy.
+
+    The pool exposes the same `query()` method as a clickhouse-connect client, so it can be
+    passed anywhere a client is expected (e.g. `_json_each_row(pool, query)`).
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        size: int = 8,
+        healthcheck_interval: float = 30.0,
+        acquire_timeout: Optional[float] = None,
+    ):
+        if size < 1:
+            raise ValueError("ClickHouse pool size must be at least 1")
+        self.size = size
+        self.healthcheck_interval = healthcheck_interval
+        self.acquire_timeout = acquire_timeout
+        self._client_factory = client_factory
+        self._idle: List[_PooledConnection] = []
+        self._created = 0
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(size)
+        self._closed = False
+        self.rebuilds = 0
+
+    # ---- Checkout / checkin ----------------------------------------------------
+
+    def _acquire(self) -> _PooledConnection:
+        if not self._available.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(f"Timed out waiting for a ClickHouse connection (pool size {self.size})")
+        try:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("ClickHouse pool is closed")
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._create()
+            if time.monotonic() - conn.last_used > self.healthcheck_interval and not self._is_healthy(conn):
+                logger.warning("Idle ClickHouse connection failed health check, rebuilding it")
+                self._discard(conn)
+                self.rebuilds += 1
+                return self._create()
+            return conn
+        except BaseException:
+            self._available.release()
+            raise
+
+    def _release(self, conn: _PooledConnection) -> None:
+        conn.last_used = time.monotonic()
+        with self._lock:
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.append(conn)
+        self._available.release()
+
+    def _create(self) -> _PooledConnection:
+        client = self._client_factory()
+        with self._lock:
+            self._created += 1
+        return _PooledConnection(client)
+
+    def _discard(self, conn: _PooledConnection) -> None:
+        conn.close()
+        with self._lock:
+            self._created -= 1
+
+    @staticmethod
+    def _is_healthy(conn: _PooledConnection) -> bool:
+        try:
+            return bool(conn.client.ping())
+        except Exception:
+            return False
+
+    # ---- Client-compatible API -------------------------------------------------
+
+    def run(self, fn: Callable[[Any], Any]) -> Any:
+        """
+        Run `fn(client)` on a pooled client. If the connection is broken (OperationalError),
+        the client is thrown away and `fn` is retried once on a freshly built client.
+        """
+        conn = self._acquire()
+        for attempt in (1, 2):
+            try:
+                result = fn(conn.client)
+            except OperationalError as e:
+                self._discard(conn)
+                if attempt == 2:
+                    self._available.release()
+                    raise
+                logger.warning("ClickHouse connection error, rebuilding connection and retrying: %s", e)
+                self.rebuilds += 1
+                try:
+                    conn = self._create()
+                except BaseException:
+                    self._available.release()
+                    raise
+                continue
+            except BaseException:
+                self._release(conn)
+                raise
+            self._release(conn)
+            return result
+
+    def query(self, query: str, *args, **kwargs) -> Any:
+        return self.run(lambda client: client.query(query, *args, **kwargs))
+
+    def stream_rows(self, query: str, settings: Optional[dict] = None, parameters: Optional[dict] = None) -> Iterator[Sequence[Any]]:
+        """
+        Yield result rows as ClickHouse sends them, without materializing the result.
+        The client stays checked out until the generator is exhausted or closed. Unlike
+        run(), a broken connection is not retried since rows may already have been yielded.
+        """
+        conn = self._acquire()
+        try:
+            with conn.client.query_rows_stream(query, parameters=parameters, settings=settings or {}) as stream:
+                for row in stream:
+                    yield row
+        except OperationalError:
+            self._discard(conn)
+            self._available.release()
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        self._release(conn)
+
+    def ping(self) -> bool:
+        try:
+            return bool(self.run(lambda client: client.ping()))
+        except Exception:
+            return False
+
+    # ---- Lifecycle -------------------------------------------------------------
+
+    def warm(self, count: Optional[int] = None, validate: Optional[Callable[[Any], Any]] = None) -> int:
+        """
+        Open up to `count` (default: all) connections ahead of the first request. With
+        `validate`, `validate(client)` runs on each of them and a failure is raised after
+        the connections are returned to the pool.
+        """
+        target = self.size if count is None else min(count, self.size)
+        opened = []
+        try:
+            for _ in range(target):
+                opened.append(self._acquire())
+            if validate is not None:
+                for conn in opened:
+                    validate(conn.client)
+        finally:
+            for conn in opened:
+                self._release(conn)
+        return len(opened)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    @property
+    def in_use(self) -> int:
+        """Connections currently checked out, i.e. queries in flight."""
+        with self._lock:
+            return self._created - len(self._idle)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "idle": len(self._idle),
+                "in_use": self._created - len(self._idle),
+                "rebuilds": self.rebuilds,
+            }
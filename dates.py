@@ -0,0 +1,64 @@
+# dates.py
+
+from __future__ import annotations
+
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+# Range used when a request has no start/end date, matching the fetchers' "last 30 days"
+DEFAULT_RANGE_DAYS = 30
+
+# Request dates used to go to ClickHouse's parseDateTime64BestEffort as sent, so the forms it
+# read besides ISO 8601 are still accepted: YYYY/MM/DD or YYYY.MM.DD (with an optional
+# time), YYYYMMDD, Unix seconds (9-10 digits, optionally fractional) or milliseconds
+# (13 digits), and RFC 1123 ("Sat, 01 Nov 2025 00:00:00 GMT")
+_SEPARATED_DATE = re.compile(r"^(\d{4})[/.](\d{1,2})[/.](\d{1,2})(.*)$")
+_COMPACT_DATE = re.compile(r"^\d{8}$")
+_UNIX_SECONDS = re.compile(r"^\d{9,10}(\.\d+)?$")
+_UNIX_MILLISECONDS = re.compile(r"^\d{13}$")
+
+
+class InvalidDateError(ValueError):
+    pass
+
+
+def _to_naive_utc(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def parse_utc(value: str) -> datetime:
+    """
+    Parse a start/end date into a naive UTC datetime (naive input is taken as UTC).
+    Raises InvalidDateError (a ValueError) for anything not in one of the forms above.
+    """
+    text = value.strip()
+    if _UNIX_SECONDS.match(text):
+        return datetime.fromtimestamp(float(text), timezone.utc).replace(tzinfo=None)
+    if _UNIX_MILLISECONDS.match(text):
+        return datetime.fromtimestamp(int(text) / 1000, timezone.utc).replace(tzinfo=None)
+    if _COMPACT_DATE.match(text):
+        text = f"{text[:4]}-{text[4:6]}-{text[6:]}"
+    separated = _SEPARATED_DATE.match(text)
+    if separated:
+        year, month, day, rest = separated.groups()
+        text = f"{year}-{int(month):02d}-{int(day):02d}{rest}"
+    try:
+        return _to_naive_utc(datetime.fromisoformat(text.replace(" ", "T", 1).replace("Z", "+00:00")))
+    except ValueError:
+        pass
+    try:
+        return _to_naive_utc(parsedate_to_datetime(text))
+    except (TypeError, ValueError):
+        raise InvalidDateError(
+            f"Invalid date {value!r}, expected ISO 8601 (2025-11-01T00:00:00Z), YYYY/MM/DD or Unix seconds"
+        ) from None
+
+
+def resolve_range(start_date: Optional[str], end_date: Optional[str], now: datetime) -> Tuple[datetime, datetime]:
+    if not start_date or not end_date:
+        return now - timedelta(days=DEFAULT_RANGE_DAYS), now
+    return parse_utc(start_date), parse_utc(end_date)
@@ -5,17 +5,29 @@ from __future__ import annotations
 import os
 import sys
 import logging
-from dataclasses import dataclass, field
-from typing import List, Optional, Tuple, Dict, Any
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import List, Optional, Tuple, Dict, Any, Iterator, Union
 
 # pip install clickhouse-connect python-dateutil pytz
 import clickhouse_connect
 
-# If you already have your own utilities, import them instead of these stubs:
-# from timezone_utils import get_time_filter, format_timestamp_for_display
-from datetime import datetime, timedelta, timezone
-
-from queries import carrier_asked_transfer_over_total_transfer_attempt_stats_query, carrier_asked_transfer_over_total_call_attempts_stats_query, calls_ending_in_each_call_stage_stats_query, load_not_found_stats_query, load_status_stats_query, successfully_transferred_for_booking_stats_query, call_classifcation_stats_query, carrier_qualification_stats_query, pricing_stats_query, carrier_end_state_query, percent_non_convertible_calls_query, number_of_unique_loads_query, list_of_unique_loads_query, number_of_unique_loads_query_broker_node, list_of_unique_loads_query_broker_node, calls_without_carrier_asked_for_transfer_query, total_calls_and_total_duration_query, duration_carrier_asked_for_transfer_query
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from aggregate_store import AGGREGATE_STORE_ENABLED, DAY_AGGREGATE_STORE, DaySegment, contiguous_ranges, merge_partials, plan_days
+from cache import cached_call, cached_metric, normalize_date
+from dates import parse_utc, resolve_range
+from distinct_state import UNIQUE_LOADS_COUNT_MODE, UNIQUE_LOADS_HLL_PRECISION, HyperLogLog, UniqueLoadsState, empty_state, merge_states
+from clickhouse_pool import ClickHousePool
+from executor import fan_out
+from prometheus import observe_query, observe_query_error
+from tracing import SPAN_KIND_CLIENT, child_span, end_span, query_settings_with_id, start_span
+from query_settings import plan_query_settings
+from snapshot_store import WEEK_SNAPSHOTS, WEEK_SNAPSHOTS_ENABLED, WEEK_SNAPSHOT_TIMEZONES, match_week, week_bounds
+from query_templates import ORG_ID, BoundQuery, QueryTemplate, range_filter, render, segments_filter
+from queries import carrier_asked_transfer_over_total_transfer_attempt_stats_query, carrier_asked_transfer_over_total_call_attempts_stats_query, calls_ending_in_each_call_stage_stats_query, load_not_found_stats_query, load_status_stats_query, successfully_transferred_for_booking_stats_query, call_classifcation_stats_query, carrier_qualification_stats_query, pricing_stats_query, carrier_end_state_query, percent_non_convertible_calls_query, number_of_unique_loads_query, list_of_unique_loads_query, number_of_unique_loads_query_broker_node, list_of_unique_loads_query_broker_node, calls_without_carrier_asked_for_transfer_query, total_calls_and_total_duration_query, duration_carrier_asked_for_transfer_query, all_stats_fused_query, unique_load_states_by_day_query, number_of_unique_loads_across_cutoff_query, list_of_unique_loads_across_cutoff_query
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -99,6 +111,67 @@ def get_clickhouse_client():
     )
 
 
+# ---- Client pool -------------------------------------------------------------
+
+_client_pool: Optional[ClickHousePool] = None
+_client_pool_lock = threading.Lock()
+
+
+def init_client_pool() -> ClickHousePool:
+    """
+    Create the process-wide ClickHouse client pool (called once at app startup).
+    Configured with:
+    - CLICKHOUSE_POOL_SIZE (number of clients, default 8)
+    - CLICKHOUSE_POOL_HEALTHCHECK_SECONDS (ping clients idle longer than this, default 30)
+    - CLICKHOUSE_POOL_ACQUIRE_TIMEOUT (seconds to wait for a free client, default 60)
+    """
+    global _client_pool
+    with _client_pool_lock:
+        if _client_pool is None:
+            size = int(os.getenv("CLICKHOUSE_POOL_SIZE", "8"))
+            _client_pool = ClickHousePool(
+                # Looked up at call time so tests/benchmarks can swap get_clickhouse_client
+                client_factory=lambda: get_clickhouse_client(),
+                size=size,
+                healthcheck_interval=float(os.getenv("CLICKHOUSE_POOL_HEALTHCHECK_SECONDS", "30")),
+                acquire_timeout=float(os.getenv("CLICKHOUSE_POOL_ACQUIRE_TIMEOUT", "60")),
+            )
+            logger.info("Created ClickHouse client pool with size=%d", size)
+        return _client_pool
+
+
+def get_client_pool() -> ClickHousePool:
+    """Return the shared pool, creating it on first use if startup did not."""
+    return _client_pool or init_client_pool()
+
+
+# Tables every metric query reads; checked once at startup (see warmup.py)
+REQUIRED_TABLES = ("public_runs", "public_sessions", "public_node_outputs", "public_nodes")
+REQUIRED_TABLES_SQL = "SELECT name FROM system.tables WHERE database = currentDatabase() AND name IN {tables:Array(String)}"
+
+
+def check_tables(client) -> None:
+    """Raise if the ClickHouse database lacks one of REQUIRED_TABLES."""
+    found = set(_query_columns(client, BoundQuery(REQUIRED_TABLES_SQL, {"tables": list(REQUIRED_TABLES)})).column("name"))
+    missing = [name for name in REQUIRED_TABLES if name not in found]
+    if missing:
+        raise RuntimeError(f"ClickHouse database is missing tables: {', '.join(missing)}")
+
+
+def client_pool_stats() -> Dict[str, Any]:
+    """Pool counters without opening the pool if no request has used it yet."""
+    pool = _client_pool
+    return pool.stats() if pool is not None else {}
+
+
+def close_client_pool() -> None:
+    global _client_pool
+    with _client_pool_lock:
+        if _client_pool is not None:
+            _client_pool.close()
+            _client_pool = None
+
+
 # ---- Env helpers -------------------------------------------------------------
 
 def get_org_id() -> Optional[str]:
@@ -114,15 +187,27 @@ def get_org_id() -> Optional[str]:
     return org_id
 
 
-# ---- Timezone utilities (stubs) ---------------------------------------------
-# Replace these two with your real implementations if you already have them.
+# ---- Timezone utilities ------------------------------------------------------
+
+def get_zone(tz_name: Optional[str]) -> ZoneInfo:
+    """The IANA timezone `tz_name` (UTC when empty); raises ValueError for an unknown name."""
+    try:
+        return ZoneInfo(tz_name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        raise ValueError(f"Unknown timezone {tz_name!r}") from e
+
 
 def get_time_filter(time_range: str, tz_name: str = "UTC") -> Tuple[str, str]:
     """
     Given a human range (e.g., 'last_30_days', 'today', 'yesterday', 'last_7_days'),
-    return ISO time strings suitable for parseDateTime64BestEffort in ClickHouse.
+    return ISO time strings with UTC offsets; 'today' and 'yesterday' start at midnight
+    in `tz_name` (an unknown name falls back to UTC).
     """
-    tzinfo = timezone.utc  # Simplified; swap for zoneinfo if you need real TZ handling
+    try:
+        tzinfo = get_zone(tz_name)
+    except ValueError as e:
+        logger.warning("%s, using UTC", e)
+        tzinfo = get_zone("UTC")
     now = datetime.now(tzinfo)
 
     def iso(dt: datetime) -> str:
@@ -137,11 +222,12 @@ def get_time_filter(time_range: str, tz_name: str = "UTC") -> Tuple[str, str]:
         start = now - timedelta(days=7)
         end = now
     elif tr in ("today",):
-        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        end = start + timedelta(days=1)
+        # Midnights are rebuilt from the local date so a DST change inside the day is respected
+        start = datetime.combine(now.date(), datetime.min.time(), tzinfo)
+        end = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo)
     elif tr in ("yesterday",):
-        end = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        start = end - timedelta(days=1)
+        start = datetime.combine(now.date() - timedelta(days=1), datetime.min.time(), tzinfo)
+        end = datetime.combine(now.date(), datetime.min.time(), tzinfo)
     else:
         # Default: last 30 days
         start = now - timedelta(days=30)
@@ -169,100 +255,156 @@ def format_timestamp_for_display(ts: str, tz_name: str = "UTC") -> str:
 PEPSI_BROKER_NODE_ID = "01999d78-d321-7db5-ae1f-ebfddc2bff11"
 PEPSI_FBR_NODE_ID = "0199f2f5-ec8f-73e4-898b-09a2286e240e"
 
-# ClickHouse query settings for large date ranges
+# ClickHouse query settings for large date ranges; per-query values are planned below these
+# ceilings (see query_settings.py)
 CLICKHOUSE_QUERY_SETTINGS = {
     "max_execution_time": 180,  # Increased from 60 to 180 seconds
     "max_memory_usage": 10_000_000_000,  # Increased from 2GB to 10GB
     "max_threads": 16,  # Increased from 4 to 16 threads
 }
+# Queries are sent as fixed templates with bound parameters, so repeated dashboard queries
+# can be answered from the server's query cache (ClickHouse 23.5+)
+if os.getenv("CLICKHOUSE_USE_QUERY_CACHE", "false").lower() in ("true", "1", "yes"):
+    CLICKHOUSE_QUERY_SETTINGS["use_query_cache"] = 1
 
 # Cutoff date for switching between broker_node and FBR queries
 # Dates BEFORE Nov 7, 2025 (i.e., Nov 6, 2025 and earlier) use broker_node queries
 # Dates Nov 7, 2025 and AFTER use FBR (find by reference) queries
 UNIQUE_LOADS_CUTOFF_DATE = "2025-11-07T00:00:00"
+# Unique-load metrics read both nodes (split at the cutoff above)
+UNIQUE_LOADS_NODE_IDS = f"{PEPSI_BROKER_NODE_ID},{PEPSI_FBR_NODE_ID}"
+
+# ---- Query templates ---------------------------------------------------------
+# Rendered once at import; requests only bind start/end/org_id (see query_templates.py)
+
+CALLS_ENDING_IN_EACH_CALL_STAGE_STATS_TEMPLATE = QueryTemplate(calls_ending_in_each_call_stage_stats_query, PEPSI_BROKER_NODE_ID)
+CARRIER_ASKED_TRANSFER_OVER_TOTAL_TRANSFER_ATTEMPT_STATS_TEMPLATE = QueryTemplate(carrier_asked_transfer_over_total_transfer_attempt_stats_query, PEPSI_BROKER_NODE_ID)
+CARRIER_ASKED_TRANSFER_OVER_TOTAL_CALL_ATTEMPTS_STATS_TEMPLATE = QueryTemplate(carrier_asked_transfer_over_total_call_attempts_stats_query, PEPSI_BROKER_NODE_ID)
+LOAD_NOT_FOUND_STATS_TEMPLATE = QueryTemplate(load_not_found_stats_query, PEPSI_BROKER_NODE_ID)
+LOAD_STATUS_STATS_TEMPLATE = QueryTemplate(load_status_stats_query, PEPSI_BROKER_NODE_ID)
+SUCCESSFULLY_TRANSFERRED_FOR_BOOKING_STATS_TEMPLATE = QueryTemplate(successfully_transferred_for_booking_stats_query, PEPSI_BROKER_NODE_ID)
+CALL_CLASSIFCATION_STATS_TEMPLATE = QueryTemplate(call_classifcation_stats_query, PEPSI_BROKER_NODE_ID)
+CARRIER_QUALIFICATION_STATS_TEMPLATE = QueryTemplate(carrier_qualification_stats_query, PEPSI_BROKER_NODE_ID)
+PRICING_STATS_TEMPLATE = QueryTemplate(pricing_stats_query, PEPSI_BROKER_NODE_ID)
+CARRIER_END_STATE_TEMPLATE = QueryTemplate(carrier_end_state_query, PEPSI_BROKER_NODE_ID)
+PERCENT_NON_CONVERTIBLE_CALLS_TEMPLATE = QueryTemplate(percent_non_convertible_calls_query, PEPSI_BROKER_NODE_ID)
+NUMBER_OF_UNIQUE_LOADS_TEMPLATE = QueryTemplate(number_of_unique_loads_query, PEPSI_FBR_NODE_ID)
+CALLS_WITHOUT_CARRIER_ASKED_FOR_TRANSFER_TEMPLATE = QueryTemplate(calls_without_carrier_asked_for_transfer_query, PEPSI_BROKER_NODE_ID)
+TOTAL_CALLS_AND_TOTAL_DURATION_TEMPLATE = QueryTemplate(total_calls_and_total_duration_query, PEPSI_BROKER_NODE_ID)
+DURATION_CARRIER_ASKED_FOR_TRANSFER_TEMPLATE = QueryTemplate(duration_carrier_asked_for_transfer_query, PEPSI_BROKER_NODE_ID)
+ALL_STATS_FUSED_TEMPLATE = QueryTemplate(all_stats_fused_query, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID, UNIQUE_LOADS_CUTOFF_DATE)
+# /timeseries: the fused query grouped by day or week ({tz:String} bound per request)
+TIMESERIES_BUCKETS = ("day", "week")
+ALL_STATS_TIMESERIES_TEMPLATES = {
+    bucket: QueryTemplate(all_stats_fused_query, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID, UNIQUE_LOADS_CUTOFF_DATE, bucket=bucket)
+    for bucket in TIMESERIES_BUCKETS
+}
+# Buckets covered when no start_date/end_date is given: the current one and those before it
+TIMESERIES_DEFAULT_BUCKETS = {"day": 30, "week": 12}
+NUMBER_OF_UNIQUE_LOADS_BROKER_NODE_TEMPLATE = QueryTemplate(number_of_unique_loads_query_broker_node, PEPSI_BROKER_NODE_ID)
+LIST_OF_UNIQUE_LOADS_TEMPLATE = QueryTemplate(list_of_unique_loads_query, PEPSI_FBR_NODE_ID)
+LIST_OF_UNIQUE_LOADS_BROKER_NODE_TEMPLATE = QueryTemplate(list_of_unique_loads_query_broker_node, PEPSI_BROKER_NODE_ID)
+
+_ACROSS_CUTOFF_FILTERS = (range_filter("broker_start", "broker_end"), range_filter("fbr_start", "fbr_end"))
+NUMBER_OF_UNIQUE_LOADS_ACROSS_CUTOFF_SQL = render(number_of_unique_loads_across_cutoff_query, *_ACROSS_CUTOFF_FILTERS, ORG_ID, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID)
+LIST_OF_UNIQUE_LOADS_ACROSS_CUTOFF_SQL = render(list_of_unique_loads_across_cutoff_query, *_ACROSS_CUTOFF_FILTERS, ORG_ID, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID)
+
+# The fused query over several (possibly overlapping) ranges at once, grouped by range index
+ALL_STATS_MULTI_RANGE_SQL = render(all_stats_fused_query, segments_filter(), ORG_ID, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID, UNIQUE_LOADS_CUTOFF_DATE, bucket="range")
+
+# Per-day variants read an arbitrary set of day segments (the ones missing from the aggregate store)
+ALL_STATS_BY_DAY_SQL = render(all_stats_fused_query, segments_filter(), ORG_ID, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID, UNIQUE_LOADS_CUTOFF_DATE, by_day=True)
+UNIQUE_LOAD_STATES_BY_DAY_SQL = {
+    mode: render(unique_load_states_by_day_query, segments_filter(), ORG_ID, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID, UNIQUE_LOADS_CUTOFF_DATE,
+                 mode=mode, hll_precision=UNIQUE_LOADS_HLL_PRECISION)
+    for mode in ("exact", "hll", "ids")
+}
 
 # ---- Data models -------------------------------------------------------------
 
-@dataclass
+# Results are immutable and slotted: cached instances are shared by every request (and
+# encoded as-is by orjson, see serializers.py), and slots keep the per-row objects small.
+
+@dataclass(frozen=True, slots=True)
 class TransferStats:
     call_stage: str
     count: int
     percentage: float
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CarrierTransferStatsTotalTransferAttempts:
     carrier_asked_count: int
     total_transfer_attempts: int
     carrier_asked_percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CarrierTransferStatsTotalCallAttempts:
     carrier_asked_count: int
     total_call_attempts: int
     carrier_asked_percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LoadNotFoundStats:
     load_not_found_count: int
     total_calls: int
     load_not_found_percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class LoadStatusStats:
     load_status: str
     count: int
     total_calls: int
     load_status_percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SuccessfullyTransferredForBooking:
     successfully_transferred_for_booking_count: int
     total_calls: int
     successfully_transferred_for_booking_percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CallClassificationStats:
     call_classification: str
     count: int
     percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CarrierQualificationStats:
     carrier_qualification: str
     count: int
     percentage: float
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PricingStats:
     pricing_notes: str
     count: int
     percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CarrierEndStateStats:
     carrier_end_state: str
     count: int
     percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PercentNonConvertibleCallsStats:
     non_convertible_calls_count: int
     total_calls_count: int
     non_convertible_calls_percentage: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class NumberOfUniqueLoadsStats:
     number_of_unique_loads: int
     total_calls: int
     calls_per_unique_load: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ListOfUniqueLoadsStats:
     list_of_unique_loads: List[str]
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CallsWithoutCarrierAskedForTransferStats:
     non_convertible_calls_count: int
     non_convertible_calls_duration: int
@@ -286,16 +428,38 @@ class CallsWithoutCarrierAskedForTransferStats:
     carrier_cannot_see_reference_number_count: int
     caller_put_on_hold_assistant_hung_up_count: int
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class TotalCallsAndTotalDurationStats:
     total_duration: int
     total_calls: int
     avg_minutes_per_call: float
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class DurationCarrierAskedForTransferStats:
     duration_carrier_asked_for_transfer: int
 
+@dataclass(frozen=True, slots=True)
+class AllStats:
+    # One field per /all-stats section, holding what the matching fetch_* function returns
+    call_stage_stats: List[TransferStats] = field(default_factory=list)
+    carrier_asked_transfer_over_total_transfer_attempts: Optional[CarrierTransferStatsTotalTransferAttempts] = None
+    carrier_asked_transfer_over_total_call_attempts: Optional[CarrierTransferStatsTotalCallAttempts] = None
+    load_not_found: Optional[LoadNotFoundStats] = None
+    load_status: Optional[List[LoadStatusStats]] = None
+    successfully_transferred_for_booking: Optional[SuccessfullyTransferredForBooking] = None
+    call_classification: Optional[List[CallClassificationStats]] = None
+    carrier_qualification: Optional[List[CarrierQualificationStats]] = None
+    pricing: Optional[List[PricingStats]] = None
+    carrier_end_state: Optional[List[CarrierEndStateStats]] = None
+    percent_non_convertible_calls: Optional[PercentNonConvertibleCallsStats] = None
+    number_of_unique_loads: Optional[NumberOfUniqueLoadsStats] = None
+
+@dataclass(frozen=True, slots=True)
+class TimeSeriesBucket:
+    # start: local date (ISO) of the bucket's first day in the requested timezone
+    start: str
+    stats: AllStats
+
 @dataclass
 class PepsiRecord:
     runId: str
@@ -320,66 +484,96 @@ class PepsiData:
     carrierTransferStats: Optional[CarrierTransferStatsTotalTransferAttempts] = None
     carrierCallAttemptsStats: Optional[CarrierTransferStatsTotalCallAttempts] = None
     loadNotFoundStats: Optional[LoadNotFoundStats] = None
+    loadStatusStats: Optional[List[LoadStatusStats]] = None
+    successfullyTransferredForBookingStats: Optional[SuccessfullyTransferredForBooking] = None
 
 
 # ---- Queries ----------------------------------------------------------------
 
-def _json_each_row(client, query: str, settings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+@dataclass
+class ColumnarResult:
     """
-    Run a query and return rows as list[dict], similar to JSONEachRow.
-    clickhouse-connect already returns rows as python types; but to match the TS behavior,
-    we'll get column names and recompose dicts.
+    A query result kept as columns (one list per column, as clickhouse-connect decodes the
+    Native format), with the column names and types resolved once per query.
     """
-    rs = client.query(query, settings=settings or {})
-    
-    # Get column names - handle different clickhouse-connect API versions
-    # The error suggests rs.result_set might be a list, so check that first
-    cols = None
-    
-    # Method 1: Check if rs has column_names directly
-    if hasattr(rs, 'column_names'):
-        cols = rs.column_names
-    # Method 2: Check if rs has columns_with_types directly  
-    elif hasattr(rs, 'columns_with_types'):
-        cols_data = rs.columns_with_types
-        if isinstance(cols_data, list):
-            cols = [c[0] if isinstance(c, (list, tuple)) else str(c) for c in cols_data]
-        else:
-            cols = [c[0] for c in cols_data]
-    # Method 3: Check result_set, but handle the case where it's a list
-    elif hasattr(rs, 'result_set'):
-        result_set = rs.result_set
-        if isinstance(result_set, list):
-            # result_set is a list, not an object - try to get columns from rs itself
-            # This might be the actual rows, so skip this path
-            pass
-        elif hasattr(result_set, 'column_names'):
-            cols = result_set.column_names
-        elif hasattr(result_set, 'columns_with_types'):
-            cols_data = result_set.columns_with_types
-            if isinstance(cols_data, list):
-                cols = [c[0] if isinstance(c, (list, tuple)) else str(c) for c in cols_data]
+    column_names: Tuple[str, ...]
+    column_types: Tuple[Any, ...]
+    columns: List[List[Any]]
+    index: Dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.index = {name: i for i, name in enumerate(self.column_names)}
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name: str) -> List[Any]:
+        """The named column, or a column of None if the query did not return it."""
+        i = self.index.get(name)
+        return self.columns[i] if i is not None else [None] * len(self)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [dict(zip(self.column_names, row)) for row in zip(*self.columns)]
+
+
+def _query_columns(client, query: Union[str, BoundQuery], settings: Optional[Dict[str, Any]] = None) -> ColumnarResult:
+    """Run a query and return its result column-wise, without building a Python object per row."""
+    with start_span("clickhouse.query", SPAN_KIND_CLIENT, **{"db.system": "clickhouse"}) as span:
+        settings = query_settings_with_id(span, settings)
+        span.set_attribute("db.clickhouse.query_id", settings["query_id"])
+        started = time.perf_counter()
+        try:
+            if isinstance(query, BoundQuery):
+                rs = client.query(query.sql, parameters=query.parameters, settings=settings, column_oriented=True)
             else:
-                cols = [c[0] for c in cols_data]
-    
-    # Method 4: Try to get column names from query result metadata
-    if cols is None and hasattr(rs, 'names'):
-        cols = rs.names
-    
-    # Method 5: Last resort - infer from result_rows structure
-    if cols is None:
-        if rs.result_rows:
-            num_cols = len(rs.result_rows[0]) if rs.result_rows else 0
-            # Try to get column names from the query itself or use generic names
-            cols = [f"column_{i}" for i in range(num_cols)]
-            logger.warning(f"Could not determine column names, using generic names: {cols}")
-        else:
-            cols = []
-    
-    out = []
-    for row in rs.result_rows:
-        out.append({col: row[i] for i, col in enumerate(cols)})
-    return out
+                rs = client.query(query, settings=settings, column_oriented=True)
+        except Exception:
+            observe_query_error()
+            raise
+        summary = getattr(rs, "summary", None)
+        observe_query(time.perf_counter() - started, summary)
+        if summary:
+            span.set_attribute("db.clickhouse.read_rows", summary.get("read_rows"))
+            span.set_attribute("db.clickhouse.read_bytes", summary.get("read_bytes"))
+    return ColumnarResult(
+        column_names=tuple(rs.column_names),
+        column_types=tuple(getattr(rs, "column_types", ())),
+        columns=rs.result_columns,
+    )
+
+
+def _text_column(values: List[Any], default: str = "Unknown") -> List[str]:
+    return [str(v) if v else default for v in values]
+
+
+def _int_column(values: List[Any]) -> List[int]:
+    return [int(v or 0) for v in values]
+
+
+def _float_column(values: List[Any]) -> List[float]:
+    return [float(v or 0.0) for v in values]
+
+
+def _json_each_row(client, query: Union[str, BoundQuery], settings: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Run a query and return rows as list[dict], similar to JSONEachRow. Fine for the small
+    single-row results; large results should stay columnar (see _query_columns).
+    """
+    return _query_columns(client, query, settings=settings).to_dicts()
+
+
+def _query_settings(profile: str, start_date: Optional[str], end_date: Optional[str]) -> Dict[str, Any]:
+    """Settings for a `profile` query (see query_settings.QUERY_PROFILES) over the requested range."""
+    start, end = resolve_range(start_date, end_date, datetime.now(timezone.utc).replace(tzinfo=None))
+    # +1: this query has not checked out its connection yet
+    in_flight = get_client_pool().in_use + 1
+    return plan_query_settings(profile, (end - start).total_seconds() / 86400, in_flight, CLICKHOUSE_QUERY_SETTINGS)
+
+
+def _segments_query_settings(profile: str, segments: List[DaySegment]) -> Dict[str, Any]:
+    """Like _query_settings, sized by the days actually fetched rather than the whole request."""
+    range_days = sum((seg.end - seg.start).total_seconds() for seg in segments) / 86400
+    return plan_query_settings(profile, range_days, get_client_pool().in_use + 1, CLICKHOUSE_QUERY_SETTINGS)
 
 
 def get_pepsi_data_optimized(start_date: str, end_date: str, timezone_name: str = "UTC") -> List[PepsiRecord]:
@@ -387,17 +581,16 @@ def get_pepsi_data_optimized(start_date: str, end_date: str, timezone_name: str
     Placeholder fetch (mirrors the TS placeholder). Replace with your real query once your schema is set.
     """
     try:
-        client = get_clickhouse_client()
-        query = f"""
+        client = get_client_pool()
+        query = BoundQuery(f"""
             SELECT
                 run_id,
                 timestamp
             FROM public_node_outputs_kv
-            WHERE timestamp >= parseDateTime64BestEffort('{start_date}')
-              AND timestamp <  parseDateTime64BestEffort('{end_date}')
+            WHERE {range_filter()}
             ORDER BY timestamp DESC
             LIMIT 1000
-        """
+        """, {"start": parse_utc(start_date), "end": parse_utc(end_date)})
         rows = _json_each_row(client, query)
 
         records = [
@@ -417,19 +610,14 @@ def get_pepsi_data_optimized(start_date: str, end_date: str, timezone_name: str
         return []
 
 
-def fetch_calls_ending_in_each_call_stage_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[TransferStats]:
+@cached_metric("call_stage_stats", PEPSI_BROKER_NODE_ID)
+def fetch_calls_ending_in_each_call_stage_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[List[TransferStats]]:
     org_id = get_org_id()
     if not org_id:
         logger.error("❌ ORG_ID not found in environment variables. Please check your .env and restart the app.")
-        return []
+        return None
 
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
-
         if start_date and end_date:
             logger.info("Fetching call stage stats for date range: %s to %s", start_date, end_date)
         else:
@@ -438,115 +626,29 @@ def fetch_calls_ending_in_each_call_stage_stats(start_date: Optional[str] = None
         logger.info("Using ORG_ID: %s...", org_id[:8])
         logger.info("Using node_persistent_id: %s", PEPSI_BROKER_NODE_ID)
 
-        query = calls_ending_in_each_call_stage_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = CALLS_ENDING_IN_EACH_CALL_STAGE_STATS_TEMPLATE.bind(start_date, end_date, org_id)
 
-        client = get_clickhouse_client()
-        rows = _json_each_row(
-            client,
-            query,
-            settings=CLICKHOUSE_QUERY_SETTINGS,
-        )
+        client = get_client_pool()
+        result = _query_columns(client, query, settings=_query_settings("breakdown", start_date, end_date))
 
-        logger.info("Call stage stats query result: %d rows", len(rows))
-        if not rows:
-            logger.info("⚠️ No call stage stats found. Running diagnostic query...")
-
-            diag_query = f"""
-                SELECT
-                    COUNT(*) AS total_nodes,
-                    COUNT(DISTINCT no.run_id) AS unique_runs
-                FROM public_node_outputs no
-                INNER JOIN public_nodes n ON no.node_id = n.id
-                WHERE n.org_id = '{org_id}'
-                  AND no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}'
-                LIMIT 1
-            """
-            diag_rows = _json_each_row(client, diag_query)
-
-            if diag_rows:
-                dr = diag_rows[0]
-                logger.info("📊 Diagnostic results:")
-                logger.info("  - Total node outputs for this ORG_ID and node: %s", dr.get("total_nodes"))
-                logger.info("  - Unique runs: %s", dr.get("unique_runs"))
-
-                if int(dr.get("total_nodes", 0)) == 0:
-                    logger.info("  ❌ No data found for this ORG_ID and node_persistent_id combination")
-                    logger.info("  💡 Verify ORG_ID (%s...) and node_persistent_id (%s)", org_id[:8], PEPSI_BROKER_NODE_ID)
-                else:
-                    logger.info("  ✓ Data exists! Checking date range and JSON structure...")
-
-                    date_check_query = f"""
-                        SELECT
-                            MIN(r.timestamp) AS earliest_run,
-                            MAX(r.timestamp) AS latest_run,
-                            COUNT(*) AS run_count
-                        FROM public_runs r
-                        INNER JOIN public_node_outputs no ON no.run_id = r.id
-                        INNER JOIN public_nodes n ON no.node_id = n.id
-                        WHERE n.org_id = '{org_id}'
-                          AND no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}'
-                        LIMIT 1
-                    """
-                    try:
-                        date_rows = _json_each_row(client, date_check_query)
-                        if date_rows:
-                            d = date_rows[0]
-                            logger.info("  📅 Actual run dates:")
-                            logger.info("     - Earliest: %s", d.get("earliest_run"))
-                            logger.info("     - Latest:   %s", d.get("latest_run"))
-                            logger.info("     - Query range: %s to %s", start_date, end_date)
-
-                            if start_date and end_date and d.get("earliest_run") and d.get("latest_run"):
-                                earliest = datetime.fromisoformat(str(d["earliest_run"]).replace(" ", "T"))
-                                latest = datetime.fromisoformat(str(d["latest_run"]).replace(" ", "T"))
-                                qstart = datetime.fromisoformat(start_date.replace(" ", "T"))
-                                qend = datetime.fromisoformat(end_date.replace(" ", "T"))
-                                if latest < qstart or earliest > qend:
-                                    logger.info("  ❌ Date range mismatch! Data exists outside the query range.")
-                    except Exception as e:
-                        logger.exception("Error running date check: %s", e)
-
-                    json_check_query = f"""
-                        SELECT
-                            JSONHas(flat_data, 'result', 'call', 'call_stage') AS has_nested_path,
-                            JSONHas(flat_data, 'result.call.call_stage')       AS has_dot_path,
-                            JSONExtractString(flat_data, 'result', 'call', 'call_stage') AS nested_value,
-                            JSONExtractString(flat_data, 'result.call.call_stage')       AS dot_value
-                        FROM public_node_outputs no
-                        INNER JOIN public_nodes n ON no.node_id = n.id
-                        WHERE n.org_id = '{org_id}'
-                          AND no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}'
-                          AND flat_data IS NOT NULL
-                        LIMIT 5
-                    """
-                    try:
-                        json_rows = _json_each_row(client, json_check_query)
-                        if json_rows:
-                            logger.info("  🔍 JSON structure check (sample of 5 rows):")
-                            for idx, row in enumerate(json_rows, 1):
-                                logger.info("     Row %d:", idx)
-                                logger.info("       - Has nested path: %s", row.get("has_nested_path"))
-                                logger.info("       - Has dot path:    %s", row.get("has_dot_path"))
-                                nested_val = str(row.get("nested_value") or "")[:50] or "null"
-                                dot_val = str(row.get("dot_value") or "")[:50] or "null"
-                                logger.info("       - Nested value: %s", nested_val)
-                                logger.info("       - Dot value:    %s", dot_val)
-                    except Exception as e:
-                        logger.exception("Error running JSON structure check: %s", e)
+        logger.info("Call stage stats query result: %d rows", len(result))
+        if not result:
+            logger.info("⚠️ No call stage stats found. See /diagnostics/call-stage for node coverage and JSON paths")
 
         return [
-            TransferStats(
-                call_stage=str(r.get("call_stage") or "Unknown"),
-                count=int(r.get("count", 0)),
-                percentage=float(r.get("percentage", 0.0)),
+            TransferStats(call_stage=call_stage, count=count, percentage=percentage)
+            for call_stage, count, percentage in zip(
+                _text_column(result.column("call_stage")),
+                _int_column(result.column("count")),
+                _float_column(result.column("percentage")),
             )
-            for r in rows
         ]
     except Exception as e:
         logger.exception("Error fetching call stage stats: %s", e)
-        return []
+        return None
 
 
+@cached_metric("carrier_asked_transfer_over_total_transfer_attempts", PEPSI_BROKER_NODE_ID)
 def fetch_carrier_asked_transfer_over_total_transfer_attempts_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[CarrierTransferStats]:
     org_id = get_org_id()
     if not org_id:
@@ -554,75 +656,20 @@ def fetch_carrier_asked_transfer_over_total_transfer_attempts_stats(start_date:
         return None
 
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
-
         if start_date and end_date:
             logger.info("Fetching carrier transfer stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching carrier transfer stats for last 30 days (no date range provided)")
 
-        query = carrier_asked_transfer_over_total_transfer_attempt_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = CARRIER_ASKED_TRANSFER_OVER_TOTAL_TRANSFER_ATTEMPT_STATS_TEMPLATE.bind(start_date, end_date, org_id)
 
-        client = get_clickhouse_client()
-        
-        
-        # Also show all unique transfer_attempt values
-        values_query = f"""
-            WITH recent_runs AS (
-                SELECT id AS run_id
-                FROM public_runs
-                WHERE {date_filter}
-            )
-            SELECT
-                JSONExtractString(no.flat_data, 'result.transfer.transfer_attempt') AS transfer_attempt,
-                COUNT(*) AS count
-            FROM public_node_outputs no
-            INNER JOIN recent_runs rr ON no.run_id = rr.run_id
-            INNER JOIN public_nodes n ON no.node_id = n.id
-            WHERE n.org_id = '{org_id}'
-              AND no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}'
-              AND JSONHas(no.flat_data, 'result.transfer.transfer_reason') = 1
-              AND JSONExtractString(no.flat_data, 'result.transfer.transfer_reason') != ''
-              AND JSONExtractString(no.flat_data, 'result.transfer.transfer_reason') != 'null'
-            GROUP BY transfer_attempt
-            ORDER BY count DESC
-        """
-        try:
-            print("[DEBUG] Running values query to check transfer_attempt values...", file=sys.stderr)
-            values_rows = _json_each_row(client, values_query)
-            print(f"[DEBUG] Values query returned {len(values_rows)} rows", file=sys.stderr)
-            logger.info("📊 All transfer_attempt values:")
-            print("📊 All transfer_attempt values:", file=sys.stderr)
-            if values_rows:
-                for vr in values_rows:
-                    attempt = vr.get("transfer_attempt", "NULL")
-                    count = vr.get("count", 0)
-                    msg = f"  - '{attempt}': {count} records"
-                    logger.info(msg)
-                    print(msg, file=sys.stderr)
-            else:
-                logger.info("  No transfer_attempt values found")
-                print("  No transfer_attempt values found", file=sys.stderr)
-        except Exception as values_err:
-            error_msg = f"Could not run values query: {values_err}"
-            logger.warning(error_msg)
-            logger.exception("Full traceback:")
-            print(f"[ERROR] {error_msg}", file=sys.stderr)
-            import traceback
-            print(f"[ERROR] {traceback.format_exc()}", file=sys.stderr)
-        
+        client = get_client_pool()
         rows = _json_each_row(
             client,
             query,
-            settings=CLICKHOUSE_QUERY_SETTINGS,
+            settings=_query_settings("scalar", start_date, end_date),
         )
 
-        
-
         logger.info("Carrier transfer stats query result: %d rows", len(rows))
         if not rows:
             logger.info("No carrier transfer stats found")
@@ -638,6 +685,7 @@ def fetch_carrier_asked_transfer_over_total_transfer_attempts_stats(start_date:
         logger.exception("Error fetching carrier transfer stats: %s", e)
         return None
 
+@cached_metric("carrier_asked_transfer_over_total_call_attempts", PEPSI_BROKER_NODE_ID)
 def fetch_carrier_asked_transfer_over_total_call_attempts_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[CarrierTransferStats]:
     org_id = get_org_id()
     if not org_id:
@@ -645,25 +693,19 @@ def fetch_carrier_asked_transfer_over_total_call_attempts_stats(start_date: Opti
         return None
 
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
-
         if start_date and end_date:
             logger.info("Fetching carrier transfer stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching carrier transfer stats for last 30 days (no date range provided)")
 
-        query = carrier_asked_transfer_over_total_call_attempts_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = CARRIER_ASKED_TRANSFER_OVER_TOTAL_CALL_ATTEMPTS_STATS_TEMPLATE.bind(start_date, end_date, org_id)
 
-        client = get_clickhouse_client()
+        client = get_client_pool()
 
         rows = _json_each_row(
             client,
             query,
-            settings=CLICKHOUSE_QUERY_SETTINGS,
+            settings=_query_settings("scalar", start_date, end_date),
         )
 
         logger.info("Carrier transfer stats query result: %d rows", len(rows))
@@ -688,16 +730,27 @@ def fetch_pepsi_data(time_range: str, timezone_name: str = "UTC") -> PepsiData:
     try:
         start_date, end_date = get_time_filter(time_range, timezone_name)
 
-        # Fetch rows
-        records = get_pepsi_data_optimized(start_date, end_date, timezone_name)
-
-        # Fetch stats in "parallel" (sequential here for simplicity)
-        transfer_stats = fetch_carrier_asked_transfer_over_total_transfer_attempts_stats(start_date, end_date)
-        carrier_stats = fetch_carrier_asked_transfer_over_total_transfer_attempts_stats(start_date, end_date)
-        carrier_call_attempts_stats = fetch_carrier_asked_transfer_over_total_call_attempts_stats(start_date, end_date)
-        load_not_found_stats = fetch_load_not_found_stats(start_date, end_date)
-        load_status_stats = fetch_load_status_stats(start_date, end_date)
-        successfully_transferred_for_booking_stats = fetch_successfully_transferred_for_booking_stats(start_date, end_date)
+        # Fetch rows and stats in parallel; identical calls (transferStats and
+        # carrierTransferStats are the same metric) only run once
+        results, errors = fan_out({
+            "records": (get_pepsi_data_optimized, (start_date, end_date, timezone_name)),
+            "transfer_stats": (fetch_carrier_asked_transfer_over_total_transfer_attempts_stats, (start_date, end_date)),
+            "carrier_stats": (fetch_carrier_asked_transfer_over_total_transfer_attempts_stats, (start_date, end_date)),
+            "carrier_call_attempts_stats": (fetch_carrier_asked_transfer_over_total_call_attempts_stats, (start_date, end_date)),
+            "load_not_found_stats": (fetch_load_not_found_stats, (start_date, end_date)),
+            "load_status_stats": (fetch_load_status_stats, (start_date, end_date)),
+            "successfully_transferred_for_booking_stats": (fetch_successfully_transferred_for_booking_stats, (start_date, end_date)),
+        })
+        for name, err in errors.items():
+            logger.error("Error fetching %s for pepsi data: %s", name, err)
+
+        records = results.get("records") or []
+        transfer_stats = results.get("transfer_stats")
+        carrier_stats = results.get("carrier_stats")
+        carrier_call_attempts_stats = results.get("carrier_call_attempts_stats")
+        load_not_found_stats = results.get("load_not_found_stats")
+        load_status_stats = results.get("load_status_stats")
+        successfully_transferred_for_booking_stats = results.get("successfully_transferred_for_booking_stats")
         # Compute tallies
         total_records = len(records)
         pending_records = sum(1 for r in records if r.status == "pending")
@@ -733,6 +786,7 @@ def fetch_pepsi_data(time_range: str, timezone_name: str = "UTC") -> PepsiData:
             records=[],
         )
 
+@cached_metric("load_not_found", PEPSI_BROKER_NODE_ID)
 def fetch_load_not_found_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[LoadNotFoundStats]:
     org_id = get_org_id()
     if not org_id:
@@ -740,23 +794,18 @@ def fetch_load_not_found_stats(start_date: Optional[str] = None, end_date: Optio
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
         
         if start_date and end_date:
             logger.info("Fetching load not found stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching load not found stats for last 30 days (no date range provided)")
-        query = load_not_found_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = LOAD_NOT_FOUND_STATS_TEMPLATE.bind(start_date, end_date, org_id)
         
-        client = get_clickhouse_client()
+        client = get_client_pool()
         rows = _json_each_row(
             client,
             query,
-            settings=CLICKHOUSE_QUERY_SETTINGS,
+            settings=_query_settings("scalar", start_date, end_date),
         )
         logger.info("Load not found stats query result: %d rows", len(rows))
         if not rows:
@@ -773,6 +822,7 @@ def fetch_load_not_found_stats(start_date: Optional[str] = None, end_date: Optio
         logger.exception("Error fetching load not found stats: %s", e)
         return None
 
+@cached_metric("load_status", PEPSI_BROKER_NODE_ID)
 def fetch_load_status_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[List[LoadStatusStats]]:
     org_id = get_org_id()
     if not org_id:
@@ -780,35 +830,33 @@ def fetch_load_status_stats(start_date: Optional[str] = None, end_date: Optional
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
         
         if start_date and end_date:
             logger.info("Fetching load status stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching load status stats for last 30 days (no date range provided)")
-        query = load_status_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = LOAD_STATUS_STATS_TEMPLATE.bind(start_date, end_date, org_id)
         
-        client = get_clickhouse_client()
-        rows = _json_each_row( client, query, settings=CLICKHOUSE_QUERY_SETTINGS,
-    )
-        logger.info("Load status stats query result: %d rows", len(rows))
-        if not rows:
+        client = get_client_pool()
+        result = _query_columns(client, query, settings=_query_settings("breakdown", start_date, end_date))
+        logger.info("Load status stats query result: %d rows", len(result))
+        if not result:
             logger.info("No load status stats found")
-            return None
-        return [LoadStatusStats(
-            load_status=str(r.get("load_status") or "Unknown"),
-            count=int(r.get("count", 0)),
-            total_calls=int(r.get("total_calls", 0)),
-            load_status_percentage=float(r.get("load_status_percentage", 0.0)),
-        ) for r in rows]
+            return []
+        return [
+            LoadStatusStats(load_status=load_status, count=count, total_calls=total_calls, load_status_percentage=load_status_percentage)
+            for load_status, count, total_calls, load_status_percentage in zip(
+                _text_column(result.column("load_status")),
+                _int_column(result.column("count")),
+                _int_column(result.column("total_calls")),
+                _float_column(result.column("load_status_percentage")),
+            )
+        ]
     except Exception as e:
         logger.exception("Error fetching load status stats: %s", e)
-        return []
+        return None
 
+@cached_metric("successfully_transferred_for_booking", PEPSI_BROKER_NODE_ID)
 def fetch_successfully_transferred_for_booking_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[SuccessfullyTransferredForBooking]:
     org_id = get_org_id()
     if not org_id:
@@ -816,20 +864,15 @@ def fetch_successfully_transferred_for_booking_stats(start_date: Optional[str] =
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
         
         if start_date and end_date:
             logger.info("Fetching successfully transferred for booking stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching successfully transferred for booking stats for last 30 days (no date range provided)")
-        query = successfully_transferred_for_booking_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = SUCCESSFULLY_TRANSFERRED_FOR_BOOKING_STATS_TEMPLATE.bind(start_date, end_date, org_id)
         
-        client = get_clickhouse_client()
-        rows = _json_each_row( client, query, settings=CLICKHOUSE_QUERY_SETTINGS,
+        client = get_client_pool()
+        rows = _json_each_row( client, query, settings=_query_settings("scalar", start_date, end_date),
         )
         logger.info("Successfully transferred for booking stats query result: %d rows", len(rows))
         if not rows:
@@ -845,149 +888,141 @@ def fetch_successfully_transferred_for_booking_stats(start_date: Optional[str] =
         logger.exception("Error fetching successfully transferred for booking stats: %s", e)
         return None
 
-def fetch_call_classifcation_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[CallClassificationStats]:
+@cached_metric("call_classification", PEPSI_BROKER_NODE_ID)
+def fetch_call_classifcation_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[List[CallClassificationStats]]:
     org_id = get_org_id()
     if not org_id:
         logger.error("❌ ORG_ID not found in environment variables. Please check your .env and restart the app.")
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
         
         if start_date and end_date:
             logger.info("Fetching call classification stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching call classification stats for last 30 days (no date range provided)")
-        query = call_classifcation_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = CALL_CLASSIFCATION_STATS_TEMPLATE.bind(start_date, end_date, org_id)
         
-        client = get_clickhouse_client()
-        rows = _json_each_row( client, query, settings=CLICKHOUSE_QUERY_SETTINGS,
-    )
-        logger.info("Call classification stats query result: %d rows", len(rows))
-        if not rows:
-            logger.info
-            ("No call classification stats found")
-            return None
-        return [CallClassificationStats(
-            call_classification=str(r.get("call_classification") or "Unknown"),
-            count=int(r.get("count", 0)),
-            percentage=float(r.get("percentage", 0.0)),
-        ) for r in rows]
+        client = get_client_pool()
+        result = _query_columns(client, query, settings=_query_settings("breakdown", start_date, end_date))
+        logger.info("Call classification stats query result: %d rows", len(result))
+        if not result:
+            logger.info("No call classification stats found")
+            return []
+        return [
+            CallClassificationStats(call_classification=call_classification, count=count, percentage=percentage)
+            for call_classification, count, percentage in zip(
+                _text_column(result.column("call_classification")),
+                _int_column(result.column("count")),
+                _float_column(result.column("percentage")),
+            )
+        ]
     except Exception as e:
         logger.exception("Error fetching call classification stats: %s", e)
-        return []
+        return None
 
-def fetch_carrier_qualification_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[CarrierQualificationStats]:
+@cached_metric("carrier_qualification", PEPSI_BROKER_NODE_ID)
+def fetch_carrier_qualification_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[List[CarrierQualificationStats]]:
     org_id = get_org_id()
     if not org_id:
         logger.error("❌ ORG_ID not found in environment variables. Please check your .env and restart the app.")
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
         
         if start_date and end_date:
             logger.info("Fetching carrier qualification stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching carrier qualification stats for last 30 days (no date range provided)")
-        query = carrier_qualification_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = CARRIER_QUALIFICATION_STATS_TEMPLATE.bind(start_date, end_date, org_id)
         
-        client = get_clickhouse_client()
-        rows = _json_each_row( client, query, settings=CLICKHOUSE_QUERY_SETTINGS,
-    )
-        logger.info("Carrier qualification stats query result: %d rows", len(rows))
-        if not rows:
+        client = get_client_pool()
+        result = _query_columns(client, query, settings=_query_settings("breakdown", start_date, end_date))
+        logger.info("Carrier qualification stats query result: %d rows", len(result))
+        if not result:
             logger.info("No carrier qualification stats found")
-            return None
-        return [CarrierQualificationStats(
-            carrier_qualification=str(r.get("carrier_qualification") or "Unknown"),
-            count=int(r.get("count", 0)), 
-            percentage=float(r.get("percentage", 0.0)),
-        ) for r in rows]
+            return []
+        return [
+            CarrierQualificationStats(carrier_qualification=carrier_qualification, count=count, percentage=percentage)
+            for carrier_qualification, count, percentage in zip(
+                _text_column(result.column("carrier_qualification")),
+                _int_column(result.column("count")),
+                _float_column(result.column("percentage")),
+            )
+        ]
     except Exception as e:
         logger.exception("Error fetching carrier qualification stats: %s", e)
-        return []
+        return None
 
 
-def fetch_pricing_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[PricingStats]:
+@cached_metric("pricing", PEPSI_BROKER_NODE_ID)
+def fetch_pricing_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[List[PricingStats]]:
     org_id = get_org_id()
     if not org_id:
         logger.error("❌ ORG_ID not found in environment variables. Please check your .env and restart the app.")
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
         
         if start_date and end_date:
             logger.info("Fetching pricing stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching pricing stats for last 30 days (no date range provided)")
-        query = pricing_stats_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = PRICING_STATS_TEMPLATE.bind(start_date, end_date, org_id)
         
-        client = get_clickhouse_client()
-        rows = _json_each_row( client, query, settings=CLICKHOUSE_QUERY_SETTINGS,
-    )
-        logger.info("Pricing stats query result: %d rows", len(rows))
-        if not rows:
+        client = get_client_pool()
+        result = _query_columns(client, query, settings=_query_settings("breakdown", start_date, end_date))
+        logger.info("Pricing stats query result: %d rows", len(result))
+        if not result:
             logger.info("No pricing stats found")
-            return None
-        return [PricingStats(
-            pricing_notes=str(r.get("pricing_notes") or "Unknown"),
-            count=int(r.get("count", 0)),   
-            percentage=float(r.get("percentage", 0.0)),
-        ) for r in rows]
+            return []
+        return [
+            PricingStats(pricing_notes=pricing_notes, count=count, percentage=percentage)
+            for pricing_notes, count, percentage in zip(
+                _text_column(result.column("pricing_notes")),
+                _int_column(result.column("count")),
+                _float_column(result.column("percentage")),
+            )
+        ]
     except Exception as e:
         logger.exception("Error fetching pricing stats: %s", e)
-        return []
+        return None
 
-def fetch_carrier_end_state_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[CarrierEndStateStats]:
+@cached_metric("carrier_end_state", PEPSI_BROKER_NODE_ID)
+def fetch_carrier_end_state_stats(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[List[CarrierEndStateStats]]:
     org_id = get_org_id()
     if not org_id:
         logger.error("❌ ORG_ID not found in environment variables. Please check your .env and restart the app.")
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
         
         if start_date and end_date:
             logger.info("Fetching carrier end state stats for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching carrier end state stats for last 30 days (no date range provided)")
-        query = carrier_end_state_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = CARRIER_END_STATE_TEMPLATE.bind(start_date, end_date, org_id)
         
-        client = get_clickhouse_client()
-        rows = _json_each_row( client, query, settings=CLICKHOUSE_QUERY_SETTINGS,
-    )
-        logger.info("Carrier end state stats query result: %d rows", len(rows))
-        if not rows:
+        client = get_client_pool()
+        result = _query_columns(client, query, settings=_query_settings("breakdown", start_date, end_date))
+        logger.info("Carrier end state stats query result: %d rows", len(result))
+        if not result:
             logger.info("No carrier end state stats found")
-            return None
-        return [CarrierEndStateStats(
-            carrier_end_state=str(r.get("carrier_end_state") or "Unknown"),
-            count=int(r.get("count", 0)),
-            percentage=float(r.get("percentage", 0.0)),
-        ) for r in rows]
+            return []
+        return [
+            CarrierEndStateStats(carrier_end_state=carrier_end_state, count=count, percentage=percentage)
+            for carrier_end_state, count, percentage in zip(
+                _text_column(result.column("carrier_end_state")),
+                _int_column(result.column("count")),
+                _float_column(result.column("percentage")),
+            )
+        ]
     except Exception as e:
         logger.exception("Error fetching carrier end state stats: %s", e)
-        return []
+        return None
 
 
+@cached_metric("percent_non_convertible_calls", PEPSI_BROKER_NODE_ID)
 def fetch_percent_non_convertible_calls(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[PercentNonConvertibleCallsStats]:
     org_id = get_org_id()
     if not org_id:
@@ -995,20 +1030,15 @@ def fetch_percent_non_convertible_calls(start_date: Optional[str] = None, end_da
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
         
         if start_date and end_date:
             logger.info("Fetching percent non convertible calls for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching percent non convertible calls for last 30 days (no date range provided)")
-        query = percent_non_convertible_calls_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+        query = PERCENT_NON_CONVERTIBLE_CALLS_TEMPLATE.bind(start_date, end_date, org_id)
         
-        client = get_clickhouse_client()
-        rows = _json_each_row( client, query, settings=CLICKHOUSE_QUERY_SETTINGS,
+        client = get_client_pool()
+        rows = _json_each_row( client, query, settings=_query_settings("scalar", start_date, end_date),
     )
         logger.info("Percent non convertible calls query result: %d rows", len(rows))
         if not rows:
@@ -1062,6 +1092,63 @@ def _split_date_range_for_unique_loads(start_date: Optional[str], end_date: Opti
         logger.warning(f"Error parsing dates for split: {e}, using single query")
         return None, None
 
+def _bind_segments(sql: str, segments: List[DaySegment], org_id: str, **parameters) -> BoundQuery:
+    """Bind a SEGMENTS_FILTER template: overall [start, end) bounds plus the contiguous ranges inside them."""
+    ranges = contiguous_ranges(segments)
+    return BoundQuery(sql, {
+        "start": ranges[0][0],
+        "end": ranges[-1][1],
+        "ranges": ranges,
+        "org_id": org_id,
+        **parameters,
+    })
+
+def _bind_across_cutoff(sql: str, broker_range: Tuple[str, str], fbr_range: Tuple[str, str], org_id: str) -> BoundQuery:
+    return BoundQuery(sql, {
+        "broker_start": parse_utc(broker_range[0]),
+        "broker_end": parse_utc(broker_range[1]),
+        "fbr_start": parse_utc(fbr_range[0]),
+        "fbr_end": parse_utc(fbr_range[1]),
+        "org_id": org_id,
+    })
+
+def _fetch_unique_load_states_by_day(org_id: str, segments: List[DaySegment], mode: str) -> Dict[date, UniqueLoadsState]:
+    """
+    Per-day distinct-load states for the segments: hashed ids ("exact"), a HyperLogLog
+    sketch whose registers ClickHouse computes ("hll") or the raw load ids ("ids", for the
+    list endpoint).
+    """
+    query = _bind_segments(UNIQUE_LOAD_STATES_BY_DAY_SQL[mode], segments, org_id)
+    client = get_client_pool()
+    result = _query_columns(client, query, settings=_segments_query_settings("distinct", segments))
+    logger.info("Unique load states query result: %d rows for %d days", len(result), len(segments))
+    states: Dict[date, UniqueLoadsState] = {}
+    for day, total_calls, loads in zip(result.column("day"), _int_column(result.column("total_calls")), result.column("loads")):
+        loads = loads or []
+        if mode == "ids":
+            day_loads = frozenset(str(load_id) for load_id in loads)
+        elif mode == "hll":
+            day_loads = HyperLogLog.from_registers(loads)
+        else:
+            day_loads = frozenset(loads)
+        states[date.fromisoformat(str(day))] = UniqueLoadsState(loads=day_loads, total_calls=total_calls)
+    return states
+
+def _load_unique_load_state(org_id: str, start_date: Optional[str], end_date: Optional[str], mode: str) -> UniqueLoadsState:
+    """Merged distinct-load state for the range, from DAY_AGGREGATE_STORE where days are closed."""
+    start, end = resolve_range(start_date, end_date, datetime.now(timezone.utc).replace(tzinfo=None))
+    merge_mode = "hll" if mode == "hll" else "exact"
+    return DAY_AGGREGATE_STORE.load(
+        org_id,
+        f"{UNIQUE_LOADS_NODE_IDS}:unique_loads:{mode}",
+        start,
+        end,
+        lambda segments: _fetch_unique_load_states_by_day(org_id, segments, mode),
+        merge=lambda states: merge_states(states, merge_mode),
+        empty=lambda: empty_state(merge_mode),
+    )
+
+@cached_metric("number_of_unique_loads", UNIQUE_LOADS_NODE_IDS)
 def fetch_number_of_unique_loads(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[NumberOfUniqueLoadsStats]:
     org_id = get_org_id()
     if not org_id:
@@ -1069,15 +1156,24 @@ def fetch_number_of_unique_loads(start_date: Optional[str] = None, end_date: Opt
         return None
     
     try:
+        if AGGREGATE_STORE_ENABLED:
+            # Merge per-day distinct-load states instead of downloading load id lists
+            state = _load_unique_load_state(org_id, start_date, end_date, UNIQUE_LOADS_COUNT_MODE)
+            number_of_unique_loads = state.number_of_unique_loads
+            return NumberOfUniqueLoadsStats(
+                number_of_unique_loads=number_of_unique_loads,
+                total_calls=state.total_calls,
+                calls_per_unique_load=round(state.total_calls / number_of_unique_loads, 2) if number_of_unique_loads else 0.0,
+            )
+
         broker_range, fbr_range = _split_date_range_for_unique_loads(start_date, end_date)
         
         # If no date range provided, use default
         if not start_date or not end_date:
-            date_filter = "timestamp >= now() - INTERVAL 30 DAY"
             logger.info("Fetching number of unique loads for last 30 days (no date range provided)")
-            query = number_of_unique_loads_query(date_filter, org_id, PEPSI_FBR_NODE_ID)
-            client = get_clickhouse_client()
-            rows = _json_each_row(client, query, settings=CLICKHOUSE_QUERY_SETTINGS)
+            query = NUMBER_OF_UNIQUE_LOADS_TEMPLATE.bind(start_date, end_date, org_id)
+            client = get_client_pool()
+            rows = _json_each_row(client, query, settings=_query_settings("distinct", start_date, end_date))
             if not rows:
                 return None
             r = rows[0]
@@ -1092,57 +1188,19 @@ def fetch_number_of_unique_loads(start_date: Optional[str] = None, end_date: Opt
             logger.info("Fetching number of unique loads for split date range: broker_node %s-%s, FBR %s-%s", 
                        broker_range[0], broker_range[1], fbr_range[0], fbr_range[1])
             
-            # Get broker_node results
-            broker_filter = f"timestamp >= parseDateTime64BestEffort('{broker_range[0]}') AND timestamp < parseDateTime64BestEffort('{broker_range[1]}')"
-            broker_query = number_of_unique_loads_query_broker_node(broker_filter, org_id, PEPSI_BROKER_NODE_ID)
-            
-            # Get FBR results
-            fbr_filter = f"timestamp >= parseDateTime64BestEffort('{fbr_range[0]}') AND timestamp < parseDateTime64BestEffort('{fbr_range[1]}')"
-            fbr_query = number_of_unique_loads_query(fbr_filter, org_id, PEPSI_FBR_NODE_ID)
-            
-            client = get_clickhouse_client()
-            
-            # Execute broker_node query
-            broker_rows = _json_each_row(client, broker_query, settings=CLICKHOUSE_QUERY_SETTINGS)
-            broker_result = broker_rows[0] if broker_rows else {"number_of_unique_loads": 0, "total_calls": 0}
-            
-            # Execute FBR query
-            fbr_rows = _json_each_row(client, fbr_query, settings=CLICKHOUSE_QUERY_SETTINGS)
-            fbr_result = fbr_rows[0] if fbr_rows else {"number_of_unique_loads": 0, "total_calls": 0}
-            
-            # Get lists to count unique combined
-            broker_list_query = list_of_unique_loads_query_broker_node(broker_filter, org_id, PEPSI_BROKER_NODE_ID)
-            fbr_list_query = list_of_unique_loads_query(fbr_filter, org_id, PEPSI_FBR_NODE_ID)
-            
-            broker_list_rows = _json_each_row(client, broker_list_query, settings=CLICKHOUSE_QUERY_SETTINGS)
-            fbr_list_rows = _json_each_row(client, fbr_list_query, settings=CLICKHOUSE_QUERY_SETTINGS)
-            
-            broker_loads = {str(r.get("custom_load_id")) for r in broker_list_rows if r.get("custom_load_id")}
-            fbr_loads = {str(r.get("custom_load_id")) for r in fbr_list_rows if r.get("custom_load_id")}
-            
-            # Combine and count unique
-            combined_unique_loads = len(broker_loads | fbr_loads)
-            combined_total_calls = int(broker_result.get("total_calls", 0)) + int(fbr_result.get("total_calls", 0))
-            combined_calls_per_load = round(combined_total_calls / combined_unique_loads, 2) if combined_unique_loads > 0 else 0.0
-            
-            return NumberOfUniqueLoadsStats(
-                number_of_unique_loads=combined_unique_loads,
-                total_calls=combined_total_calls,
-                calls_per_unique_load=combined_calls_per_load,
-            )
+            # One query: both extractions and the union/uniqExact run inside ClickHouse
+            query = _bind_across_cutoff(NUMBER_OF_UNIQUE_LOADS_ACROSS_CUTOFF_SQL, broker_range, fbr_range, org_id)
         
         # Single period - determine which query to use
         elif broker_range:
             logger.info("Fetching number of unique loads for broker_node date range: %s to %s", broker_range[0], broker_range[1])
-            date_filter = f"timestamp >= parseDateTime64BestEffort('{broker_range[0]}') AND timestamp < parseDateTime64BestEffort('{broker_range[1]}')"
-            query = number_of_unique_loads_query_broker_node(date_filter, org_id, PEPSI_BROKER_NODE_ID)
+            query = NUMBER_OF_UNIQUE_LOADS_BROKER_NODE_TEMPLATE.bind(broker_range[0], broker_range[1], org_id)
         else:  # fbr_range
             logger.info("Fetching number of unique loads for FBR date range: %s to %s", fbr_range[0], fbr_range[1])
-            date_filter = f"timestamp >= parseDateTime64BestEffort('{fbr_range[0]}') AND timestamp < parseDateTime64BestEffort('{fbr_range[1]}')"
-            query = number_of_unique_loads_query(date_filter, org_id, PEPSI_FBR_NODE_ID)
+            query = NUMBER_OF_UNIQUE_LOADS_TEMPLATE.bind(fbr_range[0], fbr_range[1], org_id)
         
-        client = get_clickhouse_client()
-        rows = _json_each_row(client, query, settings=CLICKHOUSE_QUERY_SETTINGS)
+        client = get_client_pool()
+        rows = _json_each_row(client, query, settings=_query_settings("distinct", start_date, end_date))
         logger.info("Number of unique loads query result: %d rows", len(rows))
         if not rows:
             logger.info("No number of unique loads found")
@@ -1157,6 +1215,37 @@ def fetch_number_of_unique_loads(start_date: Optional[str] = None, end_date: Opt
         logger.exception("Error fetching number of unique loads: %s", e)
         return None
 
+def _list_of_unique_loads_query_for_range(org_id: str, start_date: Optional[str], end_date: Optional[str]) -> Optional[BoundQuery]:
+    """
+    Pick the list_of_unique_loads query for the range: broker node before the cutoff, FBR
+    from it on, or the combined query when the range spans both. Rows come back sorted.
+    """
+    broker_range, fbr_range = _split_date_range_for_unique_loads(start_date, end_date)
+    logger.info(f"After split - broker_range: {broker_range}, fbr_range: {fbr_range}")
+
+    # If no date range provided, use default
+    if not start_date or not end_date:
+        logger.info("Fetching list of unique loads for last 30 days (no date range provided)")
+        return LIST_OF_UNIQUE_LOADS_TEMPLATE.bind(None, None, org_id)
+
+    # If date range spans both periods, combine results
+    if broker_range and fbr_range:
+        logger.info("Fetching list of unique loads for split date range: broker_node %s-%s, FBR %s-%s",
+                   broker_range[0], broker_range[1], fbr_range[0], fbr_range[1])
+        return _bind_across_cutoff(LIST_OF_UNIQUE_LOADS_ACROSS_CUTOFF_SQL, broker_range, fbr_range, org_id)
+
+    # Single period - determine which query to use
+    if broker_range:
+        logger.info("Fetching list of unique loads for broker_node date range: %s to %s", broker_range[0], broker_range[1])
+        return LIST_OF_UNIQUE_LOADS_BROKER_NODE_TEMPLATE.bind(broker_range[0], broker_range[1], org_id)
+    if fbr_range:
+        logger.info("Fetching list of unique loads for FBR date range: %s to %s", fbr_range[0], fbr_range[1])
+        return LIST_OF_UNIQUE_LOADS_TEMPLATE.bind(fbr_range[0], fbr_range[1], org_id)
+
+    logger.warning("Neither broker_range nor fbr_range was set! This should not happen.")
+    return None
+
+@cached_metric("list_of_unique_loads", UNIQUE_LOADS_NODE_IDS)
 def fetch_list_of_unique_loads(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[ListOfUniqueLoadsStats]:
     org_id = get_org_id()
     if not org_id:
@@ -1164,64 +1253,18 @@ def fetch_list_of_unique_loads(start_date: Optional[str] = None, end_date: Optio
         return None
     
     try:
-        broker_range, fbr_range = _split_date_range_for_unique_loads(start_date, end_date)
-        logger.info(f"After split - broker_range: {broker_range}, fbr_range: {fbr_range}")
-        
-        # If no date range provided, use default
-        if not start_date or not end_date:
-            date_filter = "timestamp >= now() - INTERVAL 30 DAY"
-            logger.info("Fetching list of unique loads for last 30 days (no date range provided)")
-            query = list_of_unique_loads_query(date_filter, org_id, PEPSI_FBR_NODE_ID)
-            client = get_clickhouse_client()
-            rows = _json_each_row(client, query, settings=CLICKHOUSE_QUERY_SETTINGS)
-            rows = [str(r.get("custom_load_id")) for r in rows if r.get("custom_load_id")]
-            return ListOfUniqueLoadsStats(list_of_unique_loads=rows)
-        
-        all_loads = set()
-        client = get_clickhouse_client()
-        
-        # If date range spans both periods, combine results
-        if broker_range and fbr_range:
-            logger.info("Fetching list of unique loads for split date range: broker_node %s-%s, FBR %s-%s", 
-                       broker_range[0], broker_range[1], fbr_range[0], fbr_range[1])
-            
-            # Get broker_node results
-            broker_filter = f"timestamp >= parseDateTime64BestEffort('{broker_range[0]}') AND timestamp < parseDateTime64BestEffort('{broker_range[1]}')"
-            print(f'broker_filter: {broker_filter}')
-            broker_query = list_of_unique_loads_query_broker_node(broker_filter, org_id, PEPSI_BROKER_NODE_ID)
-            broker_rows = _json_each_row(client, broker_query, settings=CLICKHOUSE_QUERY_SETTINGS)
-            broker_loads = {str(r.get("custom_load_id")) for r in broker_rows if r.get("custom_load_id")}
-            all_loads.update(broker_loads)
-            
-            # Get FBR results
-            fbr_filter = f"timestamp >= parseDateTime64BestEffort('{fbr_range[0]}') AND timestamp < parseDateTime64BestEffort('{fbr_range[1]}')"
-            print(f'fbr_filter: {fbr_filter}')
-            fbr_query = list_of_unique_loads_query(fbr_filter, org_id, PEPSI_FBR_NODE_ID)
-            fbr_rows = _json_each_row(client, fbr_query, settings=CLICKHOUSE_QUERY_SETTINGS)
-            # print(f'fbr_rows: {fbr_rows}')
-            fbr_loads = {str(r.get("custom_load_id")) for r in fbr_rows if r.get("custom_load_id")}
-            all_loads.update(fbr_loads)
-            
-            return ListOfUniqueLoadsStats(list_of_unique_loads=sorted(list(all_loads)))
-        
-        # Single period - determine which query to use
-        elif broker_range:
-            logger.info("Fetching list of unique loads for broker_node date range: %s to %s", broker_range[0], broker_range[1])
-            date_filter = f"timestamp >= parseDateTime64BestEffort('{broker_range[0]}') AND timestamp < parseDateTime64BestEffort('{broker_range[1]}')"
-            query = list_of_unique_loads_query_broker_node(date_filter, org_id, PEPSI_BROKER_NODE_ID)
-            logger.info(f"Executing broker_node query for date filter: {date_filter}")
-        elif fbr_range:
-            logger.info("Fetching list of unique loads for FBR date range: %s to %s", fbr_range[0], fbr_range[1])
-            date_filter = f"timestamp >= parseDateTime64BestEffort('{fbr_range[0]}') AND timestamp < parseDateTime64BestEffort('{fbr_range[1]}')"
-            query = list_of_unique_loads_query(date_filter, org_id, PEPSI_FBR_NODE_ID)
-            logger.info(f"Executing FBR query for date filter: {date_filter}")
-        else:
-            logger.warning("Neither broker_range nor fbr_range was set! This should not happen.")
+        if AGGREGATE_STORE_ENABLED:
+            state = _load_unique_load_state(org_id, start_date, end_date, "ids")
+            return ListOfUniqueLoadsStats(list_of_unique_loads=sorted(state.loads))
+
+        query = _list_of_unique_loads_query_for_range(org_id, start_date, end_date)
+        if query is None:
             return ListOfUniqueLoadsStats(list_of_unique_loads=[])
-        
-        rows = _json_each_row(client, query, settings=CLICKHOUSE_QUERY_SETTINGS)
-        logger.info(f"Query returned {len(rows)} rows")
-        rows = [str(r.get("custom_load_id")) for r in rows if r.get("custom_load_id")]
+
+        client = get_client_pool()
+        result = _query_columns(client, query, settings=_query_settings("list", start_date, end_date))
+        logger.info(f"Query returned {len(result)} rows")
+        rows = [str(load_id) for load_id in result.column("custom_load_id") if load_id]
         logger.info(f"After filtering, {len(rows)} rows with custom_load_id")
         if not rows:
             logger.info("No list of unique loads found")
@@ -1233,6 +1276,38 @@ def fetch_list_of_unique_loads(start_date: Optional[str] = None, end_date: Optio
         logger.exception("Error fetching list of unique loads: %s", e)
         return None
 
+def stream_list_of_unique_loads(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield the unique load ids of the range one by one, in the order ClickHouse sorted them.
+    Rows are streamed from a pooled client, so memory does not grow with the number of loads.
+    Raises on errors (unlike the fetch_* functions) since a stream cannot report None.
+    """
+    org_id = get_org_id()
+    if not org_id:
+        raise RuntimeError("ORG_ID not found in environment variables")
+    query = _list_of_unique_loads_query_for_range(org_id, start_date, end_date)
+    if query is None:
+        return
+    # The generator is resumed from different threads, so the metric label and the span
+    # are passed explicitly rather than through context variables
+    span = child_span("clickhouse.query", SPAN_KIND_CLIENT, **{"db.system": "clickhouse", "metric": "list_of_unique_loads_stream"})
+    settings = query_settings_with_id(span, _query_settings("list", start_date, end_date))
+    span.set_attribute("db.clickhouse.query_id", settings["query_id"])
+    started = time.perf_counter()
+    try:
+        for row in get_client_pool().stream_rows(query.sql, settings=settings, parameters=query.parameters):
+            if row[0]:
+                yield str(row[0])
+    except BaseException as e:
+        if isinstance(e, Exception):
+            observe_query_error("list_of_unique_loads_stream")
+        end_span(span, e)
+        raise
+    end_span(span)
+    # A streamed result has no X-ClickHouse-Summary to read, only the time taken
+    observe_query(time.perf_counter() - started, None, "list_of_unique_loads_stream")
+
+@cached_metric("calls_without_carrier_asked_for_transfer", PEPSI_BROKER_NODE_ID)
 def fetch_calls_without_carrier_asked_for_transfer(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[CallsWithoutCarrierAskedForTransferStats]:
     org_id = get_org_id()
     if not org_id:
@@ -1240,19 +1315,13 @@ def fetch_calls_without_carrier_asked_for_transfer(start_date: Optional[str] = N
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
-
         if start_date and end_date:
             logger.info("Fetching calls without carrier asked for transfer for date range: %s to %s", start_date, end_date)
         else:
             logger.info("Fetching calls without carrier asked for transfer for last 30 days (no date range provided)")
-        query = calls_without_carrier_asked_for_transfer_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
-        client = get_clickhouse_client()
-        rows = _json_each_row(client, query, settings=CLICKHOUSE_QUERY_SETTINGS)
+        query = CALLS_WITHOUT_CARRIER_ASKED_FOR_TRANSFER_TEMPLATE.bind(start_date, end_date, org_id)
+        client = get_client_pool()
+        rows = _json_each_row(client, query, settings=_query_settings("scalar", start_date, end_date))
         logger.info("Calls without carrier asked for transfer query result: %d rows", len(rows))
         if not rows:
             logger.info("No calls without carrier asked for transfer found")
@@ -1285,6 +1354,7 @@ def fetch_calls_without_carrier_asked_for_transfer(start_date: Optional[str] = N
         logger.exception("Error fetching calls without carrier asked for transfer: %s", e)
         return None
 
+@cached_metric("total_calls_and_total_duration", PEPSI_BROKER_NODE_ID)
 def fetch_total_calls_and_total_duration(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[TotalCallsAndTotalDurationStats]:
     org_id = get_org_id()
     if not org_id:
@@ -1292,14 +1362,9 @@ def fetch_total_calls_and_total_duration(start_date: Optional[str] = None, end_d
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
-        query = total_calls_and_total_duration_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
-        client = get_clickhouse_client()
-        rows = _json_each_row(client, query, settings=CLICKHOUSE_QUERY_SETTINGS)
+        query = TOTAL_CALLS_AND_TOTAL_DURATION_TEMPLATE.bind(start_date, end_date, org_id)
+        client = get_client_pool()
+        rows = _json_each_row(client, query, settings=_query_settings("scalar", start_date, end_date))
         logger.info("Total calls and total duration query result: %d rows", len(rows))
         if not rows:
             logger.info("No total calls and total duration found")
@@ -1314,6 +1379,7 @@ def fetch_total_calls_and_total_duration(start_date: Optional[str] = None, end_d
         logger.exception("Error fetching total calls and total duration: %s", e)
         return None
 
+@cached_metric("duration_carrier_asked_for_transfer", PEPSI_BROKER_NODE_ID)
 def fetch_duration_carrier_asked_for_transfer(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[DurationCarrierAskedForTransferStats]:
     org_id = get_org_id()
     if not org_id:
@@ -1321,14 +1387,9 @@ def fetch_duration_carrier_asked_for_transfer(start_date: Optional[str] = None,
         return None
     
     try:
-        date_filter = (
-            f"timestamp >= parseDateTime64BestEffort('{start_date}') AND timestamp < parseDateTime64BestEffort('{end_date}')"
-            if start_date and end_date
-            else "timestamp >= now() - INTERVAL 30 DAY"
-        )
-        query = duration_carrier_asked_for_transfer_query(date_filter, org_id, PEPSI_BROKER_NODE_ID)
-        client = get_clickhouse_client()
-        rows = _json_each_row(client, query, settings=CLICKHOUSE_QUERY_SETTINGS)
+        query = DURATION_CARRIER_ASKED_FOR_TRANSFER_TEMPLATE.bind(start_date, end_date, org_id)
+        client = get_client_pool()
+        rows = _json_each_row(client, query, settings=_query_settings("scalar", start_date, end_date))
         logger.info("Duration carrier asked for transfer query result: %d rows", len(rows))
         if not rows:
             logger.info("No duration carrier asked for transfer found")
@@ -1339,4 +1400,382 @@ def fetch_duration_carrier_asked_for_transfer(start_date: Optional[str] = None,
         )
     except Exception as e:
         logger.exception("Error fetching duration carrier asked for transfer: %s", e)
-        return None
\ No newline at end of file
+        return None
+def _percentage(part: int, total: int) -> float:
+    """ROUND((part * 100.0) / total, 2) as the per-metric queries compute it, 0 for an empty total."""
+    return round((part * 100.0) / total, 2) if total else 0.0
+
+# Dimensions of all_stats_fused_query that carry one total row rather than a breakdown by value
+ALL_STATS_TOTAL_DIMENSIONS = frozenset({"booking_total", "non_convertible", "unique_loads", "sessions", "unique_load_sessions"})
+
+def _build_all_stats(rows: List[Dict[str, Any]]) -> AllStats:
+    """
+    Fold the (dimension, value, runs, rows, unique_loads) rows of all_stats_fused_query
+    into the same dataclasses the individual fetch_* functions return.
+    """
+    breakdowns: Dict[str, Dict[str, int]] = {}
+    totals: Dict[str, Dict[str, int]] = {}
+    for r in rows:
+        dimension = str(r.get("dimension"))
+        value = str(r.get("value"))
+        counts = {
+            "runs": int(r.get("runs") or 0),
+            "rows": int(r.get("rows") or 0),
+            "unique_loads": int(r.get("unique_loads") or 0),
+        }
+        if dimension in ALL_STATS_TOTAL_DIMENSIONS:
+            totals[dimension] = counts
+        else:
+            breakdowns.setdefault(dimension, {})[value] = counts["runs"]
+
+    def ranked(dimension: str) -> List[Tuple[str, int, float]]:
+        counts = breakdowns.get(dimension, {})
+        total = sum(counts.values())
+        ordered = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)
+        return [(value, count, _percentage(count, total)) for value, count in ordered]
+
+    def total_of(dimension: str, column: str) -> int:
+        return totals.get(dimension, {}).get(column, 0)
+
+    # AllStats is frozen: sections are collected first; missing ones keep the AllStats defaults
+    sections: Dict[str, Any] = {}
+    sections["call_stage_stats"] = [
+        TransferStats(call_stage=value, count=count, percentage=pct)
+        for value, count, pct in ranked("call_stage")
+    ]
+    sections["call_classification"] = [
+        CallClassificationStats(call_classification=value, count=count, percentage=pct)
+        for value, count, pct in ranked("call_classification")
+    ] or None
+    sections["carrier_qualification"] = [
+        CarrierQualificationStats(carrier_qualification=value, count=count, percentage=pct)
+        for value, count, pct in ranked("carrier_qualification")
+    ] or None
+    sections["pricing"] = [
+        PricingStats(pricing_notes=value, count=count, percentage=pct)
+        for value, count, pct in ranked("pricing_notes")
+    ] or None
+    sections["carrier_end_state"] = [
+        CarrierEndStateStats(carrier_end_state=value, count=count, percentage=pct)
+        for value, count, pct in ranked("carrier_end_state")
+    ] or None
+
+    load_statuses = breakdowns.get("load_status", {})
+    load_status_total = sum(load_statuses.values())
+    sections["load_status"] = [
+        LoadStatusStats(
+            load_status=value,
+            count=count,
+            total_calls=load_status_total,
+            load_status_percentage=pct,
+        )
+        for value, count, pct in ranked("load_status")
+    ] or None
+    # Same breakdown over the sessions load_not_found_stats_query selects (see all_stats_fused_query)
+    load_not_found_statuses = breakdowns.get("load_not_found_status", {})
+    load_not_found_total = sum(load_not_found_statuses.values())
+    load_not_found_count = load_not_found_statuses.get("NOT_FOUND", 0)
+    sections["load_not_found"] = LoadNotFoundStats(
+        load_not_found_count=load_not_found_count,
+        total_calls=load_not_found_total,
+        load_not_found_percentage=_percentage(load_not_found_count, load_not_found_total),
+    )
+
+    transfer_reasons = breakdowns.get("transfer_reason", {})
+    if "CARRIER_ASKED_FOR_TRANSFER" in transfer_reasons:
+        carrier_asked_count = transfer_reasons["CARRIER_ASKED_FOR_TRANSFER"]
+        total_transfers = sum(transfer_reasons.values())
+        carrier_asked_percentage = _percentage(carrier_asked_count, total_transfers)
+        sections["carrier_asked_transfer_over_total_transfer_attempts"] = CarrierTransferStatsTotalTransferAttempts(
+            carrier_asked_count=carrier_asked_count,
+            total_transfer_attempts=total_transfers,
+            carrier_asked_percentage=carrier_asked_percentage,
+        )
+        sections["carrier_asked_transfer_over_total_call_attempts"] = CarrierTransferStatsTotalCallAttempts(
+            carrier_asked_count=carrier_asked_count,
+            total_call_attempts=total_transfers,
+            carrier_asked_percentage=carrier_asked_percentage,
+        )
+
+    booking_count = sum(breakdowns.get("booking", {}).values())
+    booking_total = total_of("booking_total", "runs")
+    sections["successfully_transferred_for_booking"] = SuccessfullyTransferredForBooking(
+        successfully_transferred_for_booking_count=booking_count,
+        total_calls=booking_total,
+        successfully_transferred_for_booking_percentage=_percentage(booking_count, booking_total),
+    )
+
+    non_convertible_count = total_of("non_convertible", "rows")
+    session_count = total_of("sessions", "rows")
+    sections["percent_non_convertible_calls"] = PercentNonConvertibleCallsStats(
+        non_convertible_calls_count=non_convertible_count,
+        total_calls_count=session_count,
+        non_convertible_calls_percentage=_percentage(non_convertible_count, session_count),
+    )
+
+    unique_loads = total_of("unique_loads", "unique_loads")
+    unique_load_calls = total_of("unique_load_sessions", "rows")
+    sections["number_of_unique_loads"] = NumberOfUniqueLoadsStats(
+        number_of_unique_loads=unique_loads,
+        total_calls=unique_load_calls,
+        calls_per_unique_load=round(unique_load_calls / unique_loads, 2) if unique_loads else 0.0,
+    )
+    return AllStats(**sections)
+
+def _fetch_all_stats_rows_by_day(org_id: str, segments: List[DaySegment], start: datetime, end: datetime) -> Dict[date, List[Dict[str, Any]]]:
+    """
+    Per-day fused rows of the segments, each with the session_day it counts. Sessions of the
+    segments that are not stored (partial or still open days) are limited to the request's
+    [start, end) already; merge_partials drops the other out-of-range session days.
+    """
+    query = _bind_segments(
+        ALL_STATS_BY_DAY_SQL, segments, org_id,
+        open_days=[seg.day for seg in segments if not seg.cacheable],
+        session_start=start,
+        session_end=end,
+    )
+    client = get_client_pool()
+    rows = _json_each_row(client, query, settings=_segments_query_settings("fused", segments))
+    logger.info("Fused all stats by-day query result: %d rows for %d days", len(rows), len(segments))
+    by_day: Dict[date, List[Dict[str, Any]]] = {}
+    for r in rows:
+        day = date.fromisoformat(str(r.pop("day")))
+        r["session_day"] = date.fromisoformat(str(r["session_day"]))
+        by_day.setdefault(day, []).append(r)
+    return by_day
+
+def _fetch_all_stats_incremental(org_id: str, start_date: Optional[str], end_date: Optional[str]) -> AllStats:
+    """
+    Serve the range from DAY_AGGREGATE_STORE: closed days come from memory and only the
+    missing or still-open days are queried. Distinct loads do not add up across days, so
+    number_of_unique_loads is merged from its own per-day distinct-load states; when those
+    cannot be computed this raises rather than return an AllStats missing that section.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    start, end = resolve_range(start_date, end_date, now)
+    logger.info("Fetching incremental all stats for %s to %s (UTC)", start, end)
+    days = {seg.day for seg in plan_days(start, end, now)}
+    rows = DAY_AGGREGATE_STORE.load(
+        org_id,
+        UNIQUE_LOADS_NODE_IDS,
+        start,
+        end,
+        lambda segments: _fetch_all_stats_rows_by_day(org_id, segments, start, end),
+        now=now,
+        merge=lambda partials: merge_partials(partials, days),
+    )
+    number_of_unique_loads = fetch_number_of_unique_loads(start_date, end_date)
+    if number_of_unique_loads is None:
+        raise RuntimeError("Error fetching number of unique loads for the incremental all stats")
+    return replace(_build_all_stats(rows), number_of_unique_loads=number_of_unique_loads)
+
+def _sealed_week_rows(org_id: str, start_date: Optional[str], end_date: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fused rows of the range from WEEK_SNAPSHOTS when it is exactly one sealed week in a
+    WEEK_SNAPSHOT_TIMEZONES timezone. A sealed week missing from the store is computed with
+    one plain fused query and persisted, so it is never queried again. None for any other range.
+    """
+    if not WEEK_SNAPSHOTS_ENABLED or not start_date or not end_date:
+        return None
+    try:
+        start, end = parse_utc(start_date), parse_utc(end_date)
+    except ValueError:
+        return None
+    week = match_week(start, end)
+    if week is None or not WEEK_SNAPSHOTS.is_sealed(*week):
+        return None
+    week_start, tz_name = week
+    rows = WEEK_SNAPSHOTS.get(org_id, tz_name, week_start)
+    if rows is None:
+        logger.info("Sealing week %s (%s): computing it once", week_start, tz_name)
+        query = ALL_STATS_FUSED_TEMPLATE.bind(start.isoformat(), end.isoformat(), org_id)
+        rows = _json_each_row(get_client_pool(), query, settings=_query_settings("fused", start_date, end_date))
+        WEEK_SNAPSHOTS.put(org_id, tz_name, week_start, rows)
+    return rows
+
+@cached_metric("all_stats", UNIQUE_LOADS_NODE_IDS)
+def fetch_all_stats_fused(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[AllStats]:
+    """
+    Compute every /all-stats metric with a single ClickHouse query (see all_stats_fused_query)
+    instead of one query per metric, reusing closed days from the aggregate store when it is
+    enabled. Returns None on failure so callers can fall back to the per-metric fetch_* functions.
+    """
+    org_id = get_org_id()
+    if not org_id:
+        logger.error("❌ ORG_ID not found in environment variables. Please check your .env and restart the app.")
+        return None
+
+    try:
+        sealed_rows = _sealed_week_rows(org_id, start_date, end_date)
+        if sealed_rows is not None:
+            return _build_all_stats(sealed_rows)
+
+        if AGGREGATE_STORE_ENABLED:
+            return _fetch_all_stats_incremental(org_id, start_date, end_date)
+
+        if start_date and end_date:
+            logger.info("Fetching fused all stats for date range: %s to %s", start_date, end_date)
+        else:
+            logger.info("Fetching fused all stats for last 30 days (no date range provided)")
+        query = ALL_STATS_FUSED_TEMPLATE.bind(start_date, end_date, org_id)
+        client = get_client_pool()
+        rows = _json_each_row(client, query, settings=_query_settings("fused", start_date, end_date))
+        logger.info("Fused all stats query result: %d rows", len(rows))
+        return _build_all_stats(rows)
+    except Exception as e:
+        logger.exception("Error fetching fused all stats: %s", e)
+        return None
+
+def _bucket_start(day: date, bucket: str) -> date:
+    return day - timedelta(days=day.weekday()) if bucket == "week" else day
+
+def _bucket_step(bucket: str) -> timedelta:
+    return timedelta(weeks=1) if bucket == "week" else timedelta(days=1)
+
+def timeseries_range(bucket: str, tz_name: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Tuple[str, str]:
+    """
+    The requested range, or by default the last TIMESERIES_DEFAULT_BUCKETS[bucket] buckets
+    up to now, the first starting on a local bucket boundary so it is complete.
+    """
+    if start_date and end_date:
+        return start_date, end_date
+    zone = get_zone(tz_name)
+    now = datetime.now(zone).replace(second=0, microsecond=0)
+    first = _bucket_start(now.date(), bucket) - _bucket_step(bucket) * (TIMESERIES_DEFAULT_BUCKETS[bucket] - 1)
+    return datetime.combine(first, datetime.min.time(), zone).isoformat(), now.isoformat()
+
+def _bucket_starts(bucket: str, zone: ZoneInfo, start: datetime, end: datetime) -> List[date]:
+    """Local start dates of every bucket overlapping the UTC range [start, end)."""
+    local_start = start.replace(tzinfo=timezone.utc).astimezone(zone).date()
+    local_end = end.replace(tzinfo=timezone.utc).astimezone(zone)
+    day, starts = _bucket_start(local_start, bucket), []
+    while datetime.combine(day, datetime.min.time(), zone) < local_end:
+        starts.append(day)
+        day += _bucket_step(bucket)
+    return starts
+
+def _sealed_weeks(zone: ZoneInfo, starts: List[date], start: datetime, end: datetime) -> List[date]:
+    """Weeks of `starts` that lie wholly inside [start, end) and are sealed in WEEK_SNAPSHOTS."""
+    if not WEEK_SNAPSHOTS_ENABLED or zone.key not in WEEK_SNAPSHOT_TIMEZONES:
+        return []
+    return [
+        week_start for week_start in starts
+        if start <= week_bounds(week_start, zone)[0] and week_bounds(week_start, zone)[1] <= end
+        and WEEK_SNAPSHOTS.is_sealed(week_start, zone.key)
+    ]
+
+def fetch_all_stats_timeseries(bucket: str, tz_name: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[List[TimeSeriesBucket]]:
+    """
+    Every /all-stats metric per day or per week (Monday-based, in `tz_name`) of the range,
+    from one scan: the fused query groups by the bucket itself, so each bucket is a complete
+    result (distinct loads are counted within the bucket). Buckets without calls are
+    returned empty rather than left out. Raises ValueError for an unknown bucket or timezone,
+    returns None on query errors.
+    """
+    if bucket not in ALL_STATS_TIMESERIES_TEMPLATES:
+        raise ValueError(f"Unsupported bucket {bucket!r}, expected one of: {', '.join(TIMESERIES_BUCKETS)}")
+    zone = get_zone(tz_name)
+    org_id = get_org_id()
+    if not org_id:
+        logger.error("❌ ORG_ID not found in environment variables. Please check your .env and restart the app.")
+        return None
+    start_date, end_date = timeseries_range(bucket, zone.key, start_date, end_date)
+
+    def compute() -> Optional[List[TimeSeriesBucket]]:
+        try:
+            start, end = parse_utc(start_date), parse_utc(end_date)
+            starts = _bucket_starts(bucket, zone, start, end)
+            by_bucket: Dict[date, List[Dict[str, Any]]] = {}
+            sealed = _sealed_weeks(zone, starts, start, end) if bucket == "week" else []
+            for week_start in sealed:
+                rows = WEEK_SNAPSHOTS.get(org_id, zone.key, week_start)
+                if rows is not None:
+                    by_bucket[week_start] = rows
+            # Leading weeks served from snapshots are left out of the scan
+            missing = [day for day in starts if day not in by_bucket]
+            if missing:
+                query_start = max(start, week_bounds(missing[0], zone)[0]) if by_bucket else start
+                logger.info("Fetching %s time series for %s to %s (%s)", bucket, query_start, end, zone.key)
+                query = ALL_STATS_TIMESERIES_TEMPLATES[bucket].bind(query_start.isoformat(), end.isoformat(), org_id, tz=zone.key)
+                client = get_client_pool()
+                rows = _json_each_row(client, query, settings=_query_settings("fused", query_start.isoformat(), end_date))
+                logger.info("Time series query result: %d rows", len(rows))
+                queried: Dict[date, List[Dict[str, Any]]] = {day: [] for day in missing}
+                for r in rows:
+                    queried.setdefault(date.fromisoformat(str(r.pop("bucket"))), []).append(r)
+                for week_start in sealed:
+                    if week_start not in by_bucket:
+                        WEEK_SNAPSHOTS.put(org_id, zone.key, week_start, queried.get(week_start, []))
+                for day, day_rows in queried.items():
+                    by_bucket.setdefault(day, day_rows)
+            return [TimeSeriesBucket(start=day.isoformat(), stats=_build_all_stats(by_bucket.get(day, []))) for day in starts]
+        except Exception as e:
+            logger.exception("Error fetching %s time series: %s", bucket, e)
+            return None
+
+    return cached_call(f"all_stats_{bucket}_timeseries", UNIQUE_LOADS_NODE_IDS, start_date, end_date, compute, key_extra=(zone.key,))
+
+def fetch_all_stats_multi_range(ranges: Tuple[Tuple[str, str], ...]) -> Optional[List[AllStats]]:
+    """
+    Every /all-stats metric for each (start_date, end_date) of `ranges`, in order, from one
+    scan bounded by the earliest start and latest end: rows are labelled with every range
+    holding them and grouped by that label. Meant for ranges close together (week over
+    week); far-apart ranges are cheaper as separate queries. Returns None on failure.
+    """
+    org_id = get_org_id()
+    if not org_id:
+        logger.error("❌ ORG_ID not found in environment variables. Please check your .env and restart the app.")
+        return None
+    bounds = [(parse_utc(start), parse_utc(end)) for start, end in ranges]
+    start_date = min(b[0] for b in bounds).isoformat()
+    end_date = max(b[1] for b in bounds).isoformat()
+
+    def compute() -> Optional[List[AllStats]]:
+        try:
+            logger.info("Fetching fused all stats for %d ranges within %s to %s", len(ranges), start_date, end_date)
+            query = BoundQuery(ALL_STATS_MULTI_RANGE_SQL, {
+                "start": parse_utc(start_date),
+                "end": parse_utc(end_date),
+                "ranges": bounds,
+                "org_id": org_id,
+            })
+            client = get_client_pool()
+            rows = _json_each_row(client, query, settings=_query_settings("fused", start_date, end_date))
+            logger.info("Multi-range all stats query result: %d rows", len(rows))
+            by_range: Dict[int, List[Dict[str, Any]]] = {}
+            for r in rows:
+                by_range.setdefault(int(r.pop("bucket")), []).append(r)
+            return [_build_all_stats(by_range.get(i + 1, [])) for i in range(len(bounds))]
+        except Exception as e:
+            logger.exception("Error fetching multi-range all stats: %s", e)
+            return None
+
+    key_extra = tuple(f"{normalize_date(start)}/{normalize_date(end)}" for start, end in ranges)
+    return cached_call("all_stats_multi_range", UNIQUE_LOADS_NODE_IDS, start_date, end_date, compute, key_extra=key_extra)
+
+def backfill_week_snapshots(tz_name: str, weeks: int, force: bool = False) -> List[date]:
+    """
+    Snapshot the last `weeks` sealed weeks in `tz_name` into WEEK_SNAPSHOTS with one
+    weekly time series scan over the weeks still missing (all of them with `force`).
+    Returns the week starts written. Raises on query errors.
+    """
+    zone = get_zone(tz_name)
+    org_id = get_org_id()
+    if not org_id:
+        raise RuntimeError("ORG_ID not found in environment variables")
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    latest = _bucket_start(now.replace(tzinfo=timezone.utc).astimezone(zone).date(), "week")
+    while not WEEK_SNAPSHOTS.is_sealed(latest, zone.key, now):
+        latest -= timedelta(weeks=1)
+    candidates = [latest - timedelta(weeks=i) for i in reversed(range(weeks))]
+    missing = [w for w in candidates if force or not WEEK_SNAPSHOTS.has_current(WEEK_SNAPSHOTS.path(org_id, zone.key, w))]
+    if not missing:
+        return []
+    start, end = week_bounds(missing[0], zone)[0], week_bounds(missing[-1], zone)[1]
+    logger.info("Backfilling %d week snapshots (%s) from %s to %s", len(missing), zone.key, start, end)
+    query = ALL_STATS_TIMESERIES_TEMPLATES["week"].bind(start.isoformat(), end.isoformat(), org_id, tz=zone.key)
+    rows = _json_each_row(get_client_pool(), query, settings=_query_settings("fused", start.isoformat(), end.isoformat()))
+    by_week: Dict[date, List[Dict[str, Any]]] = {}
+    for r in rows:
+        by_week.setdefault(date.fromisoformat(str(r.pop("bucket"))), []).append(r)
+    return [w for w in missing if WEEK_SNAPSHOTS.put(org_id, zone.key, w, by_week.get(w, []), force=force)]
@@ -0,0 +1,116 @@
+# diagnostics.py
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from dates import parse_utc
+from query_templates import ORG_ID, BoundQuery, QueryTemplate, render
+from db import CLICKHOUSE_QUERY_SETTINGS, PEPSI_BROKER_NODE_ID, _json_each_row, get_client_pool, get_org_id
+from queries import call_stage_json_paths_query, node_output_coverage_query, transfer_attempt_values_query
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Diagnostic queries only run when /diagnostics/* is called, never from the metric fetchers.
+# They read a deterministic per-run sample and stop scanning after DIAGNOSTICS_MAX_ROWS_TO_READ
+# rows (read_overflow_mode=break returns what was read so far instead of failing).
+DIAGNOSTICS_SAMPLE_PERCENT = int(os.getenv("DIAGNOSTICS_SAMPLE_PERCENT", "10"))
+DIAGNOSTICS_MAX_ROWS_TO_READ = int(os.getenv("DIAGNOSTICS_MAX_ROWS_TO_READ", "50000000"))
+DIAGNOSTICS_MAX_LIMIT = 1000
+
+DIAGNOSTICS_SETTINGS = {
+    **CLICKHOUSE_QUERY_SETTINGS,
+    "max_execution_time": 30,
+    "max_rows_to_read": DIAGNOSTICS_MAX_ROWS_TO_READ,
+    "read_overflow_mode": "break",
+}
+
+
+def _clamp(value: Optional[int], default: int, upper: int) -> int:
+    return max(1, min(upper, default if value is None else value))
+
+
+def _require_org_id() -> str:
+    org_id = get_org_id()
+    if not org_id:
+        raise RuntimeError("ORG_ID not found in environment variables")
+    return org_id
+
+
+def fetch_transfer_attempt_values(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    sample_percent: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Counts of every transfer_attempt value on transfer rows (was run on every transfer-stats request)."""
+    org_id = _require_org_id()
+    sample_percent = _clamp(sample_percent, DIAGNOSTICS_SAMPLE_PERCENT, 100)
+    limit = _clamp(limit, 100, DIAGNOSTICS_MAX_LIMIT)
+    # sample_percent and limit are clamped ints, so they stay in the text; dates and org are bound
+    template = QueryTemplate(transfer_attempt_values_query, PEPSI_BROKER_NODE_ID, sample_percent, limit)
+    query = template.bind(start_date, end_date, org_id)
+    rows = _json_each_row(get_client_pool(), query, settings=DIAGNOSTICS_SETTINGS)
+    logger.info("Transfer attempt values diagnostic: %d values (%d%% sample)", len(rows), sample_percent)
+    return {
+        "sample_percent": sample_percent,
+        "values": [
+            {"transfer_attempt": r.get("transfer_attempt"), "count": int(r.get("count") or 0)}
+            for r in rows
+        ],
+    }
+
+
+def fetch_call_stage_diagnostics(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    sample_percent: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Why call stage stats may be empty: does the broker node have outputs for this org,
+    over which dates, and under which JSON path is call_stage stored.
+    """
+    org_id = _require_org_id()
+    sample_percent = _clamp(sample_percent, DIAGNOSTICS_SAMPLE_PERCENT, 100)
+    limit = _clamp(limit, 5, DIAGNOSTICS_MAX_LIMIT)
+    client = get_client_pool()
+
+    coverage_query = BoundQuery(render(node_output_coverage_query, ORG_ID, PEPSI_BROKER_NODE_ID, sample_percent), {"org_id": org_id})
+    coverage_rows = _json_each_row(client, coverage_query, settings=DIAGNOSTICS_SETTINGS)
+    coverage = coverage_rows[0] if coverage_rows else {}
+    total_nodes = int(coverage.get("total_nodes") or 0)
+
+    date_range_mismatch = None
+    if total_nodes and start_date and end_date and coverage.get("earliest_run") and coverage.get("latest_run"):
+        earliest, latest = parse_utc(str(coverage["earliest_run"])), parse_utc(str(coverage["latest_run"]))
+        qstart, qend = parse_utc(start_date), parse_utc(end_date)
+        date_range_mismatch = latest < qstart or earliest > qend
+
+    json_rows = []
+    if total_nodes:
+        json_paths_query = BoundQuery(render(call_stage_json_paths_query, ORG_ID, PEPSI_BROKER_NODE_ID, limit), {"org_id": org_id})
+        json_rows = _json_each_row(client, json_paths_query, settings=DIAGNOSTICS_SETTINGS)
+
+    return {
+        "org_id_prefix": org_id[:8],
+        "node_persistent_id": PEPSI_BROKER_NODE_ID,
+        "sample_percent": sample_percent,
+        "total_nodes": total_nodes,
+        "unique_runs": int(coverage.get("unique_runs") or 0),
+        "earliest_run": str(coverage["earliest_run"]) if total_nodes else None,
+        "latest_run": str(coverage["latest_run"]) if total_nodes else None,
+        "date_range_mismatch": date_range_mismatch,
+        "json_paths": [
+            {
+                "has_nested_path": bool(r.get("has_nested_path")),
+                "has_dot_path": bool(r.get("has_dot_path")),
+                "nested_value": str(r.get("nested_value") or "")[:50] or None,
+                "dot_value": str(r.get("dot_value") or "")[:50] or None,
+            }
+            for r in json_rows
+        ],
+    }
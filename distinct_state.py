@@ -0,0 +1,108 @@
+# distinct_state.py
+
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from typing import FrozenSet, Hashable, Iterable, Optional, Tuple, Union
+
+# "exact" merges per-day sets of hashed load ids; "hll" keeps a fixed-size HyperLogLog sketch
+# per day instead (about 1% error at the default precision, 2**precision bytes per day)
+UNIQUE_LOADS_COUNT_MODE = os.getenv("UNIQUE_LOADS_COUNT_MODE", "exact").lower()
+UNIQUE_LOADS_HLL_PRECISION = int(os.getenv("UNIQUE_LOADS_HLL_PRECISION", "14"))
+
+_HASH_BITS = 64
+
+
+class HyperLogLog:
+    """
+    HyperLogLog sketch over pre-hashed 64-bit values (ClickHouse cityHash64 of the load id).
+    Sketches with the same precision merge by taking the register-wise maximum.
+    """
+
+    def __init__(self, precision: int = UNIQUE_LOADS_HLL_PRECISION, registers: Optional[bytearray] = None):
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add_hash(self, value: int) -> None:
+        # Register: the top `precision` bits. Rank: trailing zeros of the other bits plus one,
+        # as unique_load_states_by_day_query computes it server-side in "hll" mode
+        remaining_bits = _HASH_BITS - self.precision
+        index = value >> remaining_bits
+        remainder = value & ((1 << remaining_bits) - 1)
+        rank = (remainder & -remainder).bit_length() if remainder else remaining_bits + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        registers = self.registers
+        for i, rank in enumerate(other.registers):
+            if rank > registers[i]:
+                registers[i] = rank
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small-range correction (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    @classmethod
+    def from_registers(cls, pairs: Iterable[Tuple[int, int]], precision: int = UNIQUE_LOADS_HLL_PRECISION) -> "HyperLogLog":
+        """A sketch from (register index, rank) pairs, e.g. computed by ClickHouse."""
+        sketch = cls(precision)
+        registers = sketch.registers
+        for index, rank in pairs:
+            if rank > registers[index]:
+                registers[index] = rank
+        return sketch
+
+    @classmethod
+    def from_hashes(cls, hashes: Iterable[int], precision: int = UNIQUE_LOADS_HLL_PRECISION) -> "HyperLogLog":
+        sketch = cls(precision)
+        for value in hashes:
+            sketch.add_hash(value)
+        return sketch
+
+
+@dataclass(frozen=True)
+class UniqueLoadsState:
+    """
+    Mergeable number_of_unique_loads state for one day (or a merged range): the distinct
+    loads, as a set of hashed or raw ids or as a HyperLogLog sketch, plus the call count.
+    """
+    loads: Union[FrozenSet[Hashable], HyperLogLog]
+    total_calls: int = 0
+
+    @property
+    def number_of_unique_loads(self) -> int:
+        if isinstance(self.loads, HyperLogLog):
+            return self.loads.count()
+        return len(self.loads)
+
+
+def empty_state(mode: str = "exact") -> UniqueLoadsState:
+    return UniqueLoadsState(loads=HyperLogLog() if mode == "hll" else frozenset())
+
+
+def merge_states(states: Iterable[UniqueLoadsState], mode: str = "exact") -> UniqueLoadsState:
+    total_calls = 0
+    if mode == "hll":
+        sketch = HyperLogLog()
+        for state in states:
+            sketch.merge(state.loads)
+            total_calls += state.total_calls
+        return UniqueLoadsState(loads=sketch, total_calls=total_calls)
+    loads = set()
+    for state in states:
+        loads.update(state.loads)
+        total_calls += state.total_calls
+    return UniqueLoadsState(loads=frozenset(loads), total_calls=total_calls)
@@ -0,0 +1,169 @@
+# executor.py
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# The fetch_* functions are blocking (clickhouse-connect is a sync HTTP client), so routes
+# hand them to this executor instead of running them on the event loop. It is sized for
+# ClickHouse concurrency, by default the same as the client pool, so a worker thread never
+# sits waiting for a free connection.
+CLICKHOUSE_MAX_CONCURRENCY = int(
+    os.getenv("CLICKHOUSE_MAX_CONCURRENCY") or os.getenv("CLICKHOUSE_POOL_SIZE", "8")
+)
+
+# Fan-out limits for endpoints that run several metrics at once (/all-stats, fetch_pepsi_data):
+# at most FANOUT_MAX_CONCURRENCY metrics of one request run together, and a metric still
+# running after METRIC_TIMEOUT_SECONDS is reported as an error instead of holding up the rest.
+FANOUT_MAX_CONCURRENCY = int(os.getenv("FANOUT_MAX_CONCURRENCY") or CLICKHOUSE_MAX_CONCURRENCY)
+METRIC_TIMEOUT_SECONDS = float(os.getenv("METRIC_TIMEOUT_SECONDS", "150"))
+
+# name -> (fetch function, positional args)
+MetricCalls = Dict[str, Tuple[Callable[..., Any], Sequence[Any]]]
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class MetricTimeoutError(TimeoutError):
+    """A metric did not finish within its fan-out deadline."""
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=CLICKHOUSE_MAX_CONCURRENCY,
+            thread_name_prefix="clickhouse",
+        )
+        logger.info("Created ClickHouse executor with %d workers", CLICKHOUSE_MAX_CONCURRENCY)
+    return _executor
+
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking call (e.g. a fetch_* function) on the ClickHouse executor and await it.
+    The caller's contextvars are copied into the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+def shutdown_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _dedupe_calls(calls: MetricCalls) -> Dict[Tuple[Any, ...], List[str]]:
+    """Group metric names by (function, args) so identical fetches run once."""
+    unique: Dict[Tuple[Any, ...], List[str]] = {}
+    for name, (fn, args) in calls.items():
+        unique.setdefault((fn, tuple(args)), []).append(name)
+    return unique
+
+
+def _timeout_error(names: List[str], timeout: float) -> MetricTimeoutError:
+    return MetricTimeoutError(f"{', '.join(names)} timed out after {timeout:g}s")
+
+
+async def gather_metrics(
+    calls: MetricCalls,
+    max_concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[Dict[str, Any], Dict[str, BaseException]]:
+    """
+    Run independent metric fetches in parallel on the ClickHouse executor.
+
+    Identical calls are only run once and shared by every name that asked for them.
+    Returns (results, errors) keyed by metric name; a metric that raised or ran past
+    its deadline is in `errors` (a MetricTimeoutError for deadlines) instead of `results`.
+    """
+    cap = max_concurrency or FANOUT_MAX_CONCURRENCY
+    timeout = METRIC_TIMEOUT_SECONDS if timeout is None else timeout
+    unique = _dedupe_calls(calls)
+    semaphore = asyncio.Semaphore(cap)
+
+    async def run_one(key: Tuple[Any, ...]) -> Any:
+        fn, args = key
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(run_blocking(fn, *args), timeout)
+            except asyncio.TimeoutError:
+                raise _timeout_error(unique[key], timeout) from None
+
+    keys = list(unique)
+    outcomes = await asyncio.gather(*[run_one(key) for key in keys], return_exceptions=True)
+
+    results: Dict[str, Any] = {}
+    errors: Dict[str, BaseException] = {}
+    for key, outcome in zip(keys, outcomes):
+        for name in unique[key]:
+            if isinstance(outcome, BaseException):
+                errors[name] = outcome
+            else:
+                results[name] = outcome
+    return results, errors
+
+
+def fan_out(
+    calls: MetricCalls,
+    max_concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[Dict[str, Any], Dict[str, BaseException]]:
+    """
+    Blocking counterpart of gather_metrics for sync callers such as fetch_pepsi_data.
+    Must not be called from an executor worker thread: it waits on tasks queued on the
+    same executor.
+    """
+    cap = max_concurrency or FANOUT_MAX_CONCURRENCY
+    timeout = METRIC_TIMEOUT_SECONDS if timeout is None else timeout
+    unique = _dedupe_calls(calls)
+    pending = list(unique)
+    running: Dict[Future, Tuple[Tuple[Any, ...], float]] = {}
+    results: Dict[str, Any] = {}
+    errors: Dict[str, BaseException] = {}
+
+    def finish(key: Tuple[Any, ...], value: Any = None, error: Optional[BaseException] = None) -> None:
+        for name in unique[key]:
+            if error is not None:
+                errors[name] = error
+            else:
+                results[name] = value
+
+    while pending or running:
+        while pending and len(running) < cap:
+            key = pending.pop(0)
+            fn, args = key
+            future = get_executor().submit(contextvars.copy_context().run, fn, *args)
+            running[future] = (key, time.monotonic() + timeout)
+
+        next_deadline = min(deadline for _, deadline in running.values())
+        done, _ = wait(list(running), timeout=max(0.0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            key, _ = running.pop(future)
+            try:
+                finish(key, value=future.result())
+            except Exception as e:
+                finish(key, error=e)
+
+        now = time.monotonic()
+        for future, (key, deadline) in list(running.items()):
+            if deadline <= now:
+                # The worker thread keeps going until ClickHouse gives up; we just stop waiting
+                running.pop(future)
+                future.cancel()
+                finish(key, error=_timeout_error(unique[key], timeout))
+    return results, errors
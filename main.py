@@ -1,10 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from db import fetch_calls_ending_in_each_call_stage_stats, fetch_carrier_asked_transfer_over_total_transfer_attempts_stats, fetch_carrier_asked_transfer_over_total_call_attempts_stats,fetch_load_not_found_stats, fetch_load_status_stats, fetch_successfully_transferred_for_booking_stats, fetch_call_classifcation_stats, fetch_carrier_qualification_stats, fetch_pricing_stats, fetch_carrier_end_state_stats, fetch_percent_non_convertible_calls, fetch_number_of_unique_loads, fetch_list_of_unique_loads, fetch_calls_without_carrier_asked_for_transfer, fetch_total_calls_and_total_duration, fetch_duration_carrier_asked_for_transfer
-from typing import Optional
+from db import init_client_pool, close_client_pool, client_pool_stats, fetch_calls_ending_in_each_call_stage_stats, fetch_carrier_asked_transfer_over_total_transfer_attempts_stats, fetch_carrier_asked_transfer_over_total_call_attempts_stats,fetch_load_not_found_stats, fetch_load_status_stats, fetch_successfully_transferred_for_booking_stats, fetch_call_classifcation_stats, fetch_carrier_qualification_stats, fetch_pricing_stats, fetch_carrier_end_state_stats, fetch_percent_non_convertible_calls, fetch_number_of_unique_loads, fetch_list_of_unique_loads, fetch_calls_without_carrier_asked_for_transfer, fetch_total_calls_and_total_duration, fetch_duration_carrier_asked_for_transfer, fetch_all_stats_fused, fetch_all_stats_timeseries, stream_list_of_unique_loads
+from aggregate_store import DAY_AGGREGATE_STORE
+from dates import parse_utc
+from snapshot_store import WEEK_SNAPSHOTS
+from batch import BATCH_MAX_ITEMS, BatchItem, collect_batch, plan_batch
+from cache import RESULT_CACHE, METRIC_SINGLE_FLIGHT
+from diagnostics import fetch_call_stage_diagnostics, fetch_transfer_attempt_values
+from executor import run_blocking, gather_metrics, shutdown_executor
+from warmup import READINESS, warm_up
+from tracing import TracingMiddleware
+from serializers import NUMBER_OF_UNIQUE_LOADS_ROUTE_SPEC, to_payload
+from responses import CompressionMiddleware, ORJSONResponse, cached_response, encode_body, encoded_response, negotiate, negotiated_response, response_variant
+from prometheus import CONTENT_TYPE as PROMETHEUS_CONTENT_TYPE, REGISTRY as PROMETHEUS_REGISTRY, PrometheusMiddleware, register_stats
+from typing import Iterable, Iterator, List, Optional
+from pydantic import BaseModel
+import asyncio
+import csv
+import io
+import itertools
+import json
 import os
 from pathlib import Path
+from zoneinfo import ZoneInfoNotFoundError
 
 # Load environment variables from .env file
 # Get the directory where this file is located
@@ -25,10 +45,28 @@ else:
     print("[WARNING] Trying to load from current directory...")
     load_dotenv()  # Fallback to default behavior
 
+def check_dates(*values: Optional[str]) -> None:
+    """422 for a start/end date parse_utc cannot read, rather than the 500 of the query it would fail."""
+    for value in values:
+        if value:
+            try:
+                parse_utc(value)
+            except ValueError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+
+
+def check_date_params(request: Request) -> None:
+    check_dates(request.query_params.get("start_date"), request.query_params.get("end_date"))
+
+
 app = FastAPI(
     title="Pepsi Weekly Analytics API",
     description="API server for PepsiCo weekly analytics",
-    version="1.0.0"
+    version="1.0.0",
+    # Routes returning plain dicts are still encoded with orjson; see responses.py
+    default_response_class=ORJSONResponse,
+    # Every route taking start_date/end_date gets them validated before it runs
+    dependencies=[Depends(check_date_params)],
 )
 
 # Configure CORS
@@ -47,6 +85,97 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(TracingMiddleware)
+
+# Counters the caches and the client pool already keep, exposed on /metrics at scrape time
+register_stats("result_cache_stat", "Result cache counters (hits, misses, hit_ratio, ...)", "stat", RESULT_CACHE.stats)
+register_stats("single_flight_stat", "Request coalescing counters", "stat", METRIC_SINGLE_FLIGHT.stats)
+register_stats("aggregate_store_stat", "Day aggregate store counters (day_hits, day_misses, ...)", "stat", DAY_AGGREGATE_STORE.stats)
+register_stats("week_snapshot_stat", "Closed-week snapshot store counters (hits, misses, writes)", "stat", WEEK_SNAPSHOTS.stats)
+register_stats("clickhouse_pool_stat", "ClickHouse client pool (size, open, idle, in_use, rebuilds)", "stat", client_pool_stats)
+
+# /all-stats computes every metric with one fused ClickHouse query unless disabled here
+# (or per request with ?fused=false), in which case each metric runs its own query
+ALL_STATS_FUSED = os.getenv("ALL_STATS_FUSED", "true").lower() in ("true", "1", "yes")
+
+# /all-stats section -> the fetch_* function that computes it on the per-metric path
+ALL_STATS_FETCHERS = {
+    "call_stage_stats": fetch_calls_ending_in_each_call_stage_stats,
+    "carrier_asked_transfer_over_total_transfer_attempts": fetch_carrier_asked_transfer_over_total_transfer_attempts_stats,
+    "carrier_asked_transfer_over_total_call_attempts": fetch_carrier_asked_transfer_over_total_call_attempts_stats,
+    "load_not_found": fetch_load_not_found_stats,
+    "load_status": fetch_load_status_stats,
+    "successfully_transferred_for_booking": fetch_successfully_transferred_for_booking_stats,
+    "call_classification": fetch_call_classifcation_stats,
+    "carrier_qualification": fetch_carrier_qualification_stats,
+    "pricing": fetch_pricing_stats,
+    "carrier_end_state": fetch_carrier_end_state_stats,
+    "percent_non_convertible_calls": fetch_percent_non_convertible_calls,
+    "number_of_unique_loads": fetch_number_of_unique_loads,
+}
+# Metrics whose fetch_* returns None only when it failed: the lists ([] when there were no
+# calls) and number_of_unique_loads (its aggregate query always returns a row)
+NONE_MEANS_FAILED = ("call_stage_stats", "load_status", "call_classification", "carrier_qualification", "pricing", "carrier_end_state", "number_of_unique_loads")
+
+
+# ?format= values accepted by the streaming endpoints and their content types
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+# Rows per chunk written to a streaming response
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "1000"))
+
+
+def found(result, what: str):
+    """`result`, or a 500 for the None a fetch_* function returns when its query failed."""
+    if result is None:
+        raise HTTPException(status_code=500, detail=f"Error fetching {what}")
+    return result
+
+
+def encode_load_id_chunks(load_ids: Iterable[str], output_format: str) -> Iterator[str]:
+    """Encode load ids as NDJSON or CSV, STREAM_CHUNK_ROWS rows per yielded chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if output_format == "csv":
+        writer.writerow(["custom_load_id"])
+    rows = 0
+    for load_id in load_ids:
+        if output_format == "csv":
+            writer.writerow([load_id])
+        else:
+            buffer.write(json.dumps({"custom_load_id": load_id}))
+            buffer.write("\n")
+        rows += 1
+        if rows % STREAM_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# Background warm-up started at startup; kept referenced so it is not garbage collected
+_warmup_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def open_clickhouse_pool():
+    """Open the shared ClickHouse client pool, then warm it up and prefill caches in the background (see /ready)"""
+    global _warmup_task
+    init_client_pool()
+    _warmup_task = asyncio.create_task(warm_up())
+
+
+@app.on_event("shutdown")
+async def close_clickhouse_pool():
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+    shutdown_executor()
+    close_client_pool()
 
 
 @app.get("/")
@@ -60,13 +189,57 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until connections are open and the default views are cached"""
+    snapshot = READINESS.snapshot()
+    return JSONResponse(snapshot, status_code=200 if READINESS.ready else 503)
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Result cache, request coalescing, day aggregate store and week snapshot counters"""
+    return {
+        "result_cache": RESULT_CACHE.stats(),
+        "single_flight": METRIC_SINGLE_FLIGHT.stats(),
+        "aggregate_store": DAY_AGGREGATE_STORE.stats(),
+        "week_snapshots": WEEK_SNAPSHOTS.stats(),
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: route and fetch latencies, ClickHouse read stats, cache counters"""
+    # Set as a header: media_type would get a second "; charset=" appended
+    return PlainTextResponse(PROMETHEUS_REGISTRY.render(), headers={"content-type": PROMETHEUS_CONTENT_TYPE})
+
+@app.get("/diagnostics/transfer-attempt-values")
+async def get_transfer_attempt_values_diagnostics(start_date: Optional[str] = None, end_date: Optional[str] = None, sample_percent: Optional[int] = None, limit: Optional[int] = None):
+    """Counts of each transfer_attempt value on transfer rows (sampled, LIMIT-bounded)"""
+    try:
+        return await run_blocking(fetch_transfer_attempt_values, start_date, end_date, sample_percent, limit)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.exception("Error in get_transfer_attempt_values_diagnostics endpoint")
+        raise HTTPException(status_code=500, detail=f"Error running transfer attempt diagnostics: {str(e)}")
+
+@app.get("/diagnostics/call-stage")
+async def get_call_stage_diagnostics(start_date: Optional[str] = None, end_date: Optional[str] = None, sample_percent: Optional[int] = None, limit: Optional[int] = None):
+    """Broker node coverage, run date range and call_stage JSON paths, for empty call stage stats"""
+    try:
+        return await run_blocking(fetch_call_stage_diagnostics, start_date, end_date, sample_percent, limit)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.exception("Error in get_call_stage_diagnostics endpoint")
+        raise HTTPException(status_code=500, detail=f"Error running call stage diagnostics: {str(e)}")
+
 @app.get("/call-stage-stats")
-async def get_call_stage_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_call_stage_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get call stage stats"""
     try:
-        results = fetch_calls_ending_in_each_call_stage_stats(start_date, end_date)
-        # Convert dataclass objects to dictionaries for JSON serialization
-        return [{"call_stage": r.call_stage, "count": r.count, "percentage": r.percentage} for r in results]
+        def build(results):
+            return to_payload(found(results, "call stage stats"))
+        return await cached_response(request, fetch_calls_ending_in_each_call_stage_stats, start_date, end_date, build)
     except Exception as e:
         # Log the error and return a proper HTTP error response
         import logging
@@ -75,18 +248,14 @@ async def get_call_stage_stats(start_date: Optional[str] = None, end_date: Optio
         raise HTTPException(status_code=500, detail=f"Error fetching call stage stats: {str(e)}")
 
 @app.get("/carrier-asked-transfer-over-total-transfer-attempts-stats")
-async def get_carrier_asked_transfer_over_total_transfer_attempts_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_carrier_asked_transfer_over_total_transfer_attempts_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get carrier asked transfer over total transfer attempts stats"""
     try:
-        result = fetch_carrier_asked_transfer_over_total_transfer_attempts_stats(start_date, end_date)
-        if result is None:
-            raise HTTPException(status_code=404, detail="No carrier asked transfer over total transfer attempts stats found")
-        # Convert dataclass object to dictionary for JSON serialization
-        return {
-            "carrier_asked_count": result.carrier_asked_count,
-            "total_transfer_attempts": result.total_transfer_attempts,
-            "carrier_asked_percentage": result.carrier_asked_percentage
-        }
+        def build(result):
+            if result is None:
+                raise HTTPException(status_code=404, detail="No carrier asked transfer over total transfer attempts stats found")
+            return to_payload(result)
+        return await cached_response(request, fetch_carrier_asked_transfer_over_total_transfer_attempts_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -94,18 +263,14 @@ async def get_carrier_asked_transfer_over_total_transfer_attempts_stats(start_da
         raise HTTPException(status_code=500, detail=f"Error fetching carrier asked transfer over total transfer attempts stats: {str(e)}")
 
 @app.get("/carrier-asked-transfer-over-total-call-attempts-stats")
-async def get_carrier_asked_transfer_over_total_call_attempts_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_carrier_asked_transfer_over_total_call_attempts_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get carrier asked transfer over total call attempts stats"""
     try:
-        result = fetch_carrier_asked_transfer_over_total_call_attempts_stats(start_date, end_date)
-        if result is None:
-            raise HTTPException(status_code=404, detail="No carrier asked transfer over total call attempts stats found")
-        # Convert dataclass object to dictionary for JSON serialization
-        return {
-            "carrier_asked_count": result.carrier_asked_count,
-            "total_call_attempts": result.total_call_attempts,
-            "carrier_asked_percentage": result.carrier_asked_percentage
-        }
+        def build(result):
+            if result is None:
+                raise HTTPException(status_code=404, detail="No carrier asked transfer over total call attempts stats found")
+            return to_payload(result)
+        return await cached_response(request, fetch_carrier_asked_transfer_over_total_call_attempts_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -113,18 +278,14 @@ async def get_carrier_asked_transfer_over_total_call_attempts_stats(start_date:
         raise HTTPException(status_code=500, detail=f"Error fetching carrier asked transfer over total call attempts stats: {str(e)}")
 
 @app.get("/load-not-found-stats")
-async def get_load_not_found_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_load_not_found_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get load not found stats"""
     try:
-        result = fetch_load_not_found_stats(start_date, end_date)
-        if result is None:
-            raise HTTPException(status_code=404, detail="No load not found stats found")
-        # Convert dataclass object to dictionary for JSON serialization
-        return {
-            "load_not_found_count": result.load_not_found_count,
-            "total_calls": result.total_calls,
-            "load_not_found_percentage": result.load_not_found_percentage
-        }
+        def build(result):
+            if result is None:
+                raise HTTPException(status_code=404, detail="No load not found stats found")
+            return to_payload(result)
+        return await cached_response(request, fetch_load_not_found_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -132,15 +293,16 @@ async def get_load_not_found_stats(start_date: Optional[str] = None, end_date: O
         raise HTTPException(status_code=500, detail=f"Error fetching load not found stats: {str(e)}")
 
 @app.get("/load-status-stats")
-async def get_load_status_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_load_status_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get load status stats"""
     try:
-        result = fetch_load_status_stats(start_date, end_date)
-        if result is None:
-            raise HTTPException(status_code=500, detail="Error fetching load status stats")
-        if not result:
-            return []
-        return [{"load_status": r.load_status, "count": r.count, "total_calls": r.total_calls, "load_status_percentage": r.load_status_percentage} for r in result]
+        def build(result):
+            if result is None:
+                raise HTTPException(status_code=500, detail="Error fetching load status stats")
+            if not result:
+                return []
+            return to_payload(result)
+        return await cached_response(request, fetch_load_status_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -148,18 +310,14 @@ async def get_load_status_stats(start_date: Optional[str] = None, end_date: Opti
         raise HTTPException(status_code=500, detail=f"Error fetching load status stats: {str(e)}")
 
 @app.get("/successfully-transferred-for-booking-stats")
-async def get_successfully_transferred_for_booking_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_successfully_transferred_for_booking_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get successfully transferred for booking stats"""
     try:
-        result = fetch_successfully_transferred_for_booking_stats(start_date, end_date)
-        if result is None:
-            raise HTTPException(status_code=404, detail="No successfully transferred for booking stats found")
-        # Convert dataclass object to dictionary for JSON serialization
-        return {
-            "successfully_transferred_for_booking_count": result.successfully_transferred_for_booking_count,
-            "total_calls": result.total_calls,
-            "successfully_transferred_for_booking_percentage": result.successfully_transferred_for_booking_percentage
-        }
+        def build(result):
+            if result is None:
+                raise HTTPException(status_code=404, detail="No successfully transferred for booking stats found")
+            return to_payload(result)
+        return await cached_response(request, fetch_successfully_transferred_for_booking_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -167,11 +325,12 @@ async def get_successfully_transferred_for_booking_stats(start_date: Optional[st
         raise HTTPException(status_code=500, detail=f"Error fetching successfully transferred for booking stats: {str(e)}")
 
 @app.get("/call-classification-stats")
-async def get_call_classification_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_call_classification_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get call classification stats"""
     try:
-        results = fetch_call_classifcation_stats(start_date, end_date)
-        return [{"call_classification": r.call_classification, "count": r.count, "percentage": r.percentage} for r in results]
+        def build(results):
+            return to_payload(found(results, "call classification stats"))
+        return await cached_response(request, fetch_call_classifcation_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -179,11 +338,12 @@ async def get_call_classification_stats(start_date: Optional[str] = None, end_da
         raise HTTPException(status_code=500, detail=f"Error fetching call classification stats: {str(e)}")
 
 @app.get("/carrier-qualification-stats")
-async def get_carrier_qualification_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_carrier_qualification_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get carrier qualification stats"""
     try:
-        results = fetch_carrier_qualification_stats(start_date, end_date)
-        return [{"carrier_qualification": r.carrier_qualification, "count": r.count, "percentage": r.percentage} for r in results]
+        def build(results):
+            return to_payload(found(results, "carrier qualification stats"))
+        return await cached_response(request, fetch_carrier_qualification_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -192,11 +352,12 @@ async def get_carrier_qualification_stats(start_date: Optional[str] = None, end_
 
 
 @app.get("/pricing-stats")
-async def get_pricing_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_pricing_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get pricing stats"""
     try:
-        results = fetch_pricing_stats(start_date, end_date)
-        return [{"pricing_notes": r.pricing_notes, "count": r.count, "percentage": r.percentage} for r in results]
+        def build(results):
+            return to_payload(found(results, "pricing stats"))
+        return await cached_response(request, fetch_pricing_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -204,11 +365,12 @@ async def get_pricing_stats(start_date: Optional[str] = None, end_date: Optional
         raise HTTPException(status_code=500, detail=f"Error fetching pricing stats: {str(e)}")
 
 @app.get("/carrier-end-state-stats")
-async def get_carrier_end_state_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_carrier_end_state_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get carrier end state stats"""
     try:
-        results = fetch_carrier_end_state_stats(start_date, end_date)
-        return [{"carrier_end_state": r.carrier_end_state, "count": r.count, "percentage": r.percentage} for r in results]
+        def build(results):
+            return to_payload(found(results, "carrier end state stats"))
+        return await cached_response(request, fetch_carrier_end_state_stats, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -216,15 +378,12 @@ async def get_carrier_end_state_stats(start_date: Optional[str] = None, end_date
         raise HTTPException(status_code=500, detail=f"Error fetching carrier end state stats: {str(e)}")
 
 @app.get("/percent-non-convertible-calls-stats")
-async def get_percent_non_convertible_calls_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_percent_non_convertible_calls_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get percent non convertible calls stats"""
     try:
-        result = fetch_percent_non_convertible_calls(start_date, end_date)
-        return {
-            "non_convertible_calls_count": result.non_convertible_calls_count,
-            "total_calls_count": result.total_calls_count,
-            "non_convertible_calls_percentage": result.non_convertible_calls_percentage
-        }
+        def build(result):
+            return to_payload(found(result, "percent non convertible calls stats"))
+        return await cached_response(request, fetch_percent_non_convertible_calls, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -232,16 +391,12 @@ async def get_percent_non_convertible_calls_stats(start_date: Optional[str] = No
         raise HTTPException(status_code=500, detail=f"Error fetching percent non convertible calls stats: {str(e)}")
 
 @app.get("/number-of-unique-loads-stats")
-async def get_number_of_unique_loads_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_number_of_unique_loads_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get number of unique loads stats"""
     try:
-        result = fetch_number_of_unique_loads(start_date, end_date)
-        return {
-            "number_of_unique_loads": result.number_of_unique_loads,
-            "total_calls_count": result.total_calls,
-            "number_of_unique_loads_percentage": result.calls_per_unique_load
-
-        }
+        def build(result):
+            return to_payload(found(result, "number of unique loads stats"), NUMBER_OF_UNIQUE_LOADS_ROUTE_SPEC)
+        return await cached_response(request, fetch_number_of_unique_loads, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -249,199 +404,164 @@ async def get_number_of_unique_loads_stats(start_date: Optional[str] = None, end
         raise HTTPException(status_code=500, detail=f"Error fetching number of unique loads stats: {str(e)}")
 
 @app.get("/list-of-unique-loads-stats")
-async def get_list_of_unique_loads_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
-    """Get list of unique loads stats"""
+async def get_list_of_unique_loads_stats(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    output_format: Optional[str] = Query(None, alias="format"),
+):
+    """Get list of unique loads stats (?format=ndjson|csv streams the load ids instead)"""
+    if output_format is not None:
+        return await stream_list_of_unique_loads_response(start_date, end_date, output_format)
     try:
-        result = fetch_list_of_unique_loads(start_date, end_date)
-        if result:
-            return {
-                "list_of_unique_loads": result.list_of_unique_loads
-            }
-        else:
-            return {
-                "list_of_unique_loads": []
-            }
+        def build(result):
+            return to_payload(result) if result else {"list_of_unique_loads": []}
+        return await cached_response(request, fetch_list_of_unique_loads, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
         logger.exception("Error in get_list_of_unique_loads_stats endpoint")
         raise HTTPException(status_code=500, detail=f"Error fetching list of unique loads stats: {str(e)}")
 
-@app.get("/all-stats")
-async def get_all_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
-    """Get all stats aggregated with labels"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    stats = {}
-    errors = {}
-    
-    # Call stage stats
-    try:
-        call_stage_results = fetch_calls_ending_in_each_call_stage_stats(start_date, end_date)
-        stats["call_stage_stats"] = [{"call_stage": r.call_stage, "count": r.count, "percentage": r.percentage} for r in call_stage_results]
-    except Exception as e:
-        logger.exception("Error fetching call stage stats")
-        errors["call_stage_stats"] = str(e)
-        stats["call_stage_stats"] = None
-    
-    # Carrier asked transfer over total transfer attempts
-    try:
-        carrier_transfer_result = fetch_carrier_asked_transfer_over_total_transfer_attempts_stats(start_date, end_date)
-        if carrier_transfer_result:
-            stats["carrier_asked_transfer_over_total_transfer_attempts"] = {
-                "carrier_asked_count": carrier_transfer_result.carrier_asked_count,
-                "total_transfer_attempts": carrier_transfer_result.total_transfer_attempts,
-                "carrier_asked_percentage": carrier_transfer_result.carrier_asked_percentage
-            }
-        else:
-            stats["carrier_asked_transfer_over_total_transfer_attempts"] = None
-    except Exception as e:
-        logger.exception("Error fetching carrier asked transfer over total transfer attempts stats")
-        errors["carrier_asked_transfer_over_total_transfer_attempts"] = str(e)
-        stats["carrier_asked_transfer_over_total_transfer_attempts"] = None
-    
-    # Carrier asked transfer over total call attempts
+async def stream_list_of_unique_loads_response(start_date: Optional[str], end_date: Optional[str], output_format: str) -> StreamingResponse:
+    media_type = STREAM_MEDIA_TYPES.get(output_format)
+    if media_type is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported format {output_format!r}, expected one of: {', '.join(STREAM_MEDIA_TYPES)}")
+    chunks = encode_load_id_chunks(stream_list_of_unique_loads(start_date, end_date), output_format)
     try:
-        carrier_call_result = fetch_carrier_asked_transfer_over_total_call_attempts_stats(start_date, end_date)
-        if carrier_call_result:
-            stats["carrier_asked_transfer_over_total_call_attempts"] = {
-                "carrier_asked_count": carrier_call_result.carrier_asked_count,
-                "total_call_attempts": carrier_call_result.total_call_attempts,
-                "carrier_asked_percentage": carrier_call_result.carrier_asked_percentage
-            }
-        else:
-            stats["carrier_asked_transfer_over_total_call_attempts"] = None
+        # Run the query up to the first chunk here, so a failing query is still a 500
+        first_chunk = await run_blocking(next, chunks, None)
     except Exception as e:
-        logger.exception("Error fetching carrier asked transfer over total call attempts stats")
-        errors["carrier_asked_transfer_over_total_call_attempts"] = str(e)
-        stats["carrier_asked_transfer_over_total_call_attempts"] = None
-    
-    # Load not found stats
-    try:
-        load_not_found_result = fetch_load_not_found_stats(start_date, end_date)
-        if load_not_found_result:
-            stats["load_not_found"] = {
-                "load_not_found_count": load_not_found_result.load_not_found_count,
-                "total_calls": load_not_found_result.total_calls,
-                "load_not_found_percentage": load_not_found_result.load_not_found_percentage
-            }
-        else:
-            stats["load_not_found"] = None
-    except Exception as e:
-        logger.exception("Error fetching load not found stats")
-        errors["load_not_found"] = str(e)
-        stats["load_not_found"] = None
-    
-    # Load status stats
-    try:
-        load_status_results = fetch_load_status_stats(start_date, end_date)
-        if load_status_results:
-            stats["load_status"] = [{"load_status": r.load_status, "count": r.count, "total_calls": r.total_calls, "load_status_percentage": r.load_status_percentage} for r in load_status_results]
-        else:
-            stats["load_status"] = None
-    except Exception as e:
-        logger.exception("Error fetching load status stats")
-        errors["load_status"] = str(e)
-        stats["load_status"] = None
-    
-    # Successfully transferred for booking stats
-    try:
-        transferred_result = fetch_successfully_transferred_for_booking_stats(start_date, end_date)
-        if transferred_result:
-            stats["successfully_transferred_for_booking"] = {
-                "successfully_transferred_for_booking_count": transferred_result.successfully_transferred_for_booking_count,
-                "total_calls": transferred_result.total_calls,
-                "successfully_transferred_for_booking_percentage": transferred_result.successfully_transferred_for_booking_percentage
-            }
-        else:
-            stats["successfully_transferred_for_booking"] = None
-    except Exception as e:
-        logger.exception("Error fetching successfully transferred for booking stats")
-        errors["successfully_transferred_for_booking"] = str(e)
-        stats["successfully_transferred_for_booking"] = None
-    
-    # Call classification stats
-    try:
-        call_classification_results = fetch_call_classifcation_stats(start_date, end_date)
-        if call_classification_results:
-            stats["call_classification"] = [{"call_classification": r.call_classification, "count": r.count, "percentage": r.percentage} for r in call_classification_results]
-        else:
-            stats["call_classification"] = None
-    except Exception as e:
-        logger.exception("Error fetching call classification stats")
-        errors["call_classification"] = str(e)
-        stats["call_classification"] = None
-    
-    # Carrier qualification stats
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.exception("Error in get_list_of_unique_loads_stats stream")
+        raise HTTPException(status_code=500, detail=f"Error fetching list of unique loads stats: {str(e)}")
+    body = itertools.chain([first_chunk], chunks) if first_chunk is not None else iter(())
+    return StreamingResponse(body, media_type=media_type)
+
+@app.get("/timeseries/{metric}")
+async def get_timeseries(request: Request, metric: str, bucket: str = "week", tz: str = "UTC", start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """
+    One /all-stats section (or "all" of them) per day or week of the range, from a single
+    query. Weeks start on Monday in `tz`; without dates the last 12 weeks / 30 days are returned.
+    """
+    if metric != "all" and metric not in ALL_STATS_FETCHERS:
+        raise HTTPException(status_code=404, detail=f"Unknown metric {metric!r}, expected 'all' or one of: {', '.join(ALL_STATS_FETCHERS)}")
     try:
-        carrier_qualification_results = fetch_carrier_qualification_stats(start_date, end_date)
-        if carrier_qualification_results:
-            stats["carrier_qualification"] = [{"carrier_qualification": r.carrier_qualification, "count": r.count, "percentage": r.percentage} for r in carrier_qualification_results]
-        else:
-            stats["carrier_qualification"] = None
+        buckets = await run_blocking(fetch_all_stats_timeseries, bucket, tz, start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ZoneInfoNotFoundError:
+        raise HTTPException(status_code=400, detail=f"Unknown timezone {tz!r}")
     except Exception as e:
-        logger.exception("Error fetching carrier qualification stats")
-        errors["carrier_qualification"] = str(e)
-        stats["carrier_qualification"] = None
-    
-    # Pricing stats
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.exception("Error in get_timeseries endpoint")
+        raise HTTPException(status_code=500, detail=f"Error fetching time series: {str(e)}")
+    if buckets is None:
+        raise HTTPException(status_code=500, detail="Error fetching time series")
+    return await negotiated_response(request, {
+        "metric": metric,
+        "bucket": bucket,
+        "tz": tz,
+        "buckets": [
+            {"start": b.start, "value": to_payload(b.stats if metric == "all" else getattr(b.stats, metric))}
+            for b in buckets
+        ],
+    })
+
+class BatchRequestItem(BaseModel):
+    # Key of the item in the response; defaults to its position in `items`
+    id: Optional[str] = None
+    metric: str
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchRequestItem]
+
+
+@app.post("/batch")
+async def post_batch(request: Request, batch_request: BatchRequest):
+    """
+    Many (metric, start_date, end_date) items in one request. Items sharing a range share
+    one fused scan, nearby ranges are scanned together grouped by range, and the
+    resulting queries run in parallel. Results are keyed by item id with per-item errors.
+    """
+    if len(batch_request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    items = [
+        BatchItem(id=item.id if item.id is not None else str(i), metric=item.metric, start_date=item.start_date, end_date=item.end_date)
+        for i, item in enumerate(batch_request.items)
+    ]
+    if len({item.id for item in items}) != len(items):
+        raise HTTPException(status_code=400, detail="Item ids must be unique")
+    for item in items:
+        check_dates(item.start_date, item.end_date)
     try:
-        pricing_results = fetch_pricing_stats(start_date, end_date)
-        if pricing_results:
-            stats["pricing"] = [{"pricing_notes": r.pricing_notes, "count": r.count, "percentage": r.percentage} for r in pricing_results]
-        else:
-            stats["pricing"] = None
+        plan = plan_batch(items)
+        results, errors = await gather_metrics(plan.calls)
+        return await negotiated_response(request, {"results": collect_batch(items, plan, results, errors)})
     except Exception as e:
-        logger.exception("Error fetching pricing stats")
-        errors["pricing"] = str(e)
-        stats["pricing"] = None
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.exception("Error in post_batch endpoint")
+        raise HTTPException(status_code=500, detail=f"Error fetching batch: {str(e)}")
 
-     # Carrier end state stats
-    try:
-        carrier_end_state_results = fetch_carrier_end_state_stats(start_date, end_date)
-        if carrier_end_state_results:
-            stats["carrier_end_state"] = [{"carrier_end_state": r.carrier_end_state, "count": r.count, "percentage": r.percentage} for r in carrier_end_state_results]
-        else:
-            stats["carrier_end_state"] = None
-    except Exception as e:
-        logger.exception("Error fetching carrier end state stats")
-        errors["carrier_end_state"] = str(e)
-        stats["carrier_end_state"] = None
+@app.get("/all-stats")
+async def get_all_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None, fused: Optional[bool] = None):
+    """Get all stats aggregated with labels"""
+    import logging
+    logger = logging.getLogger(__name__)
     
-    # Percent non convertible calls stats
-    try:
-        percent_non_convertible_calls_result = fetch_percent_non_convertible_calls(start_date, end_date)
-        if percent_non_convertible_calls_result:
-            stats["percent_non_convertible_calls"] = {
-                "non_convertible_calls_count": percent_non_convertible_calls_result.non_convertible_calls_count,
-                "total_calls_count": percent_non_convertible_calls_result.total_calls_count,
-                "non_convertible_calls_percentage": percent_non_convertible_calls_result.non_convertible_calls_percentage
-            }
-        else:
-            stats["percent_non_convertible_calls"] = None
-    except Exception as e:
-        logger.exception("Error fetching percent non convertible calls stats")
-        errors["percent_non_convertible_calls"] = str(e)
-        stats["percent_non_convertible_calls"] = None
-
-    # Number of unique loads stats
-    try:
-        number_of_unique_loads_result = fetch_number_of_unique_loads(start_date, end_date)
-        if number_of_unique_loads_result:
-            stats["number_of_unique_loads"] = {
-                "number_of_unique_loads": number_of_unique_loads_result.number_of_unique_loads,
-                "total_calls": number_of_unique_loads_result.total_calls,
-                "calls_per_unique_load": number_of_unique_loads_result.calls_per_unique_load
-            }
-        else:
-            stats["number_of_unique_loads"] = None
-    except Exception as e:
-        logger.exception("Error fetching number of unique loads stats")
-        errors["number_of_unique_loads"] = str(e)
-        stats["number_of_unique_loads"] = None
+    stats = {}
+    errors = {}
 
+    use_fused = ALL_STATS_FUSED if fused is None else fused
+    # A fused result still fresh in the cache is answered with the body encoded from it last time
+    media_type, encoding = negotiate(request.headers)
+    variant = response_variant(request, media_type, encoding)
+    cache_key = fetch_all_stats_fused.cache_key(start_date, end_date)
+    if use_fused:
+        encoded = RESULT_CACHE.get_encoded(cache_key, variant)
+        if encoded is not None:
+            return encoded_response(encoded, media_type)
+
+    fused_result = None
+    if use_fused:
+        fused_result = await run_blocking(fetch_all_stats_fused, start_date, end_date)
+        if fused_result is None:
+            logger.warning("Fused all stats query failed, falling back to per-metric queries")
+
+    if fused_result is not None:
+        results = {name: getattr(fused_result, name) for name in ALL_STATS_FETCHERS}
+        fetch_errors = {}
+    else:
+        # One query per metric, run in parallel; slow metrics end up in `errors`
+        results, fetch_errors = await gather_metrics(
+            {name: (fetcher, (start_date, end_date)) for name, fetcher in ALL_STATS_FETCHERS.items()}
+        )
+
+    def fetch_metric(name):
+        if name in fetch_errors:
+            raise fetch_errors[name]
+        return results.get(name)
     
+    for name in ALL_STATS_FETCHERS:
+        try:
+            result = fetch_metric(name)
+            if name in NONE_MEANS_FAILED and result is None:
+                raise RuntimeError(f"Error fetching {name}")
+            if name == "call_stage_stats":
+                stats[name] = to_payload(result)
+            else:
+                stats[name] = to_payload(result) if result else None
+        except Exception as e:
+            logger.exception("Error fetching %s", name)
+            errors[name] = str(e)
+            stats[name] = None
+
     response = {
         "stats": stats,
         "date_range": {
@@ -453,51 +573,18 @@ async def get_all_stats(start_date: Optional[str] = None, end_date: Optional[str
     if errors:
         response["errors"] = errors
     
-    return response
+    encoded = await run_blocking(encode_body, response, media_type, encoding)
+    if fused_result is not None and not errors:
+        RESULT_CACHE.set_encoded(cache_key, fused_result, variant, encoded)
+    return encoded_response(encoded, media_type)
 
 @app.get("/calls-without-carrier-asked-for-transfer-stats")
-async def get_calls_without_carrier_asked_for_transfer_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_calls_without_carrier_asked_for_transfer_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get calls without carrier asked for transfer stats"""
     try:
-        result = fetch_calls_without_carrier_asked_for_transfer(start_date, end_date)
-        return {
-            "total_duration_no_carrier_asked_for_transfer": result.total_duration_no_carrier_asked_for_transfer / 3600,
-            "total_calls_no_carrier_asked_for_transfer": result.total_calls_no_carrier_asked_for_transfer,
-
-            "non_convertible_calls_count": result.non_convertible_calls_count,
-            "non_convertible_calls_duration": result.non_convertible_calls_duration / 3600,
-            "rate_too_high_calls_count": result.rate_too_high_calls_count,
-            "rate_too_high_calls_duration": result.rate_too_high_calls_duration / 3600,
-            "success_calls_count": result.success_calls_count,
-            "success_calls_duration": result.success_calls_duration / 3600,
-            "other_calls_count": result.other_calls_count,
-            "other_calls_duration": result.other_calls_duration / 3600,
-    
-
-            "non_convertible_calls_percentage": result.non_convertible_calls_count / result.total_calls_no_carrier_asked_for_transfer,
-            "rate_too_high_calls_percentage": result.rate_too_high_calls_count / result.total_calls_no_carrier_asked_for_transfer,
-            "success_calls_percentage": result.success_calls_count / result.total_calls_no_carrier_asked_for_transfer,
-            "other_calls_percentage": result.other_calls_count / result.total_calls_no_carrier_asked_for_transfer,
-
-            "duration_non_convertible_calls_percentage": result.non_convertible_calls_duration / result.total_duration_no_carrier_asked_for_transfer,
-            "duration_rate_too_high_calls_percentage": result.rate_too_high_calls_duration / result.total_duration_no_carrier_asked_for_transfer,
-            "duration_success_calls_percentage": result.success_calls_duration / result.total_duration_no_carrier_asked_for_transfer,
-            "duration_other_calls_percentage": result.other_calls_duration / result.total_duration_no_carrier_asked_for_transfer,
-
-            "alternate_equipment_count": result.alternate_equipment_count,
-            "caller_hung_up_no_explanation_count": result.caller_hung_up_no_explanation_count,
-            "load_not_ready_count": result.load_not_ready_count,
-            "load_past_due_count": result.load_past_due_count,
-            "covered_count": result.covered_count,
-            "carrier_not_qualified_count": result.carrier_not_qualified_count,
-            "alternate_date_or_time_count": result.alternate_date_or_time_count,
-            "user_declined_load_count": result.user_declined_load_count,
-            "checking_with_driver_count": result.checking_with_driver_count,
-            "carrier_cannot_see_reference_number_count": result.carrier_cannot_see_reference_number_count,
-            "caller_put_on_hold_assistant_hung_up_count": result.caller_put_on_hold_assistant_hung_up_count,
-
-
-        }
+        def build(result):
+            return to_payload(found(result, "calls without carrier asked for transfer stats"))
+        return await cached_response(request, fetch_calls_without_carrier_asked_for_transfer, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -506,15 +593,12 @@ async def get_calls_without_carrier_asked_for_transfer_stats(start_date: Optiona
 
 
 @app.get("/total-calls-and-total-duration-stats")
-async def get_total_calls_and_total_duration_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_total_calls_and_total_duration_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get total calls and total duration stats"""
     try:
-        result = fetch_total_calls_and_total_duration(start_date, end_date)
-        return {
-            "total_duration": result.total_duration / 3600,
-            "total_calls": result.total_calls,
-            "avg_minutes_per_call": result.avg_minutes_per_call,
-        }
+        def build(result):
+            return to_payload(found(result, "total calls and total duration stats"))
+        return await cached_response(request, fetch_total_calls_and_total_duration, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -522,13 +606,12 @@ async def get_total_calls_and_total_duration_stats(start_date: Optional[str] = N
         raise HTTPException(status_code=500, detail=f"Error fetching total calls and total duration stats: {str(e)}")
 
 @app.get("/duration-carrier-asked-for-transfer-stats")
-async def get_duration_carrier_asked_for_transfer_stats(start_date: Optional[str] = None, end_date: Optional[str] = None):
+async def get_duration_carrier_asked_for_transfer_stats(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None):
     """Get duration carrier asked for transfer stats"""
     try:
-        result = fetch_duration_carrier_asked_for_transfer(start_date, end_date)
-        return {
-            "duration_carrier_asked_for_transfer": result.duration_carrier_asked_for_transfer / 3600,
-        }
+        def build(result):
+            return to_payload(found(result, "duration carrier asked for transfer stats"))
+        return await cached_response(request, fetch_duration_carrier_asked_for_transfer, start_date, end_date, build)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
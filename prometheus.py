@@ -0,0 +1,284 @@
+# prometheus.py
+
+from __future__ import annotations
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Minimal Prometheus instrumentation (text exposition format 0.0.4) for GET /metrics:
+# counters, gauges and histograms with labels, plus gauges read from a callback at scrape
+# time for the counters the cache, aggregate store and pool already keep.
+
+# Query latencies run from milliseconds (cached days) to minutes (cold 90-day scans)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 180.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class CallbackGauge(_Metric):
+    """Gauge whose samples are read at scrape time: `fn()` returns {label values: value}."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], fn: Callable[[], Dict[LabelValues, float]]):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def collect(self) -> List[str]:
+        items = sorted(self.fn().items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [bucket counts..., sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0.0] * (len(self.buckets) + 1)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = self.header()
+        for labels, counts in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = ("le", _number(bound))
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {_number(cumulative)}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(counts[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {_number(cumulative)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---- HTTP routes --------------------------------------------------------------
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route template, method and status", ("route", "method", "status")))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Time until the response body is sent, by route template", ("route",)))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "Requests being handled, by route template", ("route",)))
+
+# ---- fetch_* metrics ----------------------------------------------------------
+
+FETCH_DURATION = REGISTRY.register(Histogram(
+    "metric_fetch_duration_seconds", "Time to compute a metric on a result-cache miss, by metric", ("metric",)))
+FETCH_IN_FLIGHT = REGISTRY.register(Gauge(
+    "metric_fetch_in_flight", "Metric computations running, by metric", ("metric",)))
+FETCH_ERRORS = REGISTRY.register(Counter(
+    "metric_fetch_errors_total", "Metric computations that raised, by metric", ("metric",)))
+
+# ---- ClickHouse queries -------------------------------------------------------
+
+QUERY_DURATION = REGISTRY.register(Histogram(
+    "clickhouse_query_duration_seconds", "Client-side ClickHouse query time, by metric", ("metric",)))
+QUERY_ERRORS = REGISTRY.register(Counter(
+    "clickhouse_query_errors_total", "ClickHouse queries that failed, by metric", ("metric",)))
+QUERY_READ_ROWS = REGISTRY.register(Counter(
+    "clickhouse_read_rows_total", "Rows read by ClickHouse (query summary), by metric", ("metric",)))
+QUERY_READ_BYTES = REGISTRY.register(Counter(
+    "clickhouse_read_bytes_total", "Bytes read by ClickHouse (query summary), by metric", ("metric",)))
+QUERY_RESULT_ROWS = REGISTRY.register(Counter(
+    "clickhouse_result_rows_total", "Rows returned by ClickHouse (query summary), by metric", ("metric",)))
+QUERY_ELAPSED = REGISTRY.register(Histogram(
+    "clickhouse_query_elapsed_seconds", "Server-side elapsed time (query summary elapsed_ns), by metric", ("metric",)))
+
+# The metric whose fetch is running in this context; ClickHouse query stats are labelled with it
+current_metric: contextvars.ContextVar[str] = contextvars.ContextVar("current_metric", default="other")
+
+
+@contextmanager
+def track_fetch(metric: str) -> Iterator[None]:
+    """Time one metric computation and label the ClickHouse queries it runs with `metric`."""
+    token = current_metric.set(metric)
+    FETCH_IN_FLIGHT.inc(metric)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        FETCH_ERRORS.inc(metric)
+        raise
+    finally:
+        FETCH_DURATION.observe(time.perf_counter() - started, metric)
+        FETCH_IN_FLIGHT.dec(metric)
+        current_metric.reset(token)
+
+
+def _summary_int(summary: Dict[str, Any], key: str) -> Optional[int]:
+    try:
+        return int(summary[key])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def observe_query(duration: float, summary: Optional[Dict[str, Any]], metric: Optional[str] = None) -> None:
+    """Record one finished ClickHouse query and the read stats from its X-ClickHouse-Summary."""
+    metric = metric or current_metric.get()
+    QUERY_DURATION.observe(duration, metric)
+    summary = summary or {}
+    for counter, key in ((QUERY_READ_ROWS, "read_rows"), (QUERY_READ_BYTES, "read_bytes"), (QUERY_RESULT_ROWS, "result_rows")):
+        value = _summary_int(summary, key)
+        if value is not None:
+            counter.inc(metric, amount=value)
+    elapsed_ns = _summary_int(summary, "elapsed_ns")
+    if elapsed_ns is not None:
+        QUERY_ELAPSED.observe(elapsed_ns / 1e9, metric)
+
+
+def observe_query_error(metric: Optional[str] = None) -> None:
+    QUERY_ERRORS.inc(metric or current_metric.get())
+
+
+def register_stats(name: str, documentation: str, label: str, stats: Callable[[], Dict[str, Any]]) -> None:
+    """Expose the numeric fields of a stats() dict as one gauge labelled by field name."""
+    def samples() -> Dict[LabelValues, float]:
+        return {(k,): float(v) for k, v in stats().items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+    REGISTRY.register(CallbackGauge(name, documentation, (label,), samples))
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """The path template of the route `scope` matches ("/metrics", "/diagnostics/call-stages"), else "unmatched"."""
+    from starlette.routing import Match
+
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware recording request count, latency (until the last body chunk is sent,
+    so streaming responses are timed in full) and in-flight requests per route template.
+    Labelled by template rather than raw path so query strings and ids cannot blow up
+    the number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = route_template(scope)
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, route)
+            HTTP_IN_FLIGHT.dec(route)
+            HTTP_REQUESTS.inc(route, scope["method"], status)
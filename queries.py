@@ -692,6 +692,7 @@ def list_of_unique_loads_query(date_filter: str, org_id: str, PEPSI_FBR_NODE_ID:
             AND s.user_number != '+19259898099'
         )
         SELECT custom_load_id FROM list_of_unique_loads_stats
+        ORDER BY custom_load_id
         """
 
 def number_of_unique_loads_query_broker_node(date_filter: str, org_id: str, PEPSI_BROKER_NODE_ID: str) -> str:
@@ -765,6 +766,7 @@ def list_of_unique_loads_query_broker_node(date_filter: str, org_id: str, PEPSI_
             AND s.user_number != '+19259898099'
         )
         SELECT custom_load_id FROM list_of_unique_loads_stats
+        ORDER BY custom_load_id
         """
 
 # def calls_without_carrier_asked_for_transfer_query(
@@ -1169,4 +1171,441 @@ def duration_carrier_asked_for_transfer_query(date_filter: str, org_id: str, PEP
         )
         SELECT duration_carrier_asked_for_transfer
         FROM duration_carrier_asked_for_transfer_stats
-    """
\ No newline at end of file
+    """
+def time_bucket_expr(column: str, bucket: str) -> str:
+    # start (a Date in the {tz:String} timezone) of the day or ISO week (Monday) holding `column`,
+    # or for bucket='range' the 1-based index of every {ranges} [start, end) pair holding it
+    # (arrayJoin repeats the row for each, so overlapping ranges are each counted in full)
+    if bucket == "day":
+        return f"toDate({column}, {{tz:String}})"
+    if bucket == "week":
+        return f"toStartOfWeek({column}, 1, {{tz:String}})"
+    if bucket == "range":
+        ranges = "{ranges:Array(Tuple(DateTime64(3, 'UTC'), DateTime64(3, 'UTC')))}"
+        return f"arrayJoin(arrayFilter(i -> {column} >= {ranges}[i].1 AND {column} < {ranges}[i].2, arrayEnumerate({ranges})))"
+    raise ValueError(f"unsupported bucket {bucket!r}")
+
+# Dimensions of all_stats_fused_query counted over sessions that are themselves in range
+SESSION_DIMENSIONS = (
+    "call_stage", "call_classification", "carrier_qualification", "pricing_notes", "carrier_end_state",
+    "load_not_found_status", "transfer_reason", "booking", "booking_total", "non_convertible",
+)
+
+def all_stats_fused_query(date_filter: str, org_id: str, PEPSI_BROKER_NODE_ID: str, PEPSI_FBR_NODE_ID: str, cutoff_date: str, by_day: bool = False, bucket: str = "") -> str:
+    # every /all-stats metric from one scan of the broker (and FBR) node outputs.
+    # Each flat_data path is extracted once per row; the ARRAY JOIN fans every row out
+    # into (dimension, value) pairs so all breakdowns are computed by a single GROUP BY.
+    # Rows whose value is '' or 'null' are dropped, which mirrors the per-metric filters.
+    # Sessions are selected as the per-metric queries do: load_status and unique_loads
+    # take every session of a run in range (load_status_stats_query, number_of_unique_loads_query),
+    # the other dimensions (SESSION_DIMENSIONS) only sessions that are themselves in range
+    # (session_in_range), so load_not_found gets its own copy of the load status breakdown
+    # (load_not_found_stats_query).
+    # With bucket='day'|'week'|'range' rows carry a `bucket` column (see time_bucket_expr), each
+    # bucket a complete result of its own, unique_loads included: a session counts only within
+    # its run's own bucket, as if the query had been run for that bucket alone.
+    # With by_day=True rows carry the run's UTC day, giving per-day partial counts that can be
+    # summed across days (runs, rows; not unique_loads). Rows of SESSION_DIMENSIONS also carry
+    # the session's UTC day (session_day, the run's day for the other dimensions) and the caller
+    # keeps the rows whose session_day is in its range, so a closed day's partial does not depend
+    # on the days fetched with it. A run is counted on the first of its session days only. Days
+    # listed in {open_days} (partial or not yet settled, never stored) take only the sessions in
+    # [{session_start}, {session_end}), the range of the request itself.
+    key = "bucket" if bucket else "day"
+    grouped = by_day or bool(bucket)
+
+    def key_expr(column: str) -> str:
+        return time_bucket_expr(column, bucket) if bucket else f"toDate({column}, 'UTC')"
+
+    session_filtered = "metric.1 IN ({})".format(", ".join(f"'{d}'" for d in SESSION_DIMENSIONS))
+    session_filter = date_filter
+    first_session_day = session_dates = session_day = ""
+    runs = "uniqExact(run_id)"
+    if by_day:
+        session_start, session_end = "{session_start:DateTime64(3, 'UTC')}", "{session_end:DateTime64(3, 'UTC')}"
+        session_filter = (
+            f"NOT has({{open_days:Array(Date)}}, toDate(rr.run_timestamp, 'UTC')) "
+            f"OR (s.timestamp >= {session_start} AND s.timestamp < {session_end})"
+        )
+        first_session_day = ",\n                minIf(toDate(s.timestamp, 'UTC'), session_in_range) OVER (PARTITION BY s.run_id) AS first_session_day"
+        session_dates = (
+            "\n                toDate(s.session_timestamp, 'UTC') AS session_date,"
+            "\n                s.first_session_day AS first_session_date,"
+        )
+        session_day = f"if({session_filtered}, session_date, day) AS session_day,"
+        runs = f"uniqExactIf(run_id, NOT {session_filtered} OR session_date = first_session_date)"
+    elif bucket in ("day", "week"):
+        session_filter = f"({date_filter}) AND {key_expr('s.timestamp')} = {key_expr('rr.run_timestamp')}"
+    # bucket='range': the bucket is only known per row of extracted, after the arrayJoin
+    range_filter = (
+        " AND s.session_timestamp >= {ranges:Array(Tuple(DateTime64(3, 'UTC'), DateTime64(3, 'UTC')))}[bucket].1"
+        " AND s.session_timestamp < {ranges:Array(Tuple(DateTime64(3, 'UTC'), DateTime64(3, 'UTC')))}[bucket].2"
+    ) if bucket == "range" else ""
+
+    day = f"{key}, " if grouped else ""
+    group = "day, session_day, " if by_day else day
+    return f"""
+        WITH recent_runs AS (
+            SELECT id AS run_id, timestamp AS run_timestamp
+            FROM public_runs
+            WHERE {date_filter}
+        ),
+        run_sessions AS (
+            SELECT
+                s.run_id AS run_id,
+                s.user_number AS user_number,
+                rr.run_timestamp AS run_timestamp,
+                s.timestamp AS session_timestamp,
+                ({session_filter}) AS session_in_range{first_session_day}
+            FROM public_sessions s
+            INNER JOIN recent_runs rr ON s.run_id = rr.run_id
+            WHERE s.org_id = '{org_id}'
+            AND s.user_number != '+19259898099'
+        ),
+        extracted AS (
+            SELECT
+                {key_expr("rr.run_timestamp")} AS {key},
+                s.run_id AS run_id,
+                s.session_in_range{range_filter} AS session_in_range,{session_dates}
+                isNotNull(s.user_number) AND s.user_number != '' AS has_user_number,
+                no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}' AS is_broker,
+                rr.run_timestamp < parseDateTime64BestEffort('{cutoff_date}') AS before_cutoff,
+                JSONExtractString(no.flat_data, 'result.call.call_stage') AS call_stage,
+                JSONExtractString(no.flat_data, 'result.call.call_classification') AS call_classification,
+                JSONExtractString(no.flat_data, 'result.transfer.transfer_reason') AS transfer_reason,
+                JSONExtractString(no.flat_data, 'result.transfer.transfer_attempt') AS transfer_attempt,
+                JSONExtractString(no.flat_data, 'result.load.load_status') AS load_status,
+                JSONExtractString(no.flat_data, 'result.load.reference_number') AS reference_number,
+                JSONExtractString(no.flat_data, 'load.custom_load_id') AS custom_load_id,
+                JSONExtractString(no.flat_data, 'result.carrier.carrier_qualification') AS carrier_qualification,
+                JSONExtractString(no.flat_data, 'result.carrier.carrier_end_state') AS carrier_end_state,
+                JSONExtractString(no.flat_data, 'result.pricing.pricing_notes') AS pricing_notes,
+                JSONExtractString(no.flat_data, 'result.pricing.agreed_upon_rate') AS agreed_upon_rate,
+                (
+                    JSONHas(no.flat_data, 'result.transfer.transfer_attempt') = 1
+                    AND JSONHas(no.flat_data, 'result.pricing.agreed_upon_rate') = 1
+                    AND JSONHas(no.flat_data, 'result.pricing.pricing_notes') = 1
+                ) AS has_booking_fields,
+                if(is_broker, reference_number, custom_load_id) AS load_id
+            FROM public_node_outputs no
+            INNER JOIN recent_runs rr ON no.run_id = rr.run_id
+            INNER JOIN public_nodes n ON no.node_id = n.id
+            INNER JOIN run_sessions s ON no.run_id = s.run_id
+            WHERE n.org_id = '{org_id}'
+              AND no.node_persistent_id IN ('{PEPSI_BROKER_NODE_ID}', '{PEPSI_FBR_NODE_ID}')
+        )
+        SELECT {group}dimension, value, runs, rows, unique_loads
+        FROM (
+            SELECT
+                {day}{session_day}
+                metric.1 AS dimension,
+                metric.2 AS value,
+                toUInt64({runs}) AS runs,
+                toUInt64(count()) AS rows,
+                toUInt64(uniqExactIf(load_id, metric.1 = 'unique_loads')) AS unique_loads
+            FROM extracted
+            ARRAY JOIN [
+                ('call_stage', if(is_broker AND session_in_range, call_stage, '')),
+                ('call_classification', if(is_broker AND session_in_range, call_classification, '')),
+                ('carrier_qualification', if(is_broker AND session_in_range, carrier_qualification, '')),
+                ('pricing_notes', if(is_broker AND session_in_range, pricing_notes, '')),
+                ('carrier_end_state', if(is_broker AND session_in_range, carrier_end_state, '')),
+                ('load_status', if(is_broker, load_status, '')),
+                ('load_not_found_status', if(is_broker AND session_in_range, load_status, '')),
+                ('transfer_reason', if(
+                    is_broker
+                    AND session_in_range
+                    AND upper(transfer_reason) != 'NO_TRANSFER_INVOLVED'
+                    AND upper(transfer_attempt) = 'YES',
+                    transfer_reason, ''
+                )),
+                ('booking', if(
+                    is_broker
+                    AND session_in_range
+                    AND has_booking_fields
+                    AND transfer_attempt = 'YES'
+                    AND agreed_upon_rate NOT IN ('', 'null')
+                    AND pricing_notes IN ('AGREEMENT_REACHED_WITH_NEGOTIATION', 'AGREEMENT_REACHED_WITHOUT_NEGOTIATION'),
+                    concat(agreed_upon_rate, '|', pricing_notes), ''
+                )),
+                ('booking_total', if(is_broker AND session_in_range AND has_booking_fields, 'all', '')),
+                ('non_convertible', if(
+                    is_broker
+                    AND session_in_range
+                    AND has_user_number
+                    AND call_classification NOT IN ('', 'null')
+                    AND (
+                        load_status IN ('COVERED', 'PAST_DUE')
+                        OR carrier_end_state IN (
+                            'CARRIER_OFFER_TOO_HIGH',
+                            'CARRIER_UNABLE_TO_MEET_PICKUP_DELIVERY_APPT',
+                            'CARRIER_UNABLE_TO_MEET_EQUIPMENT_REQ',
+                            'CARRIER_DID_NOT_WANT_LOAD'
+                        )
+                        OR call_classification = 'rate_too_high'
+                    ),
+                    'all', ''
+                )),
+                ('unique_loads', if(
+                    has_user_number
+                    AND if(is_broker, before_cutoff, NOT before_cutoff)
+                    AND load_id NOT IN ('', 'null'),
+                    'all', ''
+                ))
+            ] AS metric
+            WHERE metric.2 NOT IN ('', 'null')
+            GROUP BY {group}dimension, value
+
+            UNION ALL
+
+            -- denominator of percent_non_convertible_calls: sessions in range, whatever their run
+            SELECT
+                {f"{key_expr('timestamp')} AS {key}," if grouped else ""}{" day AS session_day," if by_day else ""}
+                'sessions' AS dimension,
+                'all' AS value,
+                toUInt64(0) AS runs,
+                toUInt64(count()) AS rows,
+                toUInt64(0) AS unique_loads
+            FROM public_sessions
+            WHERE {date_filter}
+            AND org_id = '{org_id}'
+            AND user_number != '+19259898099'
+            AND isNotNull(user_number)
+            AND user_number != ''
+            {f"GROUP BY {group.rstrip(', ')}" if grouped else ""}
+
+            UNION ALL
+
+            -- denominator of number_of_unique_loads
+            SELECT
+                {f"{key_expr('run_timestamp')} AS {key}," if grouped else ""}{" day AS session_day," if by_day else ""}
+                'unique_load_sessions' AS dimension,
+                'all' AS value,
+                toUInt64(0) AS runs,
+                toUInt64(count()) AS rows,
+                toUInt64(0) AS unique_loads
+            FROM (
+                SELECT DISTINCT run_id, user_number, run_timestamp
+                FROM run_sessions
+                WHERE isNotNull(user_number)
+                AND user_number != ''
+            )
+            {f"GROUP BY {group.rstrip(', ')}" if grouped else ""}
+        )
+        """
+
+def unique_load_states_by_day_query(date_filter: str, org_id: str, PEPSI_BROKER_NODE_ID: str, PEPSI_FBR_NODE_ID: str, cutoff_date: str, mode: str = "exact", hll_precision: int = 14) -> str:
+    # per-UTC-day distinct loads plus the day's number_of_unique_loads denominator.
+    # Broker node reference numbers count before the cutoff, FBR custom load ids from it on,
+    # as in number_of_unique_loads_query(_broker_node). `loads` holds, per mode:
+    #   exact: the cityHash64 of each id, which is enough to merge exact counts across days
+    #   ids:   the load ids themselves
+    #   hll:   the day's HyperLogLog registers as (index, rank) pairs, computed here so at most
+    #          2**hll_precision pairs per day are returned instead of every hash. The index is
+    #          the top hll_precision bits of the hash, the rank the number of trailing zeros of
+    #          the other bits plus one (see distinct_state.HyperLogLog.add_hash)
+    if mode == "hll":
+        remaining_bits = 64 - hll_precision
+        loads_by_day = f"""
+        loads_by_day AS (
+            SELECT day, groupArray((register, rank)) AS loads
+            FROM (
+                SELECT
+                    day,
+                    toUInt32(bitShiftRight(h, {remaining_bits})) AS register,
+                    max(if(
+                        rest = 0,
+                        {remaining_bits + 1},
+                        bitCount(bitAnd(bitNot(rest), rest - 1)) + 1
+                    )) AS rank
+                FROM (
+                    SELECT day, cityHash64(load_id) AS h, bitAnd(h, {(1 << remaining_bits) - 1}) AS rest
+                    FROM loads
+                    WHERE load_id NOT IN ('', 'null')
+                )
+                GROUP BY day, register
+            )
+            GROUP BY day
+        )"""
+    else:
+        load_expr = "load_id" if mode == "ids" else "cityHash64(load_id)"
+        loads_by_day = f"""
+        loads_by_day AS (
+            SELECT day, groupUniqArray({load_expr}) AS loads
+            FROM loads
+            WHERE load_id NOT IN ('', 'null')
+            GROUP BY day
+        )"""
+    return f"""
+        WITH recent_runs AS (
+            SELECT id AS run_id, timestamp AS run_timestamp
+            FROM public_runs
+            WHERE {date_filter}
+        ),
+        sessions AS (
+            SELECT DISTINCT s.run_id, s.user_number, toDate(rr.run_timestamp, 'UTC') AS day
+            FROM public_sessions s
+            INNER JOIN recent_runs rr ON s.run_id = rr.run_id
+            WHERE s.org_id = '{org_id}'
+            AND isNotNull(s.user_number)
+            AND s.user_number != ''
+            AND s.user_number != '+19259898099'
+        ),
+        loads AS (
+            SELECT
+                toDate(rr.run_timestamp, 'UTC') AS day,
+                if(
+                    no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}',
+                    JSONExtractString(no.flat_data, 'result.load.reference_number'),
+                    JSONExtractString(no.flat_data, 'load.custom_load_id')
+                ) AS load_id
+            FROM public_node_outputs no
+            INNER JOIN recent_runs rr ON no.run_id = rr.run_id
+            INNER JOIN public_nodes n ON no.node_id = n.id
+            WHERE n.org_id = '{org_id}'
+            AND no.run_id IN (SELECT run_id FROM sessions)
+            AND (
+                (no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}' AND rr.run_timestamp < parseDateTime64BestEffort('{cutoff_date}'))
+                OR (no.node_persistent_id = '{PEPSI_FBR_NODE_ID}' AND rr.run_timestamp >= parseDateTime64BestEffort('{cutoff_date}'))
+            )
+        ),{loads_by_day},
+        calls_by_day AS (
+            SELECT day, toUInt64(count()) AS total_calls
+            FROM sessions
+            GROUP BY day
+        )
+        SELECT c.day AS day, c.total_calls AS total_calls, l.loads AS loads
+        FROM calls_by_day c
+        LEFT JOIN loads_by_day l ON c.day = l.day
+        """
+
+def _unique_loads_across_cutoff_ctes(broker_filter: str, fbr_filter: str, org_id: str, PEPSI_BROKER_NODE_ID: str, PEPSI_FBR_NODE_ID: str) -> str:
+    # runs and sessions of both periods, plus the load ids of each period's node:
+    # broker node reference numbers for runs in broker_filter, FBR custom load ids for runs in fbr_filter
+    return f"""
+        WITH recent_runs AS (
+            SELECT id AS run_id, ({broker_filter}) AS in_broker_range, ({fbr_filter}) AS in_fbr_range
+            FROM public_runs
+            WHERE ({broker_filter}) OR ({fbr_filter})
+        ),
+        sessions AS (
+            SELECT DISTINCT s.run_id, s.user_number
+            FROM public_sessions s
+            INNER JOIN recent_runs rr ON s.run_id = rr.run_id
+            WHERE s.org_id = '{org_id}'
+            AND isNotNull(s.user_number)
+            AND s.user_number != ''
+            AND s.user_number != '+19259898099'
+        ),
+        loads AS (
+            SELECT JSONExtractString(no.flat_data, 'result.load.reference_number') AS load_id
+            FROM public_node_outputs no
+            INNER JOIN recent_runs rr ON no.run_id = rr.run_id
+            INNER JOIN public_nodes n ON no.node_id = n.id
+            WHERE n.org_id = '{org_id}'
+            AND no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}'
+            AND rr.in_broker_range
+            AND no.run_id IN (SELECT run_id FROM sessions)
+
+            UNION ALL
+
+            SELECT JSONExtractString(no.flat_data, 'load.custom_load_id') AS load_id
+            FROM public_node_outputs no
+            INNER JOIN recent_runs rr ON no.run_id = rr.run_id
+            INNER JOIN public_nodes n ON no.node_id = n.id
+            WHERE n.org_id = '{org_id}'
+            AND no.node_persistent_id = '{PEPSI_FBR_NODE_ID}'
+            AND rr.in_fbr_range
+            AND no.run_id IN (SELECT run_id FROM sessions)
+        )"""
+
+def number_of_unique_loads_across_cutoff_query(broker_filter: str, fbr_filter: str, org_id: str, PEPSI_BROKER_NODE_ID: str, PEPSI_FBR_NODE_ID: str) -> str:
+    # number of unique loads for a range that spans the broker node -> FBR cutoff,
+    # with the union of both periods' load ids counted inside ClickHouse
+    return _unique_loads_across_cutoff_ctes(broker_filter, fbr_filter, org_id, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID) + """,
+        number_of_unique_loads_stats AS (
+            SELECT uniqExact(load_id) AS number_of_unique_loads
+            FROM loads
+            WHERE load_id NOT IN ('', 'null')
+        ),
+        total_calls AS (
+            SELECT count() AS total_calls FROM sessions
+        )
+        SELECT
+            number_of_unique_loads,
+            total_calls,
+            ifNull(round(total_calls / nullIf(number_of_unique_loads, 0), 2), 0) AS calls_per_unique_load
+        FROM number_of_unique_loads_stats, total_calls
+        """
+
+def list_of_unique_loads_across_cutoff_query(broker_filter: str, fbr_filter: str, org_id: str, PEPSI_BROKER_NODE_ID: str, PEPSI_FBR_NODE_ID: str) -> str:
+    # list of unique loads for a range that spans the broker node -> FBR cutoff
+    return _unique_loads_across_cutoff_ctes(broker_filter, fbr_filter, org_id, PEPSI_BROKER_NODE_ID, PEPSI_FBR_NODE_ID) + """
+        SELECT DISTINCT load_id AS custom_load_id
+        FROM loads
+        WHERE load_id NOT IN ('', 'null')
+        ORDER BY custom_load_id
+        """
+
+def _sample_filter(sample_percent: int, column: str = "no.run_id") -> str:
+    # deterministic per-run sample that works without a SAMPLE BY key on the table
+    if sample_percent >= 100:
+        return "1"
+    return f"cityHash64({column}) % 100 < {int(sample_percent)}"
+
+def transfer_attempt_values_query(date_filter: str, org_id: str, PEPSI_BROKER_NODE_ID: str, sample_percent: int = 100, limit: int = 100) -> str:
+    # diagnostics: every transfer_attempt value seen on transfer rows, with counts
+    return f"""
+        WITH recent_runs AS (
+            SELECT id AS run_id
+            FROM public_runs
+            WHERE {date_filter}
+        )
+        SELECT
+            JSONExtractString(no.flat_data, 'result.transfer.transfer_attempt') AS transfer_attempt,
+            COUNT(*) AS count
+        FROM public_node_outputs no
+        INNER JOIN recent_runs rr ON no.run_id = rr.run_id
+        INNER JOIN public_nodes n ON no.node_id = n.id
+        WHERE n.org_id = '{org_id}'
+          AND no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}'
+          AND {_sample_filter(sample_percent)}
+          AND JSONHas(no.flat_data, 'result.transfer.transfer_reason') = 1
+          AND JSONExtractString(no.flat_data, 'result.transfer.transfer_reason') != ''
+          AND JSONExtractString(no.flat_data, 'result.transfer.transfer_reason') != 'null'
+        GROUP BY transfer_attempt
+        ORDER BY count DESC
+        LIMIT {int(limit)}
+        """
+
+def node_output_coverage_query(org_id: str, node_persistent_id: str, sample_percent: int = 100) -> str:
+    # diagnostics: how many outputs/runs a node has for the org, and over which dates
+    return f"""
+        SELECT
+            COUNT(*) AS total_nodes,
+            COUNT(DISTINCT no.run_id) AS unique_runs,
+            MIN(r.timestamp) AS earliest_run,
+            MAX(r.timestamp) AS latest_run
+        FROM public_node_outputs no
+        INNER JOIN public_nodes n ON no.node_id = n.id
+        INNER JOIN public_runs r ON no.run_id = r.id
+        WHERE n.org_id = '{org_id}'
+          AND no.node_persistent_id = '{node_persistent_id}'
+          AND {_sample_filter(sample_percent)}
+        """
+
+def call_stage_json_paths_query(org_id: str, PEPSI_BROKER_NODE_ID: str, limit: int = 5) -> str:
+    # diagnostics: whether call_stage is stored under the nested or the dotted JSON path
+    return f"""
+        SELECT
+            JSONHas(flat_data, 'result', 'call', 'call_stage') AS has_nested_path,
+            JSONHas(flat_data, 'result.call.call_stage')       AS has_dot_path,
+            JSONExtractString(flat_data, 'result', 'call', 'call_stage') AS nested_value,
+            JSONExtractString(flat_data, 'result.call.call_stage')       AS dot_value
+        FROM public_node_outputs no
+        INNER JOIN public_nodes n ON no.node_id = n.id
+        WHERE n.org_id = '{org_id}'
+          AND no.node_persistent_id = '{PEPSI_BROKER_NODE_ID}'
+          AND flat_data IS NOT NULL
+        LIMIT {int(limit)}
+        """
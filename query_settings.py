@@ -0,0 +1,100 @@
+# query_settings.py
+
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+# ClickHouse settings are planned per query instead of sending one profile (16 threads, 10 GB,
+# 180 s) with everything. A query gets threads in proportion to the range it scans, and the
+# thread budget is shared by the queries in flight, so an /all-stats fan-out of many metrics
+# does not ask the cluster for many times its cores. Memory and timeouts stay at the
+# CLICKHOUSE_QUERY_SETTINGS ceilings (which were raised to 10 GB / 180 s because these
+# JOIN-over-CTE queries failed below them) except for queries that are provably small: short
+# ranges of low-cardinality results. CLICKHOUSE_QUERY_SETTINGS remains the upper bound for
+# every planned value.
+
+ADAPTIVE_QUERY_SETTINGS_ENABLED = os.getenv("CLICKHOUSE_ADAPTIVE_SETTINGS", "true").lower() in ("true", "1", "yes")
+# Threads shared by all queries this process has in flight. Memory is not split the same way:
+# max_memory_usage is a per-query kill threshold, not a reservation, so a share below what the
+# query needs only makes it fail
+CLICKHOUSE_THREAD_BUDGET = int(os.getenv("CLICKHOUSE_THREAD_BUDGET", "32"))
+# Ranges up to this many days get a timeout in proportion to the range; longer ones keep the
+# CLICKHOUSE_QUERY_SETTINGS timeout
+SHORT_RANGE_DAYS = 7
+
+_GB = 1_000_000_000
+
+
+@dataclass(frozen=True)
+class QueryProfile:
+    """How a kind of query scales with the range it reads."""
+    min_threads: int
+    threads_per_week: float
+    base_timeout: float
+    timeout_per_day: float
+    # Memory for a range of at most one day, growing linearly to the ceiling at SHORT_RANGE_DAYS.
+    # None for results whose cardinality grows with loads or runs: always the ceiling
+    day_memory_bytes: Optional[int] = None
+    # GROUP BY / DISTINCT with a key per load (or per run): spill to disk past half the memory limit
+    spill_group_by: bool = False
+    # Large ORDER BY of the full result
+    spill_sort: bool = False
+
+
+QUERY_PROFILES: Dict[str, QueryProfile] = {
+    # One row of counts/sums
+    "scalar": QueryProfile(min_threads=2, threads_per_week=1, base_timeout=60, timeout_per_day=10, day_memory_bytes=2 * _GB),
+    # GROUP BY a low-cardinality dimension (call stage, load status, ...)
+    "breakdown": QueryProfile(min_threads=2, threads_per_week=1, base_timeout=60, timeout_per_day=10, day_memory_bytes=4 * _GB),
+    # uniqExact / per-day sets of load ids: state grows with the number of loads
+    "distinct": QueryProfile(min_threads=4, threads_per_week=2, base_timeout=90, timeout_per_day=10, spill_group_by=True),
+    # Every distinct load id, sorted
+    "list": QueryProfile(min_threads=4, threads_per_week=2, base_timeout=90, timeout_per_day=10,
+                         spill_group_by=True, spill_sort=True),
+    # All metrics of /all-stats in one scan
+    "fused": QueryProfile(min_threads=4, threads_per_week=2, base_timeout=90, timeout_per_day=10, spill_group_by=True),
+}
+
+
+def plan_query_settings(profile: str, range_days: float, in_flight: int, base: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Settings for one query of `profile` over `range_days` days while `in_flight` queries
+    (including this one) are running. `base` supplies the ceilings and any other settings,
+    which are passed through unchanged.
+    """
+    if not ADAPTIVE_QUERY_SETTINGS_ENABLED:
+        return dict(base)
+    p = QUERY_PROFILES[profile]
+    in_flight = max(1, in_flight)
+    range_days = max(range_days, 0.0)
+
+    max_threads = int(base.get("max_threads", 16))
+    wanted_threads = min(max_threads, p.min_threads + math.ceil(p.threads_per_week * range_days / 7))
+    threads = max(1, min(wanted_threads, CLICKHOUSE_THREAD_BUDGET // in_flight))
+
+    max_memory = int(base.get("max_memory_usage", 10 * _GB))
+    memory = max_memory
+    if p.day_memory_bytes is not None and range_days < SHORT_RANGE_DAYS:
+        extra_days = max(range_days - 1, 0.0) / (SHORT_RANGE_DAYS - 1)
+        memory = min(max_memory, int(p.day_memory_bytes + (max_memory - p.day_memory_bytes) * extra_days))
+
+    max_timeout = float(base.get("max_execution_time", 180))
+    timeout = max_timeout
+    if range_days <= SHORT_RANGE_DAYS:
+        # A query that got fewer threads than it wanted because of concurrency runs that much longer
+        timeout = min(max_timeout, (p.base_timeout + p.timeout_per_day * range_days) * wanted_threads / threads)
+
+    settings = {
+        **base,
+        "max_threads": threads,
+        "max_memory_usage": memory,
+        "max_execution_time": int(math.ceil(timeout)),
+    }
+    if p.spill_group_by:
+        settings["max_bytes_before_external_group_by"] = memory // 2
+    if p.spill_sort:
+        settings["max_bytes_before_external_sort"] = memory // 2
+    return settings
@@ -0,0 +1,89 @@
+# query_templates.py
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from dates import DEFAULT_RANGE_DAYS, parse_utc
+
+# The queries.py builders take the date filter and org_id as SQL text. A template renders a
+# builder once, at import, with typed ClickHouse parameters in their place, and every request
+# binds its values server-side. The query text is then identical across requests (parsed
+# once, eligible for the ClickHouse query cache) and request dates are never spliced into SQL.
+
+DATETIME_PARAM_TYPE = "DateTime64(3, 'UTC')"
+
+
+def datetime_param(name: str) -> str:
+    return "{" + name + ":" + DATETIME_PARAM_TYPE + "}"
+
+
+def range_filter(start: str = "start", end: str = "end") -> str:
+    return f"timestamp >= {datetime_param(start)} AND timestamp < {datetime_param(end)}"
+
+
+RANGE_FILTER = range_filter()
+# The "last 30 days" default, with the start computed client-side instead of now() so the
+# text stays deterministic (the query cache refuses queries that call now())
+SINCE_FILTER = f"timestamp >= {datetime_param('start')}"
+
+
+
+def segments_filter() -> str:
+    """
+    Filter for a set of disjoint [start, end) ranges bound as {ranges:Array(Tuple(...))}. The
+    overall {start}/{end} bounds are repeated so the primary key still prunes the scan.
+    """
+    ranges_type = f"Array(Tuple({DATETIME_PARAM_TYPE}, {DATETIME_PARAM_TYPE}))"
+    return f"{RANGE_FILTER} AND arrayExists(r -> timestamp >= r.1 AND timestamp < r.2, {{ranges:{ranges_type}}})"
+
+
+# Stand-in passed to builders as org_id; its quoted occurrences become {org_id:String}
+ORG_ID = "__org_id_parameter__"
+ORG_ID_PARAM = "{org_id:String}"
+
+
+@dataclass(frozen=True)
+class BoundQuery:
+    """Rendered template text plus the values of its server-side parameters."""
+    sql: str
+    parameters: Dict[str, Any]
+
+
+def render(builder: Callable[..., str], *args, **kwargs) -> str:
+    """Call a queries.py builder with parameter placeholders (pass ORG_ID as its org_id)."""
+    sql = builder(*args, **kwargs)
+    sql = sql.replace(f"'{ORG_ID}'", ORG_ID_PARAM)
+    if ORG_ID in sql:
+        raise ValueError(f"{builder.__name__} uses org_id outside a quoted string literal")
+    return sql
+
+
+def default_range_start(now: Optional[datetime] = None) -> datetime:
+    """Start of the default range, floored to the minute so requests share query text and cache entries."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(second=0, microsecond=0) - timedelta(days=DEFAULT_RANGE_DAYS)
+
+
+class QueryTemplate:
+    """
+    A builder with the usual (date_filter, org_id, *node_ids) signature, rendered for an
+    explicit [start, end) range and for the default last-30-days range.
+    """
+
+    def __init__(self, builder: Callable[..., str], *args, **kwargs):
+        self.name = builder.__name__
+        self.range_sql = render(builder, RANGE_FILTER, ORG_ID, *args, **kwargs)
+        self.since_sql = render(builder, SINCE_FILTER, ORG_ID, *args, **kwargs)
+
+    def bind(self, start_date: Optional[str], end_date: Optional[str], org_id: str, **parameters) -> BoundQuery:
+        if start_date and end_date:
+            return BoundQuery(self.range_sql, {
+                "start": parse_utc(start_date),
+                "end": parse_utc(end_date),
+                "org_id": org_id,
+                **parameters,
+            })
+        return BoundQuery(self.since_sql, {"start": default_range_start(), "org_id": org_id, **parameters})
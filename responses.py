@@ -0,0 +1,269 @@
+# responses.py
+
+from __future__ import annotations
+
+import dataclasses
+import os
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from cache import RESULT_CACHE
+from executor import run_blocking
+
+# brotli and msgpack ship in requirements.txt; an install without them still serves
+# gzip-compressed JSON, it just never offers `br` or MessagePack
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Response encoding:
+#   - JSON is written with orjson (dataclasses, dates and numbers natively, no intermediate
+#     jsonable_encoder pass)
+#   - MessagePack is served instead when the Accept header prefers it (and msgpack is installed)
+#   - bodies of at least RESPONSE_COMPRESSION_MIN_BYTES are compressed with brotli or gzip,
+#     whichever Accept-Encoding prefers
+#   - cached_response() keeps the encoded (and compressed) bytes next to the RESULT_CACHE
+#     entry they were built from, so a cache hit writes them out as-is
+
+RESPONSE_COMPRESSION_ENABLED = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() in ("true", "1", "yes")
+# Smaller bodies are sent uncompressed: the saving does not pay for the CPU and headers
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+# Content types worth compressing (prefix match)
+COMPRESSIBLE_MEDIA_TYPES = ("application/json", "application/x-ndjson", "application/msgpack", "text/")
+# Preference order between encodings the client accepts with the same q-value
+ENCODING_PREFERENCE = ("br", "gzip") if brotli is not None else ("gzip",)
+VARY = "Accept, Accept-Encoding"
+
+
+# ---- Encoding -----------------------------------------------------------------
+
+def _fallback(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps_json(content: Any) -> bytes:
+    return orjson.dumps(content, default=_fallback, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _msgpack_fallback(obj: Any) -> Any:
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    return _fallback(obj)
+
+
+def dumps_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_msgpack_fallback, use_bin_type=True)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; the app's default response class."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+def _parse_q(header: str) -> List[Tuple[str, float]]:
+    """`a;q=0.5, b` -> [("a", 0.5), ("b", 1.0)], lowercased."""
+    items = []
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            items.append((name.strip().lower(), q))
+    return items
+
+
+def accepted_media_type(accept: Optional[str]) -> str:
+    """MSGPACK_MEDIA_TYPE when Accept ranks a MessagePack type above JSON, else JSON."""
+    if not accept or msgpack is None:
+        return JSON_MEDIA_TYPE
+    ranked = _parse_q(accept)
+    msgpack_q = max((q for name, q in ranked if name in MSGPACK_MEDIA_TYPES), default=0.0)
+    json_q = max((q for name, q in ranked if name in (JSON_MEDIA_TYPE, "application/*", "*/*")), default=0.0)
+    return MSGPACK_MEDIA_TYPE if msgpack_q > 0 and msgpack_q > json_q else JSON_MEDIA_TYPE
+
+
+def accepted_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The preferred content coding we can produce ("br" or "gzip"), None for identity."""
+    if not accept_encoding or not RESPONSE_COMPRESSION_ENABLED:
+        return None
+    ranked = dict(_parse_q(accept_encoding))
+    wildcard = ranked.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in ENCODING_PREFERENCE:
+        q = ranked.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def negotiate(headers: Headers) -> Tuple[str, Optional[str]]:
+    """(media type, content coding) to answer a request with."""
+    return accepted_media_type(headers.get("accept")), accepted_encoding(headers.get("accept-encoding"))
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    compressor = zlib.compressobj(RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+EncodedBody = Tuple[bytes, Optional[str]]
+
+
+def encode_body(content: Any, media_type: str, encoding: Optional[str]) -> EncodedBody:
+    """(body, content coding actually applied): small bodies are left uncompressed."""
+    body = dumps_msgpack(content) if media_type == MSGPACK_MEDIA_TYPE else dumps_json(content)
+    if encoding is None or len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return body, None
+    return compress(body, encoding), encoding
+
+
+def encoded_response(encoded: EncodedBody, media_type: str, status_code: int = 200) -> Response:
+    body, encoding = encoded
+    headers = {"vary": VARY}
+    if encoding is not None:
+        headers["content-encoding"] = encoding
+    return Response(body, status_code=status_code, media_type=media_type, headers=headers)
+
+
+async def negotiated_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """`content` encoded as the request negotiates (off the event loop: bodies can be large)."""
+    media_type, encoding = negotiate(request.headers)
+    encoded = await run_blocking(encode_body, content, media_type, encoding)
+    return encoded_response(encoded, media_type, status_code)
+
+
+# ---- Cached encoded responses -------------------------------------------------
+
+def response_variant(request: Request, media_type: str, encoding: Optional[str]) -> Tuple[str, ...]:
+    """What an encoded body depends on besides the cached result: route, raw query, encoding."""
+    return (request.url.path, request.url.query, media_type, encoding or "identity")
+
+
+async def cached_response(request: Request, fetch: Callable[..., Any], start_date: Optional[str], end_date: Optional[str],
+                          build: Callable[[Any], Any]) -> Response:
+    """
+    Response for `build(fetch(start_date, end_date))` where `fetch` is a @cached_metric
+    fetch_*: while its RESULT_CACHE entry is fresh, the body encoded for this route and
+    encoding is kept on the entry and served without calling fetch or encoding again.
+    `build` may raise (HTTPException for empty results) like the inline route code it replaces.
+    """
+    media_type, encoding = negotiate(request.headers)
+    key = fetch.cache_key(start_date, end_date)
+    variant = response_variant(request, media_type, encoding)
+    encoded = RESULT_CACHE.get_encoded(key, variant)
+    if encoded is None:
+        result = await run_blocking(fetch, start_date, end_date)
+        encoded = await run_blocking(encode_body, build(result), media_type, encoding)
+        RESULT_CACHE.set_encoded(key, result, variant, encoded)
+    return encoded_response(encoded, media_type)
+
+
+# ---- Compression middleware ---------------------------------------------------
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing every other response (brotli or gzip, as negotiated) whose
+    content type is compressible: whole bodies of at least RESPONSE_COMPRESSION_MIN_BYTES,
+    and streaming bodies chunk by chunk (flushed per chunk, so NDJSON still streams).
+    Responses that already carry a Content-Encoding (cached_response) pass through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = accepted_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Dict[str, Any]] = None
+        compressor: Any = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "")
+                passthrough = "content-encoding" in headers or not media_type.startswith(COMPRESSIBLE_MEDIA_TYPES)
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < RESPONSE_COMPRESSION_MIN_BYTES:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = [(k, v) for k, v in start["headers"] if k.lower() != b"content-length"]
+                headers += [(b"content-encoding", encoding.encode()), (b"vary", VARY.encode())]
+                await send({**start, "headers": headers})
+            chunk = compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class _Compressor:
+    """Incremental brotli/gzip compressor flushed at every chunk."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=RESPONSE_BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(RESPONSE_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data) if data else b""
+            return out + (self._brotli.finish() if final else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
@@ -0,0 +1,126 @@
+# serializers.py
+
+from __future__ import annotations
+
+import dataclasses
+from operator import attrgetter
+from typing import Any, Callable, Dict, Optional
+
+from db import (
+    CallsWithoutCarrierAskedForTransferStats,
+    DurationCarrierAskedForTransferStats,
+    TotalCallsAndTotalDurationStats,
+)
+
+# Result models -> response payloads, for every route. The models are frozen, slotted
+# dataclasses, which orjson (and responses.dumps_msgpack) encode field by field in
+# declaration order, so a model whose payload is its fields as they are is returned
+# as-is: no dict is built, and cached instances are encoded in place. Only models with
+# derived fields (hours, ratios) or route-specific names get a PayloadSpec, which is
+# turned into a dict.
+
+Getter = Callable[[Any], Any]
+# Output key -> how to compute it from the model, in output order
+PayloadSpec = Dict[str, Getter]
+
+
+def attr(name: str) -> Getter:
+    return attrgetter(name)
+
+
+def hours(name: str) -> Getter:
+    """A duration field in seconds, as hours."""
+    getter = attrgetter(name)
+    return lambda obj: getter(obj) / 3600
+
+
+def ratio(part: str, total: str) -> Getter:
+    """part / total as a fraction (raises ZeroDivisionError on an empty total, as the routes always have)."""
+    part_getter, total_getter = attrgetter(part), attrgetter(total)
+    return lambda obj: part_getter(obj) / total_getter(obj)
+
+
+def fields_spec(model: type, **overrides: Getter) -> PayloadSpec:
+    """Every field of `model` under its own name, except the ones given in `overrides`."""
+    spec = {f.name: attr(f.name) for f in dataclasses.fields(model)}
+    spec.update(overrides)
+    return spec
+
+
+# Payloads that differ from the model's fields, used wherever the model is serialized
+PAYLOAD_SPECS: Dict[type, PayloadSpec] = {
+    CallsWithoutCarrierAskedForTransferStats: {
+        "total_duration_no_carrier_asked_for_transfer": hours("total_duration_no_carrier_asked_for_transfer"),
+        "total_calls_no_carrier_asked_for_transfer": attr("total_calls_no_carrier_asked_for_transfer"),
+
+        "non_convertible_calls_count": attr("non_convertible_calls_count"),
+        "non_convertible_calls_duration": hours("non_convertible_calls_duration"),
+        "rate_too_high_calls_count": attr("rate_too_high_calls_count"),
+        "rate_too_high_calls_duration": hours("rate_too_high_calls_duration"),
+        "success_calls_count": attr("success_calls_count"),
+        "success_calls_duration": hours("success_calls_duration"),
+        "other_calls_count": attr("other_calls_count"),
+        "other_calls_duration": hours("other_calls_duration"),
+
+        "non_convertible_calls_percentage": ratio("non_convertible_calls_count", "total_calls_no_carrier_asked_for_transfer"),
+        "rate_too_high_calls_percentage": ratio("rate_too_high_calls_count", "total_calls_no_carrier_asked_for_transfer"),
+        "success_calls_percentage": ratio("success_calls_count", "total_calls_no_carrier_asked_for_transfer"),
+        "other_calls_percentage": ratio("other_calls_count", "total_calls_no_carrier_asked_for_transfer"),
+
+        "duration_non_convertible_calls_percentage": ratio("non_convertible_calls_duration", "total_duration_no_carrier_asked_for_transfer"),
+        "duration_rate_too_high_calls_percentage": ratio("rate_too_high_calls_duration", "total_duration_no_carrier_asked_for_transfer"),
+        "duration_success_calls_percentage": ratio("success_calls_duration", "total_duration_no_carrier_asked_for_transfer"),
+        "duration_other_calls_percentage": ratio("other_calls_duration", "total_duration_no_carrier_asked_for_transfer"),
+
+        **{
+            name: attr(name)
+            for name in (
+                "alternate_equipment_count",
+                "caller_hung_up_no_explanation_count",
+                "load_not_ready_count",
+                "load_past_due_count",
+                "covered_count",
+                "carrier_not_qualified_count",
+                "alternate_date_or_time_count",
+                "user_declined_load_count",
+                "checking_with_driver_count",
+                "carrier_cannot_see_reference_number_count",
+                "caller_put_on_hold_assistant_hung_up_count",
+            )
+        },
+    },
+    TotalCallsAndTotalDurationStats: fields_spec(TotalCallsAndTotalDurationStats, total_duration=hours("total_duration")),
+    DurationCarrierAskedForTransferStats: fields_spec(
+        DurationCarrierAskedForTransferStats,
+        duration_carrier_asked_for_transfer=hours("duration_carrier_asked_for_transfer"),
+    ),
+}
+
+# /number-of-unique-loads-stats has always named the NumberOfUniqueLoadsStats fields
+# differently from /all-stats
+NUMBER_OF_UNIQUE_LOADS_ROUTE_SPEC: PayloadSpec = {
+    "number_of_unique_loads": attr("number_of_unique_loads"),
+    "total_calls_count": attr("total_calls"),
+    "number_of_unique_loads_percentage": attr("calls_per_unique_load"),
+}
+
+
+def _apply(spec: PayloadSpec, obj: Any) -> Dict[str, Any]:
+    return {key: getter(obj) for key, getter in spec.items()}
+
+
+def to_payload(value: Any, spec: Optional[PayloadSpec] = None) -> Any:
+    """
+    The response payload for a result: a model, a list of models, or None. `spec`
+    overrides PAYLOAD_SPECS for a route that names the fields of its model differently.
+    Models without a spec (and lists of them) are returned unchanged.
+    """
+    if value is None:
+        return None
+    if isinstance(value, list):
+        if not value:
+            return value
+        item_spec = spec or PAYLOAD_SPECS.get(type(value[0]))
+        return value if item_spec is None else [_apply(item_spec, item) for item in value]
+    spec = spec or PAYLOAD_SPECS.get(type(value))
+    return value if spec is None else _apply(spec, value)
@@ -0,0 +1,223 @@
+# snapshot_store.py
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from aggregate_store import COUNT_COLUMNS, PartialRows
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# ---- Config -------------------------------------------------------------------
+
+WEEK_SNAPSHOTS_ENABLED = os.getenv("WEEK_SNAPSHOTS_ENABLED", "true").lower() in ("true", "1", "yes")
+WEEK_SNAPSHOT_DIR = os.getenv("WEEK_SNAPSHOT_DIR", str(Path(__file__).parent / "week_snapshots"))
+# A week is sealed (snapshotted, never recomputed) once it ended this many seconds ago, which
+# leaves room for runs that are written late
+WEEK_SNAPSHOT_GRACE_SECONDS = float(os.getenv("WEEK_SNAPSHOT_GRACE_SECONDS", str(24 * 3600)))
+# Timezones whose Monday-to-Monday weeks are snapshotted (comma-separated IANA names)
+WEEK_SNAPSHOT_TIMEZONES = tuple(
+    tz.strip() for tz in os.getenv("WEEK_SNAPSHOT_TIMEZONES", "UTC").split(",") if tz.strip()
+)
+# Snapshots kept decoded in memory; they are immutable, so this only saves disk reads
+WEEK_SNAPSHOT_MEMORY_ENTRIES = int(os.getenv("WEEK_SNAPSHOT_MEMORY_ENTRIES", "512"))
+
+# Bumped whenever the fused rows change meaning (2: load_not_found_status dimension; 3: a
+# session counts only within its run's own week); snapshots of another version are ignored
+# and rewritten
+SNAPSHOT_FORMAT_VERSION = 3
+SNAPSHOT_COLUMNS = ("dimension", "value") + COUNT_COLUMNS
+
+
+# ---- Weeks --------------------------------------------------------------------
+
+def week_start_of(day: date) -> date:
+    """Monday of the ISO week holding `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def week_bounds(week_start: date, zone: ZoneInfo) -> Tuple[datetime, datetime]:
+    """[start, end) of the week beginning on local `week_start`, as naive UTC datetimes."""
+    def utc(day: date) -> datetime:
+        return datetime.combine(day, datetime.min.time(), zone).astimezone(timezone.utc).replace(tzinfo=None)
+    return utc(week_start), utc(week_start + timedelta(days=7))
+
+
+def match_week(start: datetime, end: datetime, zones: Tuple[str, ...] = WEEK_SNAPSHOT_TIMEZONES) -> Optional[Tuple[date, str]]:
+    """The (week start, timezone) whose week is exactly the UTC range [start, end), if any."""
+    for tz_name in zones:
+        zone = ZoneInfo(tz_name)
+        local = start.replace(tzinfo=timezone.utc).astimezone(zone)
+        if local.weekday() != 0 or local.time() != datetime.min.time():
+            continue
+        if week_bounds(local.date(), zone) == (start, end):
+            return local.date(), tz_name
+    return None
+
+
+# ---- Store --------------------------------------------------------------------
+
+class WeekSnapshotStore:
+    """
+    Local-disk store of the fused /all-stats rows (dimension, value, runs, rows, unique_loads)
+    of closed weeks, one gzipped JSON file per (org, timezone, week):
+
+        <root>/<org>/<timezone>/<iso year>-W<iso week>.json.gz
+
+    Rows are stored rather than the built AllStats: they are a few KB per week and rebuild
+    into exactly the /all-stats response (distinct loads are counted within the week).
+    A snapshot is written once, atomically, and is never replaced except by a forced
+    backfill or when it was written in an older SNAPSHOT_FORMAT_VERSION.
+    """
+
+    def __init__(self, root: str = WEEK_SNAPSHOT_DIR, grace_seconds: float = WEEK_SNAPSHOT_GRACE_SECONDS,
+                 memory_entries: int = WEEK_SNAPSHOT_MEMORY_ENTRIES):
+        self.root = Path(root)
+        self.grace_seconds = grace_seconds
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[Tuple[str, str, date], PartialRows]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    # ---- Paths / sealing -------------------------------------------------------
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        if re.fullmatch(r"[A-Za-z0-9_.-]{1,64}", name):
+            return name
+        # Timezones carry '/', org ids should be UUIDs; anything else is hashed
+        return name.replace("/", "__") if re.fullmatch(r"[A-Za-z0-9_./+-]{1,64}", name) else hashlib.sha1(name.encode()).hexdigest()
+
+    def path(self, org_id: str, tz_name: str, week_start: date) -> Path:
+        year, week, _ = week_start.isocalendar()
+        return self.root / self._safe(org_id) / self._safe(tz_name) / f"{year}-W{week:02d}.json.gz"
+
+    def is_sealed(self, week_start: date, tz_name: str, now: Optional[datetime] = None) -> bool:
+        """The week has ended, plus the grace period for late runs."""
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        _, end = week_bounds(week_start, ZoneInfo(tz_name))
+        return end + timedelta(seconds=self.grace_seconds) <= now
+
+    # ---- Read / write ----------------------------------------------------------
+
+    def get(self, org_id: str, tz_name: str, week_start: date) -> Optional[PartialRows]:
+        key = (org_id, tz_name, week_start)
+        with self._lock:
+            rows = self._memory.get(key)
+            if rows is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return rows
+        path = self.path(org_id, tz_name, week_start)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                doc = json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable week snapshot %s, ignoring it: %s", path, e)
+            with self._lock:
+                self.misses += 1
+            return None
+        if doc.get("version") != SNAPSHOT_FORMAT_VERSION:
+            logger.info("Week snapshot %s has format version %s, ignoring it", path, doc.get("version"))
+            with self._lock:
+                self.misses += 1
+            return None
+        columns = doc["columns"]
+        rows = [dict(zip(columns, values)) for values in doc["rows"]]
+        self._remember(key, rows)
+        with self._lock:
+            self.hits += 1
+        return rows
+
+    def put(self, org_id: str, tz_name: str, week_start: date, rows: PartialRows, force: bool = False) -> bool:
+        """
+        Persist the rows of a sealed week. Returns False (and writes nothing) when the week
+        is not sealed yet or, unless `force`, when a current snapshot already exists.
+        """
+        if not self.is_sealed(week_start, tz_name):
+            return False
+        path = self.path(org_id, tz_name, week_start)
+        if not force and self.has_current(path):
+            return False
+        start, end = week_bounds(week_start, ZoneInfo(tz_name))
+        doc = {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "org_id": org_id,
+            "timezone": tz_name,
+            "week_start": week_start.isoformat(),
+            "start_utc": start.isoformat(),
+            "end_utc": end.isoformat(),
+            "sealed_at": datetime.now(timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds"),
+            "columns": list(SNAPSHOT_COLUMNS),
+            "rows": [[r.get(c) if c in ("dimension", "value") else int(r.get(c) or 0) for c in SNAPSHOT_COLUMNS] for r in rows],
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written to a temporary file and renamed, so readers never see a partial snapshot
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".json.gz")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+                f.write(json.dumps(doc, separators=(",", ":")).encode("utf-8"))
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._remember((org_id, tz_name, week_start), [dict(zip(SNAPSHOT_COLUMNS, values)) for values in doc["rows"]])
+        with self._lock:
+            self.writes += 1
+        logger.info("Sealed week %s (%s) for org %s...", week_start, tz_name, org_id[:8])
+        return True
+
+    @staticmethod
+    def has_current(path: Path) -> bool:
+        """A readable snapshot of the current SNAPSHOT_FORMAT_VERSION exists at `path`."""
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f).get("version") == SNAPSHOT_FORMAT_VERSION
+        except (OSError, ValueError):
+            return False
+
+    def _remember(self, key: Tuple[str, str, date], rows: PartialRows) -> None:
+        with self._lock:
+            self._memory[key] = rows
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_memory": len(self._memory),
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+            }
+
+
+WEEK_SNAPSHOTS = WeekSnapshotStore()
@@ -0,0 +1,175 @@
+"""
+Shared fixtures. The `clickhouse` fixture runs the real query text against an embedded
+ClickHouse (chdb) holding a small deterministic dataset; tests using it are skipped when
+chdb is not installed.
+"""
+
+import json
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("ORG_ID", "00000000-0000-4000-8000-000000000001")
+
+ORG_ID = os.environ["ORG_ID"]
+OTHER_ORG_ID = "00000000-0000-4000-8000-000000000002"
+FIRST_DAY = date(2025, 11, 1)
+DAYS = 10
+
+SCHEMA = [
+    "CREATE TABLE public_runs (id String, timestamp DateTime64(3, 'UTC')) ENGINE = MergeTree ORDER BY (timestamp, id)",
+    """CREATE TABLE public_sessions (
+        run_id String, org_id String, user_number Nullable(String), duration Float64, timestamp DateTime64(3, 'UTC')
+    ) ENGINE = MergeTree ORDER BY (org_id, timestamp, run_id)""",
+    "CREATE TABLE public_nodes (id String, org_id String) ENGINE = MergeTree ORDER BY id",
+    """CREATE TABLE public_node_outputs (
+        run_id String, node_id String, node_persistent_id String, flat_data String
+    ) ENGINE = MergeTree ORDER BY (node_persistent_id, run_id)""",
+]
+
+CALL_STAGES = ["GREETING", "LOAD_LOOKUP", "PRICING", "TRANSFER"]
+LOAD_STATUSES = ["AVAILABLE", "COVERED", "NOT_FOUND", "PAST_DUE"]
+PRICING_NOTES = ["AGREEMENT_REACHED_WITH_NEGOTIATION", "AGREEMENT_REACHED_WITHOUT_NEGOTIATION", "NO_AGREEMENT"]
+
+
+def _dataset(seed: int = 7):
+    """
+    Runs over DAYS days with sessions up to 30 hours after their run (some runs have two),
+    so many sessions fall on another UTC day, week or range than their run.
+    """
+    import db
+
+    rng = random.Random(seed)
+    rows = {"public_runs": [], "public_sessions": [], "public_nodes": [], "public_node_outputs": []}
+    rows["public_nodes"] += [{"id": "broker", "org_id": ORG_ID}, {"id": "fbr", "org_id": ORG_ID}]
+    start = datetime.combine(FIRST_DAY, datetime.min.time())
+    for i in range(60 * DAYS):
+        run_id = f"run-{i:05d}"
+        ts = start + timedelta(seconds=rng.randrange(DAYS * 86400))
+        rows["public_runs"].append({"id": run_id, "timestamp": ts})
+        for _ in range(2 if rng.random() < 0.2 else 1):
+            lag = timedelta(minutes=rng.choice([0, 5, 45, 300, 900, 1800]))
+            rows["public_sessions"].append({
+                "run_id": run_id,
+                "org_id": OTHER_ORG_ID if rng.random() < 0.05 else ORG_ID,
+                "user_number": rng.choice(["+15550000001", "+15550000002", "+15550000003", ""]),
+                "duration": float(rng.randrange(30, 600)),
+                "timestamp": ts + lag,
+            })
+        pricing_notes = rng.choice(PRICING_NOTES)
+        flat_data = {
+            "result.call.call_stage": rng.choice(CALL_STAGES),
+            "result.call.call_classification": rng.choice(["success", "rate_too_high", "other"]),
+            "result.transfer.transfer_reason": rng.choice(["CARRIER_ASKED_FOR_TRANSFER", "BOOK_LOAD", "NO_TRANSFER_INVOLVED"]),
+            "result.transfer.transfer_attempt": rng.choice(["YES", "NO"]),
+            "result.load.load_status": rng.choice(LOAD_STATUSES),
+            "result.load.reference_number": f"LD{rng.randrange(40):03d}",
+            "result.carrier.carrier_qualification": rng.choice(["QUALIFIED", "NOT_QUALIFIED"]),
+            "result.carrier.carrier_end_state": rng.choice(["CARRIER_OFFER_TOO_HIGH", "CARRIER_BOOKED"]),
+            "result.pricing.pricing_notes": pricing_notes,
+            "result.pricing.agreed_upon_rate": str(rng.randrange(800, 2000)),
+        }
+        rows["public_node_outputs"].append({
+            "run_id": run_id,
+            "node_id": "broker",
+            "node_persistent_id": db.PEPSI_BROKER_NODE_ID,
+            "flat_data": json.dumps(flat_data),
+        })
+    return rows
+
+
+def _param(value, nested: bool = False) -> str:
+    """A query parameter value in ClickHouse text form (strings are quoted inside arrays and tuples only)."""
+    if isinstance(value, datetime):
+        text = value.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    elif isinstance(value, date):
+        text = value.isoformat()
+    elif isinstance(value, list):
+        return "[" + ", ".join(_param(v, nested=True) for v in value) + "]"
+    elif isinstance(value, tuple):
+        return "(" + ", ".join(_param(v, nested=True) for v in value) + ")"
+    else:
+        text = str(value)
+    if nested and not isinstance(value, (int, float)):
+        return "'" + text.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    return text
+
+
+def _value(value, column_type: str):
+    if value is None:
+        return None
+    if column_type.startswith("Nullable("):
+        column_type = column_type[len("Nullable("):-1]
+    if column_type == "Date":
+        return date.fromisoformat(value)
+    if column_type.startswith("DateTime"):
+        return datetime.fromisoformat(value)
+    if column_type.startswith("Array(") and isinstance(value, list):
+        return [_value(v, column_type[len("Array("):-1]) for v in value]
+    return value
+
+
+class ChdbResult:
+    def __init__(self, column_names, result_columns):
+        self.column_names = column_names
+        self.result_columns = result_columns
+        self.summary = None
+
+
+class ChdbClient:
+    """The part of the clickhouse-connect client db.py uses, over a chdb session."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def query(self, query, parameters=None, settings=None, column_oriented=False, **kwargs):
+        params = {name: _param(value) for name, value in (parameters or {}).items()}
+        out = self.session.query(query + "\nSETTINGS output_format_json_quote_64bit_integers = 0", "JSON", params=params)
+        data = json.loads(out.bytes())
+        names = [m["name"] for m in data["meta"]]
+        types = [m["type"] for m in data["meta"]]
+        columns = [[_value(r[name], t) for r in data["data"]] for name, t in zip(names, types)]
+        return ChdbResult(names, columns)
+
+    def command(self, *args, **kwargs):
+        return None
+
+    def ping(self):
+        return True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(scope="session")
+def clickhouse(tmp_path_factory):
+    """db.py wired to an embedded ClickHouse holding _dataset()."""
+    pytest.importorskip("chdb")
+    from chdb import session as chdb_session
+
+    import db
+
+    session = chdb_session.Session(str(tmp_path_factory.mktemp("chdb")))
+    for statement in SCHEMA:
+        session.query(statement)
+    for table, table_rows in _dataset().items():
+        values = ", ".join(
+            "(" + ", ".join("NULL" if v is None else _param(v, nested=True) for v in row.values()) + ")"
+            for row in table_rows
+        )
+        session.query(f"INSERT INTO {table} VALUES {values}")
+
+    get_clickhouse_client = db.get_clickhouse_client
+    db.close_client_pool()
+    db.get_clickhouse_client = lambda: ChdbClient(session)
+    db.init_client_pool()
+    yield db
+    db.close_client_pool()
+    db.get_clickhouse_client = get_clickhouse_client
+    session.close()
@@ -0,0 +1,101 @@
+from datetime import date, datetime
+
+from aggregate_store import DayAggregateStore, merge_partials, plan_days
+from cache import estimate_size
+
+NOW = datetime(2025, 11, 20, 12)
+
+
+def rows(dimension, value, runs, rows=None, unique_loads=0, session_day=None):
+    r = {"dimension": dimension, "value": value, "runs": runs, "rows": runs if rows is None else rows, "unique_loads": unique_loads}
+    if session_day is not None:
+        r["session_day"] = session_day
+    return r
+
+
+def test_plan_days_splits_at_utc_midnight():
+    segments = plan_days(datetime(2025, 11, 1, 6), datetime(2025, 11, 4), NOW)
+    assert [(s.day, s.start, s.end, s.cacheable) for s in segments] == [
+        (date(2025, 11, 1), datetime(2025, 11, 1, 6), datetime(2025, 11, 2), False),
+        (date(2025, 11, 2), datetime(2025, 11, 2), datetime(2025, 11, 3), True),
+        (date(2025, 11, 3), datetime(2025, 11, 3), datetime(2025, 11, 4), True),
+    ]
+
+
+def test_plan_days_leaves_unsettled_days_uncached():
+    segments = plan_days(datetime(2025, 11, 19), datetime(2025, 11, 20, 12), NOW, settle_seconds=3600)
+    assert [(s.day, s.cacheable) for s in segments] == [(date(2025, 11, 19), True), (date(2025, 11, 20), False)]
+    # the day ended less than settle_seconds ago
+    segments = plan_days(datetime(2025, 11, 19), datetime(2025, 11, 20), datetime(2025, 11, 20, 0, 30), settle_seconds=3600)
+    assert [s.cacheable for s in segments] == [False]
+
+
+def test_plan_days_empty_range():
+    assert plan_days(datetime(2025, 11, 2), datetime(2025, 11, 2), NOW) == []
+
+
+def test_merge_partials_sums_by_dimension_and_value():
+    merged = merge_partials([
+        [rows("call_stage", "PRICING", 2, unique_loads=1), rows("call_stage", "GREETING", 1)],
+        [rows("call_stage", "PRICING", 3, rows=4)],
+    ])
+    assert sorted(merged, key=lambda r: r["value"]) == [
+        rows("call_stage", "GREETING", 1),
+        rows("call_stage", "PRICING", 5, rows=6, unique_loads=1),
+    ]
+
+
+def test_merge_partials_keeps_only_session_days_in_range():
+    partials = [[
+        rows("call_stage", "PRICING", 2, session_day=date(2025, 11, 2)),
+        rows("call_stage", "PRICING", 1, session_day=date(2025, 11, 3)),
+        rows("load_status", "COVERED", 4),
+    ]]
+    assert merge_partials(partials, {date(2025, 11, 2)}) == [
+        rows("call_stage", "PRICING", 2),
+        rows("load_status", "COVERED", 4),
+    ]
+    assert merge_partials(partials)[0]["runs"] == 3
+
+
+def test_store_evicts_least_recently_used_day():
+    store = DayAggregateStore(max_days=2)
+    for day in (1, 2, 3):
+        if day == 3:
+            store.get("org", "node", date(2025, 11, 1))
+        store.put("org", "node", date(2025, 11, day), [rows("call_stage", "PRICING", day)])
+    assert store.get("org", "node", date(2025, 11, 1)) is not None
+    assert store.get("org", "node", date(2025, 11, 2)) is None
+    assert store.get("org", "node", date(2025, 11, 3)) is not None
+    assert store.stats()["evictions"] == 1
+
+
+def test_store_evicts_by_bytes_and_skips_oversized_days():
+    def day_rows(n=1):
+        return [rows("call_stage", f"STAGE_{i}", 1) for i in range(n)]
+
+    size = estimate_size(day_rows())
+    store = DayAggregateStore(max_bytes=2 * size)
+    for day in (1, 2, 3):
+        store.put("org", "node", date(2025, 11, day), day_rows())
+    assert store.stats()["days"] == 2
+    assert store.stats()["bytes"] <= 2 * size
+    assert store.get("org", "node", date(2025, 11, 1)) is None
+
+    store.put("org", "node", date(2025, 11, 4), day_rows(10))
+    assert store.get("org", "node", date(2025, 11, 4)) is None
+    assert store.stats()["days"] == 2
+
+
+def test_load_fetches_only_missing_days_and_stores_closed_ones():
+    store = DayAggregateStore()
+    fetched = []
+
+    def fetch_days(segments):
+        fetched.append([s.day for s in segments])
+        return {s.day: [rows("call_stage", "PRICING", 1)] for s in segments}
+
+    start, end = datetime(2025, 11, 1), datetime(2025, 11, 3, 12)
+    assert store.load("org", "node", start, end, fetch_days, now=NOW) == [rows("call_stage", "PRICING", 3)]
+    assert store.load("org", "node", start, end, fetch_days, now=NOW) == [rows("call_stage", "PRICING", 3)]
+    assert fetched == [[date(2025, 11, 1), date(2025, 11, 2), date(2025, 11, 3)], [date(2025, 11, 3)]]
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+import batch
+from batch import BATCH_MAX_GAP_DAYS, group_ranges
+
+DAY = timedelta(days=1)
+START = datetime(2025, 11, 1)
+
+
+def test_group_ranges_joins_ranges_within_the_gap_in_start_order():
+    ranges = [
+        (START + 10 * DAY, START + 17 * DAY),
+        (START, START + 7 * DAY),
+        (START + 7 * DAY + BATCH_MAX_GAP_DAYS * DAY, START + 20 * DAY),
+    ]
+    assert group_ranges(ranges) == [[1, 0, 2]]
+
+
+def test_group_ranges_splits_far_apart_ranges():
+    ranges = [
+        (START, START + 7 * DAY),
+        (START + 7 * DAY + (BATCH_MAX_GAP_DAYS + 1) * DAY, START + 30 * DAY),
+    ]
+    assert group_ranges(ranges) == [[0], [1]]
+
+
+def test_group_ranges_gap_is_measured_from_the_group_end():
+    # the second range ends after the third starts, so the third joins despite its gap to the second's start
+    ranges = [
+        (START, START + DAY),
+        (START + DAY, START + 30 * DAY),
+        (START + 20 * DAY, START + 21 * DAY),
+    ]
+    assert group_ranges(ranges) == [[0, 1, 2]]
+
+
+def test_group_ranges_caps_ranges_per_scan(monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_MAX_RANGES_PER_SCAN", 2)
+    ranges = [(START + i * DAY, START + (i + 1) * DAY) for i in range(5)]
+    assert group_ranges(ranges) == [[0, 1], [2, 3], [4]]
+
+
+def test_group_ranges_empty():
+    assert group_ranges([]) == []
@@ -0,0 +1,52 @@
+import random
+from datetime import datetime
+
+from aggregate_store import plan_days
+from conftest import ORG_ID
+from distinct_state import HyperLogLog, UniqueLoadsState, merge_states
+
+PRECISION = 14
+
+
+def test_hll_estimates_within_a_few_percent():
+    rng = random.Random(1)
+    hashes = [rng.getrandbits(64) for _ in range(50_000)]
+    estimate = HyperLogLog.from_hashes(hashes, PRECISION).count()
+    assert abs(estimate - len(hashes)) / len(hashes) < 0.03
+    assert HyperLogLog.from_hashes(hashes[:100], PRECISION).count() in range(98, 103)
+
+
+def test_hll_rank_of_a_hash_without_low_bits():
+    sketch = HyperLogLog(PRECISION)
+    sketch.add_hash(5 << (64 - PRECISION))
+    assert sketch.registers[5] == 64 - PRECISION + 1
+
+
+def test_hll_merge_matches_sketch_of_the_union():
+    rng = random.Random(2)
+    a, b = [rng.getrandbits(64) for _ in range(3000)], [rng.getrandbits(64) for _ in range(3000)]
+    merged = merge_states(
+        [UniqueLoadsState(HyperLogLog.from_hashes(a, PRECISION)), UniqueLoadsState(HyperLogLog.from_hashes(b, PRECISION))],
+        "hll",
+    )
+    assert merged.loads.registers == HyperLogLog.from_hashes(a + b, PRECISION).registers
+
+
+def test_exact_merge_unions_loads_and_sums_calls():
+    merged = merge_states([UniqueLoadsState(frozenset({1, 2}), 3), UniqueLoadsState(frozenset({2, 3}), 4)])
+    assert merged == UniqueLoadsState(frozenset({1, 2, 3}), 7)
+    assert merged.number_of_unique_loads == 3
+
+
+def test_clickhouse_registers_match_add_hash(clickhouse):
+    # "hll" states are built from (register, rank) pairs computed by ClickHouse; they must be the
+    # sketch add_hash builds from the same day's cityHash64 values ("exact" states)
+    db = clickhouse
+    segments = plan_days(datetime(2025, 11, 1), datetime(2025, 11, 11), datetime(2026, 1, 1))
+    exact = db._fetch_unique_load_states_by_day(ORG_ID, segments, "exact")
+    hll = db._fetch_unique_load_states_by_day(ORG_ID, segments, "hll")
+    assert exact and exact.keys() == hll.keys()
+    for day, state in exact.items():
+        expected = HyperLogLog.from_hashes(state.loads, hll[day].loads.precision)
+        assert hll[day].loads.registers == expected.registers, day
+        assert hll[day].total_calls == state.total_calls
@@ -0,0 +1,105 @@
+"""
+all_stats_fused_query counts a session only where the range (or bucket) holding its run also
+holds the session; these tests compare each way of splitting a range against the one-shot query.
+"""
+
+from dataclasses import asdict
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from aggregate_store import merge_partials, plan_days
+from cache import RESULT_CACHE
+from conftest import FIRST_DAY, ORG_ID
+from snapshot_store import WeekSnapshotStore, week_bounds
+
+NOW = datetime(2026, 1, 1)
+
+
+def comparable(stats):
+    """AllStats as a dict, breakdowns sorted (ties are listed in any order), without number_of_unique_loads,
+    which the incremental path computes from distinct-load states rather than from these rows."""
+    sections = asdict(stats)
+    sections.pop("number_of_unique_loads")
+    return {name: sorted(map(str, value)) if isinstance(value, list) else value for name, value in sections.items()}
+
+
+def utc_naive(local: datetime) -> datetime:
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def one_shot(db, start, end):
+    query = db.ALL_STATS_FUSED_TEMPLATE.bind(start.isoformat(), end.isoformat(), ORG_ID)
+    return db._build_all_stats(db._json_each_row(db.get_client_pool(), query))
+
+
+def test_day_partials_fetched_day_by_day_match_one_shot(clickhouse):
+    db = clickhouse
+    start, end = datetime(2025, 11, 2), datetime(2025, 11, 8)
+    segments = plan_days(start, end, NOW)
+    days = {seg.day for seg in segments}
+
+    together = db._fetch_all_stats_rows_by_day(ORG_ID, segments, start, end)
+    day_by_day = {}
+    for seg in segments:
+        day_by_day.update(db._fetch_all_stats_rows_by_day(ORG_ID, [seg], start, end))
+
+    expected = comparable(one_shot(db, start, end))
+    assert comparable(db._build_all_stats(merge_partials(together.values(), days))) == expected
+    assert comparable(db._build_all_stats(merge_partials(day_by_day.values(), days))) == expected
+
+
+def test_open_day_partial_matches_one_shot(clickhouse):
+    db = clickhouse
+    start, end = datetime(2025, 11, 3, 6), datetime(2025, 11, 3, 18, 30)
+    segments = plan_days(start, end, NOW)
+    assert not any(seg.cacheable for seg in segments)
+
+    rows = db._fetch_all_stats_rows_by_day(ORG_ID, segments, start, end)
+    merged = merge_partials(rows.values(), {seg.day for seg in segments})
+    assert comparable(db._build_all_stats(merged)) == comparable(one_shot(db, start, end))
+
+
+@pytest.mark.parametrize("bucket, tz_name", [("day", "UTC"), ("day", "America/New_York"), ("week", "UTC"), ("week", "Europe/Berlin")])
+def test_timeseries_buckets_match_one_shot(clickhouse, monkeypatch, bucket, tz_name):
+    db = clickhouse
+    monkeypatch.setattr(db, "WEEK_SNAPSHOTS_ENABLED", False)
+    RESULT_CACHE.clear()
+    start, end = datetime(2025, 11, 1), datetime(2025, 11, 11)
+    zone, step = ZoneInfo(tz_name), timedelta(days=1) if bucket == "day" else timedelta(weeks=1)
+
+    buckets = db.fetch_all_stats_timeseries(bucket, tz_name, start.isoformat(), end.isoformat())
+    assert buckets
+    for b in buckets:
+        local_start = datetime.fromisoformat(b.start).replace(tzinfo=zone)
+        bucket_start = max(start, utc_naive(local_start))
+        bucket_end = min(end, utc_naive(local_start + step))
+        assert comparable(b.stats) == comparable(one_shot(db, bucket_start, bucket_end)), b.start
+
+
+def test_backfilled_week_snapshots_match_one_shot(clickhouse, monkeypatch, tmp_path):
+    db = clickhouse
+    monkeypatch.setattr(db, "WEEK_SNAPSHOTS", WeekSnapshotStore(str(tmp_path)))
+    weeks = (datetime.now().date() - FIRST_DAY).days // 7 + 2
+    written = db.backfill_week_snapshots("UTC", weeks)
+
+    for week_start in (date(2025, 10, 27), date(2025, 11, 3), date(2025, 11, 10)):
+        assert week_start in written
+        start, end = week_bounds(week_start, ZoneInfo("UTC"))
+        rows = db.WEEK_SNAPSHOTS.get(ORG_ID, "UTC", week_start)
+        assert comparable(db._build_all_stats(rows)) == comparable(one_shot(db, start, end)), week_start
+
+
+def test_multi_range_matches_one_shot_per_range(clickhouse):
+    db = clickhouse
+    RESULT_CACHE.clear()
+    ranges = (
+        (datetime(2025, 11, 1), datetime(2025, 11, 4)),
+        (datetime(2025, 11, 3, 12), datetime(2025, 11, 8)),
+        (datetime(2025, 11, 8), datetime(2025, 11, 10)),
+    )
+    results = db.fetch_all_stats_multi_range(tuple((start.isoformat(), end.isoformat()) for start, end in ranges))
+    assert len(results) == len(ranges)
+    for (start, end), stats in zip(ranges, results):
+        assert comparable(stats) == comparable(one_shot(db, start, end)), (start, end)
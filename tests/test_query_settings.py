@@ -0,0 +1,41 @@
+import query_settings
+from query_settings import CLICKHOUSE_THREAD_BUDGET, QUERY_PROFILES, plan_query_settings
+
+BASE = {"max_threads": 16, "max_memory_usage": 10_000_000_000, "max_execution_time": 180, "readonly": 1}
+
+
+def test_threads_grow_with_range_up_to_max_threads():
+    threads = [plan_query_settings("breakdown", days, 1, BASE)["max_threads"] for days in (1, 7, 30, 365)]
+    assert threads == sorted(threads)
+    assert threads[0] == QUERY_PROFILES["breakdown"].min_threads + 1
+    assert threads[-1] == BASE["max_threads"]
+
+
+def test_thread_budget_is_shared_by_queries_in_flight():
+    in_flight = CLICKHOUSE_THREAD_BUDGET // 2
+    settings = plan_query_settings("fused", 365, in_flight, BASE)
+    assert settings["max_threads"] == CLICKHOUSE_THREAD_BUDGET // in_flight
+    assert plan_query_settings("fused", 365, 10 * CLICKHOUSE_THREAD_BUDGET, BASE)["max_threads"] == 1
+
+
+def test_short_breakdowns_get_less_memory_and_time():
+    one_day = plan_query_settings("breakdown", 1, 1, BASE)
+    assert one_day["max_memory_usage"] == QUERY_PROFILES["breakdown"].day_memory_bytes
+    assert one_day["max_execution_time"] < BASE["max_execution_time"]
+    long_range = plan_query_settings("breakdown", 30, 1, BASE)
+    assert long_range["max_memory_usage"] == BASE["max_memory_usage"]
+    assert long_range["max_execution_time"] == BASE["max_execution_time"]
+
+
+def test_distinct_profiles_keep_the_memory_ceiling_and_spill():
+    settings = plan_query_settings("list", 1, 1, BASE)
+    assert settings["max_memory_usage"] == BASE["max_memory_usage"]
+    assert settings["max_bytes_before_external_group_by"] == BASE["max_memory_usage"] // 2
+    assert settings["max_bytes_before_external_sort"] == BASE["max_memory_usage"] // 2
+    assert "max_bytes_before_external_sort" not in plan_query_settings("fused", 1, 1, BASE)
+
+
+def test_other_settings_pass_through_and_disabling_returns_base(monkeypatch):
+    assert plan_query_settings("scalar", 3, 2, BASE)["readonly"] == 1
+    monkeypatch.setattr(query_settings, "ADAPTIVE_QUERY_SETTINGS_ENABLED", False)
+    assert plan_query_settings("scalar", 3, 2, BASE) == BASE
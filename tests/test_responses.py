@@ -0,0 +1,24 @@
+from starlette.datastructures import Headers
+
+from responses import ENCODING_PREFERENCE, JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, _parse_q, negotiate
+
+
+def test_parse_q():
+    assert _parse_q("Application/MsgPack;q=0.5, application/json") == [("application/msgpack", 0.5), ("application/json", 1.0)]
+    assert _parse_q("gzip;level=1;q=0.2, br;q=oops, ") == [("gzip", 0.2), ("br", 0.0)]
+
+
+def test_negotiate_media_type():
+    assert negotiate(Headers({})) == (JSON_MEDIA_TYPE, None)
+    assert negotiate(Headers({"accept": "application/x-msgpack"}))[0] == MSGPACK_MEDIA_TYPE
+    assert negotiate(Headers({"accept": "application/msgpack;q=0.9, application/json"}))[0] == JSON_MEDIA_TYPE
+    assert negotiate(Headers({"accept": "application/msgpack, */*;q=0.1"}))[0] == MSGPACK_MEDIA_TYPE
+    assert negotiate(Headers({"accept": "application/msgpack;q=0, */*"}))[0] == JSON_MEDIA_TYPE
+
+
+def test_negotiate_encoding():
+    assert negotiate(Headers({"accept-encoding": "gzip, br"}))[1] == ENCODING_PREFERENCE[0]
+    assert negotiate(Headers({"accept-encoding": "gzip;q=1, br;q=0.5"}))[1] == "gzip"
+    assert negotiate(Headers({"accept-encoding": "*"}))[1] == ENCODING_PREFERENCE[0]
+    assert negotiate(Headers({"accept-encoding": "gzip;q=0, *"}))[1] == ("br" if "br" in ENCODING_PREFERENCE else None)
+    assert negotiate(Headers({"accept-encoding": "identity"}))[1] is None
@@ -0,0 +1,40 @@
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from snapshot_store import match_week, week_bounds
+
+NEW_YORK = ZoneInfo("America/New_York")
+BERLIN = ZoneInfo("Europe/Berlin")
+
+
+def test_week_bounds_in_utc():
+    assert week_bounds(date(2025, 11, 3), ZoneInfo("UTC")) == (datetime(2025, 11, 3), datetime(2025, 11, 10))
+
+
+def test_week_bounds_across_dst_end():
+    # New York leaves DST on Sunday 2025-11-02: that week is 169 hours long
+    start, end = week_bounds(date(2025, 10, 27), NEW_YORK)
+    assert (start, end) == (datetime(2025, 10, 27, 4), datetime(2025, 11, 3, 5))
+    assert end - start == timedelta(hours=169)
+
+
+def test_week_bounds_across_dst_start():
+    # Berlin enters DST on Sunday 2025-03-30: that week is 167 hours long
+    start, end = week_bounds(date(2025, 3, 24), BERLIN)
+    assert (start, end) == (datetime(2025, 3, 23, 23), datetime(2025, 3, 30, 22))
+    assert end - start == timedelta(hours=167)
+
+
+def test_match_week_across_dst():
+    zones = ("UTC", "America/New_York")
+    assert match_week(datetime(2025, 10, 27, 4), datetime(2025, 11, 3, 5), zones) == (date(2025, 10, 27), "America/New_York")
+    # the same start with a plain 7 * 24 hours is not a week in New York
+    assert match_week(datetime(2025, 10, 27, 4), datetime(2025, 11, 3, 4), zones) is None
+    assert match_week(datetime(2025, 11, 3, 5), datetime(2025, 11, 10, 5), zones) == (date(2025, 11, 3), "America/New_York")
+
+
+def test_match_week_rejects_other_ranges():
+    assert match_week(datetime(2025, 11, 3), datetime(2025, 11, 10), ("UTC",)) == (date(2025, 11, 3), "UTC")
+    assert match_week(datetime(2025, 11, 4), datetime(2025, 11, 11), ("UTC",)) is None
+    assert match_week(datetime(2025, 11, 3), datetime(2025, 11, 17), ("UTC",)) is None
+    assert match_week(datetime(2025, 11, 3), datetime(2025, 11, 10), ("Europe/Berlin",)) is None
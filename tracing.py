@@ -0,0 +1,231 @@
+# tracing.py
+
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Request tracing: one span per HTTP request, per fetch_* call and per ClickHouse query,
+# linked by trace/parent ids. Every ClickHouse query is sent with
+# query_id = "<request id>-<span id>", so system.query_log rows join back to the request:
+#
+#   SELECT query_id, query_duration_ms, read_rows, memory_usage
+#   FROM system.query_log
+#   WHERE type = 'QueryFinish' AND query_id LIKE '<request id>-%'
+#
+# Finished spans are exported as OTLP/JSON (the format of the OpenTelemetry collector's
+# otlpjsonfile receiver and file exporter), one ExportTraceServiceRequest per line:
+#   TRACING_EXPORTER=none     spans are only used for query ids (default)
+#   TRACING_EXPORTER=console  one compact log line per span
+#   TRACING_EXPORTER=file     appended to TRACING_FILE
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "pepsi-weekly-analytics")
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+# An incoming X-Request-ID is reused when it is safe to embed in a ClickHouse query_id
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+# W3C trace context: version-traceid-parentid-flags
+_TRACEPARENT_RE = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "request_id",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, kind: int, trace_id: str, parent_id: Optional[str], request_id: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.request_id = request_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def query_id(self) -> str:
+        """ClickHouse query_id for a query run under this span."""
+        return f"{self.request_id}-{self.span_id}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span: Dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+# ---- Export -------------------------------------------------------------------
+
+_export_lock = threading.Lock()
+_export_file = None
+
+
+def _export(span: Span) -> None:
+    global _export_file
+    if TRACING_EXPORTER == "console":
+        duration_ms = (span.end_ns - span.start_ns) / 1e6
+        logger.info("span %s trace=%s span=%s parent=%s %.1fms%s %s", span.name, span.trace_id, span.span_id,
+                    span.parent_id or "-", duration_ms, f" error={span.error}" if span.error else "", span.attributes)
+        return
+    if TRACING_EXPORTER != "file":
+        return
+    line = json.dumps({
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", TRACING_SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp()]}],
+        }]
+    }, separators=(",", ":"))
+    try:
+        with _export_lock:
+            if _export_file is None:
+                _export_file = open(TRACING_FILE, "a", buffering=1, encoding="utf-8")
+            _export_file.write(line + "\n")
+    except OSError as e:
+        logger.warning("Could not write span to %s: %s", TRACING_FILE, e)
+
+
+# ---- Spans --------------------------------------------------------------------
+
+current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def child_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Span:
+    """
+    A child of the current span that is not made current; for work that cannot hold a
+    context manager open, like a generator resumed from different threads. Close it with
+    end_span().
+    """
+    parent = current_span.get()
+    if parent is None:
+        trace_id = secrets.token_hex(16)
+        return Span(name, kind, trace_id, None, trace_id, attributes)
+    return Span(name, kind, parent.trace_id, parent.span_id, parent.request_id, attributes)
+
+
+def end_span(span: Span, error: Optional[BaseException] = None) -> None:
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    span.end_ns = time.time_ns()
+    _export(span)
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, *, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+               request_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Open a span as a child of the current one (or a new trace) and make it current for the
+    block. Executor work submitted through run_blocking / fan_out inherits it, since both
+    copy the caller's contextvars.
+    """
+    parent = current_span.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        parent_id = parent.span_id if parent else None
+    if request_id is None:
+        request_id = parent.request_id if parent else trace_id
+    span = Span(name, kind, trace_id, parent_id, request_id, attributes)
+    token = current_span.set(span)
+    error: Optional[BaseException] = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        current_span.reset(token)
+        end_span(span, error)
+
+
+def query_settings_with_id(span: Span, settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """`settings` plus the span's query_id (sent by clickhouse-connect as the query_id URL parameter)."""
+    return {**(settings or {}), "query_id": span.query_id}
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of every HTTP request. The trace continues an
+    incoming W3C `traceparent`; the request id is the incoming X-Request-ID (when usable in
+    a query_id) or the trace id, and is returned in the X-Request-ID response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        from prometheus import route_template
+
+        route = route_template(scope)
+        trace_id = parent_id = None
+        match = _TRACEPARENT_RE.match(_header(scope, b"traceparent") or "")
+        if match:
+            trace_id, parent_id = match.group(1), match.group(2)
+        else:
+            trace_id = secrets.token_hex(16)
+        incoming_id = _header(scope, b"x-request-id")
+        request_id = incoming_id if incoming_id and _REQUEST_ID_RE.match(incoming_id) else trace_id
+
+        with start_span(f"{scope['method']} {route}", SPAN_KIND_SERVER, trace_id=trace_id, parent_id=parent_id,
+                        request_id=request_id, **{"http.method": scope["method"], "http.route": route,
+                                                  "http.target": scope.get("path"), "request.id": request_id}) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    headers: List[Any] = list(message.get("headers", []))
+                    headers.append((b"x-request-id", request_id.encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
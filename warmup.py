@@ -0,0 +1,113 @@
+# warmup.py
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import db
+from executor import MetricCalls, gather_metrics, run_blocking
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Startup warm-up, run in the background once the app starts:
+#   1. open the client pool's connections and run a trivial query on each
+#   2. check ClickHouse has the tables the service reads
+#   3. prefill the result cache with the default "last 30 days" view of every cached metric
+# GET /ready answers 503 until it has finished, so a rolling deploy only routes traffic to
+# an instance whose connections and caches are warm. A failed connection or table check
+# is retried; failed prefills are logged and do not hold readiness back.
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() in ("true", "1", "yes")
+WARMUP_PREFILL = os.getenv("WARMUP_PREFILL", "true").lower() in ("true", "1", "yes")
+# Deadline for each prefilled metric; one stuck query must not keep the instance unready
+WARMUP_PREFILL_TIMEOUT_SECONDS = float(os.getenv("WARMUP_PREFILL_TIMEOUT_SECONDS", "120"))
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+
+class Readiness:
+    """Warm-up progress as reported by /ready."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phase = "starting"
+        self.ready = False
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+        self.connections = 0
+        self.prefilled: Dict[str, bool] = {}
+
+    def update(self, **values: Any) -> None:
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.finished_at or time.time()
+            return {
+                "status": "ready" if self.ready else self.phase,
+                "warmup_seconds": round(finished - self.started_at, 3),
+                "attempts": self.attempts,
+                "connections": self.connections,
+                "prefilled": sum(self.prefilled.values()),
+                "prefill_failed": sorted(name for name, ok in self.prefilled.items() if not ok),
+                "last_error": self.last_error,
+            }
+
+
+READINESS = Readiness()
+
+
+def cached_metric_fetchers() -> MetricCalls:
+    """Every @cached_metric fetch_* in db, called with no dates (the default view)."""
+    return {
+        name: (fn, ())
+        for name, fn in vars(db).items()
+        if name.startswith("fetch_") and callable(getattr(fn, "uncached", None))
+    }
+
+
+def _connect() -> int:
+    pool = db.init_client_pool()
+    connections = pool.warm(validate=lambda client: client.query("SELECT 1"))
+    db.check_tables(pool)
+    return connections
+
+
+async def warm_up(readiness: Readiness = READINESS) -> None:
+    if not WARMUP_ENABLED:
+        readiness.update(ready=True, phase="ready", finished_at=time.time())
+        return
+
+    while True:
+        readiness.update(phase="connecting", attempts=readiness.attempts + 1)
+        try:
+            readiness.update(connections=await run_blocking(_connect), last_error=None)
+            break
+        except Exception as e:
+            logger.warning("Warm-up: ClickHouse not usable yet (%s), retrying in %gs", e, WARMUP_RETRY_SECONDS)
+            readiness.update(last_error=str(e))
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+
+    if WARMUP_PREFILL:
+        readiness.update(phase="prefilling")
+        calls = cached_metric_fetchers()
+        started = time.monotonic()
+        results, errors = await gather_metrics(calls, timeout=WARMUP_PREFILL_TIMEOUT_SECONDS)
+        # The fetchers return None instead of raising on query errors
+        prefilled = {name: name not in errors and results.get(name) is not None for name in calls}
+        for name, error in errors.items():
+            logger.warning("Warm-up: prefilling %s failed: %s", name, error)
+        logger.info("Warm-up: prefilled %d/%d metrics in %.1fs", sum(prefilled.values()), len(calls), time.monotonic() - started)
+        readiness.update(prefilled=prefilled)
+
+    readiness.update(ready=True, phase="ready", finished_at=time.time())
+    logger.info("Warm-up finished, instance is ready")